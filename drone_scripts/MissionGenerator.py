@@ -6,11 +6,16 @@ Python Version: 2.7
 missionGenerator creates a series of points (North, East, Altitude) in
 meters from a user provider dictionary. The output is a JSON string that can be
 used in XX for generating flight patterns.
+
+Besides the box, circle and triangle shapes, the 'coverage' shape sweeps an
+arbitrary polygon with a sensor footprint (see coverage_planner.py), and
+createCoverageMissions splits that sweep across several drones.
 """
 
 import json
 import numpy as np
 import math
+import coverage_planner
 
 class MissionGenerator:
     def __init__(self): # Nothing to initialize right now...
@@ -32,29 +37,39 @@ class MissionGenerator:
             c3 = np.array([N_max, W_max, altitude]) # NW
             c4 = np.array([N_max,     0, altitude]) # NE
         
-            path = np.vstack((c1, c2))
-            
-            # If filled, set 1 m step, starting at home position 
+            # If filled, sweep back and forth in 1 m steps, starting at home
+            # position. Each 2 m of height adds one west leg, a 1 m step north
+            # and one east leg, so all the legs are laid out at once instead
+            # of growing the path a few points at a time.
+            reaches_top = False
             if (dict_In['filled']):
                 if (N_max > 0):
-                    N_steps = range(2, N_max, 2)
+                    N_steps = np.arange(2, N_max, 2)
                 else:
-                    N_steps = range(N_max, -2, 2)           
+                    N_steps = np.arange(N_max, -2, 2)
                 N_inc = math.copysign(stepSize, N_max)
-            
-                for N_i in N_steps:
-                    if (N_i == N_max):
-                        path = np.vstack((path, c3, c4))
-                        break
-                    
-                    path = np.vstack((path, np.array([N_i - N_inc, W_max, altitude]), 
-                        np.array([N_i - N_inc,     0, altitude]), 
-                        np.array([    N_i,     0, altitude]), 
-                        np.array([    N_i, W_max, altitude])))
-        
+
+                # Sweeps stop at the first step that lands on the top edge of
+                # the box, which then gets closed off with c3 and c4
+                at_top = (N_steps == N_max)
+                if (at_top.any()):
+                    reaches_top = True
+                    N_steps = N_steps[:np.argmax(at_top)]
+
+                legs = np.empty((len(N_steps), 4, 3))
+                legs[:, :, 2] = altitude
+                legs[:, 0:2, 0] = (N_steps - N_inc)[:, np.newaxis]
+                legs[:, 2:4, 0] = N_steps[:, np.newaxis]
+                legs[:, (0, 3), 1] = W_max
+                legs[:, (1, 2), 1] = 0
+                path = np.vstack((c1, c2, legs.reshape(-1, 3)))
             else:
-                 path = np.vstack((path, c3, c4))
-                 
+                reaches_top = True
+                path = np.vstack((c1, c2))
+
+            if (reaches_top):
+                path = np.vstack((path, c3, c4))
+
             # Rotate using rotation matrix
             matrix_Rotation = np.matrix([[ math.cos(-rotation), -math.sin(-rotation), 0], 
                                           [math.sin(-rotation),  math.cos(-rotation), 0], 
@@ -71,15 +86,18 @@ class MissionGenerator:
             altitude = dict_In['altitude']
             stepSize_m = 2
 
-            num_Points = math.floor(2*R*math.pi / stepSize_m)
+            num_Points = int(math.floor(2*R*math.pi / stepSize_m))
             
             stepSize_rad = 2*math.pi / num_Points
             
-            path = [0, R, altitude]         
-            
-            for angle_rad in np.linspace(stepSize_rad, 2*math.pi, num_Points):
-                path = np.vstack((path, 
-                    [R*math.sin(angle_rad), R*math.cos(angle_rad), altitude]))
+            # Start due north of the center and go all the way around, ending
+            # back on the starting point
+            angles_rad = np.concatenate(([0], 
+                np.linspace(stepSize_rad, 2*math.pi, num_Points)))
+            path = np.empty((len(angles_rad), 3))
+            path[:, 0] = R*np.sin(angles_rad)
+            path[:, 1] = R*np.cos(angles_rad)
+            path[:, 2] = altitude
             
             # TODO If filled, spiral out
              
@@ -111,15 +129,6 @@ class MissionGenerator:
             
             return (path.tolist())
         
-        def createPlanElement(action, points, repeat):
-            temp = {
-                'action' : action,
-                'points' : points,
-                'repeat' : repeat,
-            }
-
-            return temp
-            
         # Set to defaults if required
         if not('shape' in dict_In):
             # WARNING
@@ -169,10 +178,85 @@ class MissionGenerator:
                 
             points = generateTrianglePoints(dict_In);
             
+        elif (dict_In['shape'] == 'coverage'):
+            path = self.generateCoveragePath(dict_In)
+            points = self.addAltitude(path, dict_In['altitude'])
+            
         else :
             # ERROR. Shape is not supported in this version.
             print 'ERROR'
         
+        return self.createMissionFromPoints(points, dict_In['repetition'])
+
+    ## Generate one mission per drone that together cover a polygon
+    def createCoverageMissions(self, dict_In, num_Drones):
+        """Return a list of num_Drones missions splitting a coverage sweep.
+
+        dict_In takes the same keys as a 'coverage' shape for createMission.
+        The sweep is cut into pieces of equal path length, one per drone, so
+        mission i covers the i-th strip of the polygon.
+        """
+        if not('altitude' in dict_In):
+            # WARNING
+            dict_In['altitude'] = 5
+        if not('repetition' in dict_In):
+            # WARNING
+            dict_In['repetition'] = 1
+
+        path = self.generateCoveragePath(dict_In)
+        missions = []
+        for part in coverage_planner.split_path(path, num_Drones):
+            points = self.addAltitude(part, dict_In['altitude'])
+            missions.append(
+                self.createMissionFromPoints(points, dict_In['repetition'])
+            )
+        return missions
+
+    ## Generate (North, East) sweep over a polygon from incoming dictionary
+    def generateCoveragePath(self, dict_In):
+        """Return the coverage sweep for a 'coverage' config as an array.
+
+        The polygon is either 'polygon', a list of [N, E] vertices in meters
+        from home, or 'polygon_latlon', a list of [lat, lon] vertices along
+        with 'home_latlon', the [lat, lon] of home. 'footprint' is the width
+        in meters of the strip the sensor covers (default 4), 'overlap' the
+        fraction of it neighbouring sweeps share (default 0.2), and
+        'rotation' the sweep direction in degrees from north, or None
+        (default) to pick the one needing the fewest turns.
+        """
+        if ('polygon_latlon' in dict_In):
+            polygon = coverage_planner.polygon_to_ned(
+                dict_In['polygon_latlon'], dict_In['home_latlon'])
+        else:
+            polygon = dict_In['polygon']
+        if not('footprint' in dict_In):
+            # WARNING
+            dict_In['footprint'] = 4
+        if not('overlap' in dict_In):
+            # WARNING
+            dict_In['overlap'] = 0.2
+
+        return coverage_planner.plan_coverage(polygon, dict_In['footprint'],
+            dict_In['overlap'], dict_In.get('rotation'))
+
+    ## Add a constant altitude column to a list of (North, East) points
+    def addAltitude(self, path, altitude):
+        points = np.empty((len(path), 3))
+        points[:, 0:2] = path
+        points[:, 2] = altitude
+        return points.tolist()
+
+    ## Generate mission dictionary that patrols a list of points
+    def createMissionFromPoints(self, points, repetition):
+        def createPlanElement(action, points, repeat):
+            temp = {
+                'action' : action,
+                'points' : points,
+                'repeat' : repeat,
+            }
+
+            return temp
+            
         # Generate JSON string using points
         mission = {}
         mission['points'] = {}
@@ -197,7 +281,7 @@ class MissionGenerator:
                 list_Points.append('p'+str(ind))
 
             mission['plan'].append(createPlanElement('patrol', list_Points, 
-                dict_In['repetition']))
+                repetition))
 
             mission['plan'].append(createPlanElement('go', ['home'], 0))
             
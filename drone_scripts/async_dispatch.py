@@ -0,0 +1,194 @@
+"""Provide asynchronous delivery of PyPubSub messages.
+
+TopicDispatcher:
+    Daemon thread that delivers the messages for one topic from a bounded
+    queue.
+
+pub.sendMessage calls every subscriber right away on the thread that sent the
+message, so when the air sensor's thread publishes a reading it's stuck
+running LoggerDaemon.air_data_cb (and anything else subscribed) before it can
+go back to reading the serial port. If one of those is slow the Arduino's
+serial buffer fills up and readings are lost.
+
+Instead, sensors call send_message(), which puts the message on the topic's
+queue and returns immediately, and the topic's TopicDispatcher thread makes
+the actual pub.sendMessage call. Each topic gets its own dispatcher, created
+the first time something is sent on it, so a slow subscriber on one topic
+doesn't hold up the others. queue_depths() reports how full each queue is
+and how many messages have been dropped, for keeping an eye on it.
+
+The dispatchers are daemon threads, so whatever is still queued when the
+program exits is lost. stop_all() stops them first, either delivering what's
+queued (so the last readings still get logged) or dropping it.
+"""
+import threading
+import time
+import sys
+from collections import deque
+from pubsub import pub
+
+
+class TopicDispatcher(threading.Thread):
+    """Queue the messages for a topic and send them on from a daemon thread.
+
+    The queue holds at most max_queued messages. What happens when a message
+    is sent while it's full is decided by the policy:
+
+    'drop_oldest' -- throw away the oldest queued message to make room
+    'drop_newest' -- throw away the message being sent
+    'coalesce'    -- only ever keep the newest message; anything that hasn't
+                     been delivered yet is replaced (max_queued is ignored).
+                     Good for things like the current position, where only
+                     the latest value matters.
+
+    Dropped and replaced messages are counted in self.dropped and
+    self.coalesced. Once stop() has been called nothing more is queued.
+    """
+
+    DROP_OLDEST = 'drop_oldest'
+    DROP_NEWEST = 'drop_newest'
+    COALESCE = 'coalesce'
+
+    def __init__(self, topic, max_queued=100, policy='drop_oldest'):
+        """Construct an instance of TopicDispatcher and start its thread.
+
+        topic -- the PyPubSub topic to send messages on.
+        max_queued -- maximum number of undelivered messages to hold.
+        policy -- one of 'drop_oldest', 'drop_newest' or 'coalesce'.
+        """
+        super(TopicDispatcher, self).__init__()
+        if policy not in (self.DROP_OLDEST, self.DROP_NEWEST, self.COALESCE):
+            raise ValueError("unknown dispatch policy: {0}".format(policy))
+        self.daemon = True
+        self.topic = topic
+        self.policy = policy
+        if policy == self.COALESCE:
+            max_queued = 1
+        self.max_queued = max_queued
+        self._queue = deque()
+        self._ready = threading.Condition(threading.Lock())
+        self.delivered = 0
+        self.dropped = 0
+        self.coalesced = 0
+        self.max_depth = 0
+        self._stopping = False
+        self.start()
+
+    def send(self, **kwargs):
+        """Queue a message to be sent with pub.sendMessage(topic, **kwargs).
+
+        Returns True if the message was queued, False if it was dropped.
+        """
+        with self._ready:
+            if self._stopping:
+                self.dropped += 1
+                return False
+            if len(self._queue) >= self.max_queued:
+                if self.policy == self.DROP_NEWEST:
+                    self.dropped += 1
+                    return False
+                self._queue.popleft()
+                if self.policy == self.COALESCE:
+                    self.coalesced += 1
+                else:
+                    self.dropped += 1
+            self._queue.append(kwargs)
+            self.max_depth = max(self.max_depth, len(self._queue))
+            self._ready.notify()
+        return True
+
+    def stop(self, drain=True, timeout=None):
+        """Stop queueing messages and stop the thread.
+
+        drain -- deliver the messages already queued before stopping, rather
+                 than dropping them.
+        timeout -- maximum number of seconds to wait for the thread to stop,
+                   or None to wait for as long as it takes.
+
+        Returns True if the thread has stopped.
+        """
+        with self._ready:
+            self._stopping = True
+            if not drain:
+                self.dropped += len(self._queue)
+                self._queue.clear()
+            self._ready.notify()
+        self.join(timeout)
+        return not self.is_alive()
+
+    def depth(self):
+        """Return the number of messages waiting to be delivered."""
+        return len(self._queue)
+
+    def stats(self):
+        """Return a dictionary of the queue depth and message counts."""
+        return {
+            'depth': self.depth(),
+            'max_depth': self.max_depth,
+            'delivered': self.delivered,
+            'dropped': self.dropped,
+            'coalesced': self.coalesced,
+        }
+
+    def run(self):
+        """Deliver queued messages as they arrive, until stopped."""
+        while True:
+            with self._ready:
+                while not self._queue and not self._stopping:
+                    self._ready.wait()
+                if not self._queue:
+                    return
+                kwargs = self._queue.popleft()
+            try:
+                pub.sendMessage(self.topic, **kwargs)
+            except Exception as e:
+                sys.stderr.write(
+                    "Delivering {0} failed: {1}\n".format(self.topic, e)
+                )
+            self.delivered += 1
+
+
+_dispatchers = {}
+_dispatchers_lock = threading.Lock()
+
+
+def dispatcher(topic, max_queued=100, policy='drop_oldest'):
+    """Return the TopicDispatcher for topic, creating it if needed.
+
+    max_queued and policy are only used when the dispatcher is created, so to
+    give a topic non-default settings call this before anything is sent on
+    it.
+    """
+    with _dispatchers_lock:
+        if topic not in _dispatchers:
+            _dispatchers[topic] = TopicDispatcher(topic, max_queued, policy)
+        return _dispatchers[topic]
+
+def send_message(topic, **kwargs):
+    """Queue a message on topic without waiting for the subscribers.
+
+    This is the asynchronous version of pub.sendMessage. Returns False if the
+    message was dropped because the topic's queue was full.
+    """
+    return dispatcher(topic).send(**kwargs)
+
+def stop_all(drain=True, timeout=None):
+    """Stop every topic's dispatcher, see TopicDispatcher.stop.
+
+    timeout is for all of them together. Returns True if they all stopped.
+    """
+    with _dispatchers_lock:
+        dispatchers = _dispatchers.values()
+    deadline = None if timeout is None else time.time() + timeout
+    stopped = True
+    for d in dispatchers:
+        if deadline is not None:
+            timeout = max(deadline - time.time(), 0)
+        stopped &= d.stop(drain, timeout)
+    return stopped
+
+def queue_depths():
+    """Return the stats() of every topic's dispatcher, by topic."""
+    with _dispatchers_lock:
+        dispatchers = _dispatchers.items()
+    return dict((topic, d.stats()) for topic, d in dispatchers)
@@ -0,0 +1,205 @@
+"""
+Plan coverage paths that sweep a drone's sensor over an arbitrary polygon.
+
+The area to cover is a simple polygon (convex or not) given as a list of
+vertices, either in meters north and east of home or in lat/lon (see
+polygon_to_ned). The drone flies back and forth across it in parallel
+sweeps, a boustrophedon or 'lawnmower' pattern, spaced so that the sensor's
+footprint overlaps the previous sweep by the requested fraction.
+
+Every sweep ends in a turn, and turns are slow and use up battery, so the
+sweep direction is picked to need as few sweeps as possible. The fewest sweeps
+are needed when they run across the polygon's narrowest width, and for a
+convex polygon that width is always measured perpendicular to one of its
+edges, so each edge direction is tried and the best one kept (ties go to the
+shortest path).
+
+Sweeps over a non-convex polygon can be split into several pieces by a notch
+in its outline. The pieces on one sweep are flown in order and the drone flies
+straight over the gaps between them, so those short hops can leave the
+polygon.
+
+Splitting the work between several drones cuts the single path into pieces of
+equal length (see split_path), so each drone covers a contiguous strip of the
+area and flies the same distance doing it. Getting to and from its strip isn't
+counted.
+"""
+import math
+import numpy as np
+
+
+def sweep_spacing(footprint, overlap):
+    """Return the distance in meters between neighbouring sweeps.
+
+    footprint -- width in meters of the strip of ground the sensor covers.
+    overlap -- fraction of the footprint that neighbouring sweeps share, in
+               the range [0, 1).
+    """
+    if footprint <= 0:
+        raise ValueError("footprint must be positive")
+    if not 0 <= overlap < 1:
+        raise ValueError("overlap must be at least 0 and less than 1")
+    return footprint * (1 - overlap)
+
+def polygon_to_ned(polygon_latlon, home_latlon):
+    """Return a polygon of lat/lon vertices as (north, east) meters from home.
+
+    polygon_latlon -- sequence of [lat, lon] vertices, in degrees.
+    home_latlon -- [lat, lon] of the drone's home location, in degrees.
+    """
+    # nav_utils pulls in dronekit, so only import it when it's needed
+    import nav_utils
+    polygon_latlon = np.asarray(polygon_latlon, dtype=float)
+    north, east = nav_utils.global_to_ned(
+        home_latlon[0],
+        home_latlon[1],
+        polygon_latlon[:, 0],
+        polygon_latlon[:, 1],
+    )
+    return np.column_stack((north, east))
+
+def as_polygon(polygon):
+    """Return polygon as an (n, 2) float array of distinct vertices.
+
+    A closing vertex that repeats the first one is dropped. Raises ValueError
+    if there aren't at least three vertices left.
+    """
+    polygon = np.asarray(polygon, dtype=float)
+    if polygon.ndim != 2 or polygon.shape[1] != 2:
+        raise ValueError("polygon must be a sequence of [north, east] points")
+    if len(polygon) > 1 and np.array_equal(polygon[0], polygon[-1]):
+        polygon = polygon[:-1]
+    if len(polygon) < 3:
+        raise ValueError("polygon needs at least three vertices")
+    return polygon
+
+def candidate_angles(polygon):
+    """Return the distinct edge directions of polygon, in radians [0, pi).
+
+    Angles are measured from north towards east.
+    """
+    edges = np.roll(polygon, -1, axis=0) - polygon
+    edges = edges[np.hypot(edges[:, 0], edges[:, 1]) > 0]
+    angles = np.arctan2(edges[:, 1], edges[:, 0]) % math.pi
+    return np.unique(np.round(angles, 9))
+
+def sweep_lines(polygon, spacing, angle):
+    """Return the pieces of each sweep across polygon at the given angle.
+
+    The sweeps run in the direction angle (radians from north towards east),
+    spacing meters apart, and are centered on the polygon so that neither
+    edge is more than half a spacing from the nearest sweep. The result is a
+    list with one entry per sweep, in order across the polygon, each a list
+    of (start, end) pairs of (north, east) points running in the sweep
+    direction.
+    """
+    polygon = as_polygon(polygon)
+    along = np.array([math.cos(angle), math.sin(angle)])
+    across = np.array([-math.sin(angle), math.cos(angle)])
+    u = polygon.dot(along)
+    v = polygon.dot(across)
+    width = v.max() - v.min()
+    count = max(1, int(math.ceil(width / spacing)))
+    margin = (width - (count - 1) * spacing) / 2
+    offsets = v.min() + margin + spacing * np.arange(count)
+
+    # Intersect every sweep with every edge at once. An edge crosses a sweep
+    # if the sweep is in [v1, v2) or [v2, v1), which counts a sweep that goes
+    # exactly through a vertex once rather than twice.
+    u1, v1 = u[np.newaxis, :], v[np.newaxis, :]
+    u2, v2 = np.roll(u1, -1, axis=1), np.roll(v1, -1, axis=1)
+    level = offsets[:, np.newaxis]
+    crosses = (((v1 <= level) & (level < v2)) |
+               ((v2 <= level) & (level < v1)))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        crossing_u = u1 + (level - v1) * (u2 - u1) / (v2 - v1)
+
+    lines = []
+    for offset, line_crosses, line_u in zip(offsets, crosses, crossing_u):
+        ends = np.sort(line_u[line_crosses])
+        pieces = []
+        for start_u, end_u in zip(ends[0::2], ends[1::2]):
+            if end_u > start_u:
+                pieces.append((
+                    start_u * along + offset * across,
+                    end_u * along + offset * across,
+                ))
+        if pieces:
+            lines.append(pieces)
+    return lines
+
+def boustrophedon(lines):
+    """Return the waypoints that fly the sweeps back and forth, in order.
+
+    lines is the output of sweep_lines. Every other sweep is flown in reverse
+    so that each one starts at the end the last one finished on. The result
+    is an (n, 2) array of (north, east) points.
+    """
+    waypoints = []
+    for index, pieces in enumerate(lines):
+        if index % 2:
+            pieces = [(end, start) for start, end in reversed(pieces)]
+        for start, end in pieces:
+            waypoints.append(start)
+            waypoints.append(end)
+    return np.array(waypoints).reshape(-1, 2)
+
+def path_length(path):
+    """Return the length in meters of a path of (north, east) waypoints."""
+    steps = np.diff(path, axis=0)
+    return np.hypot(steps[:, 0], steps[:, 1]).sum()
+
+def plan_coverage(polygon, footprint, overlap=0.2, angle=None):
+    """Return the waypoints of a boustrophedon path covering polygon.
+
+    polygon -- sequence of [north, east] vertices in meters from home.
+    footprint -- width in meters of the strip the sensor covers.
+    overlap -- fraction of the footprint neighbouring sweeps share.
+    angle -- sweep direction in degrees from north, or None to pick the one
+             needing the fewest sweeps (and so the fewest turns).
+
+    The result is an (n, 2) array of (north, east) waypoints.
+    """
+    polygon = as_polygon(polygon)
+    spacing = sweep_spacing(footprint, overlap)
+    if angle is None:
+        angles = candidate_angles(polygon)
+    else:
+        angles = [math.radians(angle)]
+    best = None
+    for candidate in angles:
+        lines = sweep_lines(polygon, spacing, candidate)
+        path = boustrophedon(lines)
+        cost = (len(lines), path_length(path))
+        if best is None or cost < best[0]:
+            best = (cost, path)
+    return best[1]
+
+def split_path(path, num_parts):
+    """Split a path into num_parts consecutive pieces of equal length.
+
+    The cuts are made at whatever point along the path gives equal lengths,
+    which usually means partway along a sweep, and the point is the end of one
+    piece and the start of the next. Returns a list of (n, 2) arrays.
+    """
+    if num_parts < 1:
+        raise ValueError("num_parts must be at least 1")
+    path = np.asarray(path, dtype=float)
+    steps = np.diff(path, axis=0)
+    distance = np.concatenate(([0], np.cumsum(np.hypot(steps[:, 0],
+                                                       steps[:, 1]))))
+    cuts = distance[-1] * np.arange(num_parts + 1) / num_parts
+    cut_points = np.column_stack((
+        np.interp(cuts, distance, path[:, 0]),
+        np.interp(cuts, distance, path[:, 1]),
+    ))
+    parts = []
+    for index in range(num_parts):
+        start, end = cuts[index], cuts[index + 1]
+        inside = (distance > start) & (distance < end)
+        parts.append(np.vstack((
+            cut_points[index],
+            path[inside],
+            cut_points[index + 1],
+        )))
+    return parts
@@ -0,0 +1,287 @@
+"""Provide shared database access for the base station scripts.
+
+IncrementalReader:
+    Fetches only the rows each consumer hasn't seen yet.
+
+The base station scripts (base_station, matlab_plotting, gdp_poster) all poll
+the database every second or so for the current mission's readings. Fetching
+the whole mission every time means each poll gets slower the longer the
+mission runs, so instead each query remembers the highest id it has returned
+(its watermark) and the next poll only asks for rows with a bigger id.
+
+Air and RF readings are located by pairing each one with the GPS reading its
+drone took nearest in time (see time_join.py), as long as that's within a
+tolerance of a second or so. A reading that's newer than the drone's latest
+GPS reading is held back until the GPS catches up, but only for so long (see
+fetch_new_located), so a GPS that's stopped logging doesn't hold up the
+drone's other readings forever.
+
+Queries filter readings on the mission_id and drone_id columns of the
+sensor_reads table rather than joining through the association tables to
+compare names, so mission and drone names are turned into ids once and then
+remembered.
+
+The GPS queries that every poll of every consumer runs are baked (see
+database.bakery), so their SQL is only built and compiled once.
+"""
+import sys
+import threading
+import numpy as np
+from sqlalchemy import desc, func, bindparam
+from sqlalchemy.orm import aliased
+from models import *
+from database import bakery
+from time_join import nearest_time_indices
+
+
+# GPS readings are queried through an alias of their joined tables. Baked
+# queries are cached by the code that builds them, so it has to be the same
+# alias every time.
+_gps = aliased(GPSSensorRead)
+
+
+class IncrementalReader(object):
+    """Run queries that only return rows newer than the last poll.
+
+    Each consumer (a name like 'DroneCoordinator.get_data') has its own
+    watermark, so several queries can share one IncrementalReader without
+    stepping on each other. The watermarks and remembered ids are only
+    touched with a lock held, so the consumers can poll from different
+    threads, but each consumer should only poll from one at a time.
+    """
+
+    def __init__(self, scoped_session):
+        """Construct an instance of IncrementalReader.
+
+        scoped_session -- a Database's scoped_session (see database.py).
+        """
+        self._scoped_session = scoped_session
+        self._lock = threading.Lock()
+        self._watermarks = {}
+        self._mission_drone_ids = {}
+
+    def watermark(self, consumer):
+        """Return the highest id consumer has been given so far."""
+        with self._lock:
+            return self._watermarks.get(consumer, 0)
+
+    def reset(self, consumer=None):
+        """Forget the watermark for consumer, or for everyone if None."""
+        with self._lock:
+            if consumer is None:
+                self._watermarks = {}
+            else:
+                self._watermarks.pop(consumer, None)
+
+    def _advance(self, consumer, last_id):
+        """Move consumer's watermark up to last_id (never back down)."""
+        with self._lock:
+            self._watermarks[consumer] = max(
+                last_id,
+                self._watermarks.get(consumer, 0),
+            )
+
+    def mission_drone_ids(self, mission_name, drone_name):
+        """Return (mission_id, drone_id) for the named mission and drone.
+
+        If more than one mission has the name, the latest one is used. Returns
+        None if the mission hasn't been set up with that drone (yet), and only
+        remembers the answer once it isn't None.
+        """
+        key = (mission_name, drone_name)
+        with self._lock:
+            ids = self._mission_drone_ids.get(key)
+        if ids is None:
+            with self._scoped_session(
+                'IncrementalReader.mission_drone_ids'
+            ) as session:
+                mission_id = session.query(
+                    func.max(Mission.id),
+                ).filter(
+                    Mission.name == mission_name,
+                ).scalar()
+                drone_id = session.query(
+                    MissionDrone.drone_id,
+                ).join(
+                    Drone,
+                    MissionDrone.drone_id == Drone.id,
+                ).filter(
+                    MissionDrone.mission_id == mission_id,
+                    Drone.name == drone_name,
+                ).order_by(
+                    MissionDrone.id,
+                ).first()
+            if drone_id is None:
+                return None
+            ids = (mission_id, drone_id[0])
+            with self._lock:
+                self._mission_drone_ids[key] = ids
+        return ids
+
+    def latest_gps_read(self, mission_name, drone_name):
+        """Return the latest GPS reading of drone_name, see latest_gps_read."""
+        ids = self.mission_drone_ids(mission_name, drone_name)
+        if ids is None:
+            return None
+        with self._scoped_session(
+            'IncrementalReader.latest_gps_read'
+        ) as session:
+            return latest_gps_read(session, *ids)
+
+    def fetch_new(self, consumer, build_query, mission_name, drone_name):
+        """Return the rows of a query with ids past consumer's watermark.
+
+        build_query is called with a session, mission id and drone id and
+        should return a tuple of (query, id_column), where id_column is the
+        column (one of the query's columns) that the watermark is kept on.
+        Rows come back ordered by that column and the watermark is moved up to
+        the last one. Nothing is returned until the mission and drone exist.
+        """
+        ids = self.mission_drone_ids(mission_name, drone_name)
+        if ids is None:
+            return []
+        mission_id, drone_id = ids
+        last_seen = self.watermark(consumer)
+        with self._scoped_session(consumer) as session:
+            query, id_column = build_query(session, mission_id, drone_id)
+            id_index = self._column_index(query, id_column)
+            rows = query.filter(
+                id_column > last_seen,
+            ).order_by(
+                id_column,
+            ).all()
+        if rows:
+            self._advance(consumer, rows[-1][id_index])
+        return rows
+
+    def fetch_new_located(self, consumer, build_query, mission_name,
+                          drone_name, tolerance=1.0, max_hold=10.0):
+        """Return new readings paired with the GPS reading nearest in time.
+
+        build_query is called with a session, mission id and drone id and
+        should return a tuple of (query, id_column, time_column) for the
+        readings to locate, where both columns are among the query's columns.
+        Each new reading is matched to
+        the GPS reading drone_name took on mission_name closest to it in time,
+        and the result is a list of (reading_row, gps_row) pairs, where
+        gps_row has latitude, longitude, altitude, relative, time and id.
+
+        A reading with no GPS reading within tolerance seconds is left out.
+        If the drone's GPS readings haven't caught up to it yet (a match, or a
+        closer one, could still show up) it is held back, along with
+        everything after it, until a later call, so nothing is mislocated or
+        skipped just because the GPS reading was written a moment after it.
+
+        A reading is only held back until there are new readings more than
+        max_hold seconds after it, though. By then the GPS has fallen that
+        far behind (or stopped), and the reading is returned with the best
+        match there is, or left out if there's none, which is logged.
+        """
+        ids = self.mission_drone_ids(mission_name, drone_name)
+        if ids is None:
+            return []
+        mission_id, drone_id = ids
+        last_seen = self.watermark(consumer)
+        with self._scoped_session(consumer) as session:
+            query, id_column, time_column = build_query(
+                session,
+                mission_id,
+                drone_id,
+            )
+            id_index = self._column_index(query, id_column)
+            time_index = self._column_index(query, time_column)
+            rows = query.filter(
+                id_column > last_seen,
+            ).order_by(
+                id_column,
+            ).all()
+            if not rows:
+                return []
+            times = np.array([row[time_index] for row in rows], dtype=float)
+            gps_query = bakery(lambda session: session.query(
+                _gps.latitude,
+                _gps.longitude,
+                _gps.altitude,
+                _gps.relative,
+                _gps.time,
+                _gps.id,
+            ).filter(
+                _gps.mission_id == bindparam('mission_id'),
+                _gps.drone_id == bindparam('drone_id'),
+                _gps.time >= bindparam('start'),
+                _gps.time <= bindparam('end'),
+            ).order_by(
+                _gps.time,
+            ))
+            gps_rows = gps_query(session).params(
+                mission_id=mission_id,
+                drone_id=drone_id,
+                start=float(times.min()) - tolerance,
+                end=float(times.max()) + tolerance,
+            ).all()
+            latest = latest_gps_read(session, mission_id, drone_id)
+        gps_times = np.array([gps.time for gps in gps_rows], dtype=float)
+        nearest = nearest_time_indices(times, gps_times, tolerance)
+        if latest is None:
+            pending = np.ones(len(rows), dtype=bool)
+        else:
+            # a GPS reading closer than the current match (or any match at
+            # all) can only still show up if the GPS hasn't got that far yet
+            matched = nearest >= 0
+            reach = np.full(times.shape, tolerance)
+            reach[matched] = np.abs(
+                times[matched] - gps_times[nearest[matched]]
+            )
+            pending = times + reach > float(latest.time)
+        overdue = pending & (times < times.max() - max_hold)
+        pending &= ~overdue
+        ready = np.argmax(pending) if pending.any() else len(rows)
+        if ready:
+            self._advance(consumer, rows[ready - 1][id_index])
+        unlocated = np.count_nonzero(overdue[:ready] & (nearest[:ready] < 0))
+        if unlocated:
+            sys.stderr.write(
+                "{0}: left out {1} readings that had no GPS reading within "
+                "{2}s after waiting {3}s for one\n".format(
+                    consumer,
+                    unlocated,
+                    tolerance,
+                    max_hold,
+                )
+            )
+        return [
+            (rows[i], gps_rows[nearest[i]])
+            for i in xrange(ready)
+            if nearest[i] >= 0
+        ]
+
+    def _column_index(self, query, column):
+        """Return the position of column in the query's result rows."""
+        for index, description in enumerate(query.column_descriptions):
+            if description['expr'] is column:
+                return index
+        raise ValueError("column must be one of the query's columns")
+
+
+def latest_gps_read(session, mission_id, drone_id):
+    """Return the most recent GPS reading of a drone on a mission.
+
+    The row has latitude, longitude, altitude, time and id, or is None if the
+    drone hasn't logged any GPS readings yet.
+    """
+    query = bakery(lambda session: session.query(
+        _gps.latitude,
+        _gps.longitude,
+        _gps.altitude,
+        _gps.time,
+        _gps.id,
+    ).filter(
+        _gps.mission_id == bindparam('mission_id'),
+        _gps.drone_id == bindparam('drone_id'),
+    ).order_by(
+        desc(_gps.id),
+    ))
+    return query(session).params(
+        mission_id=mission_id,
+        drone_id=drone_id,
+    ).first()
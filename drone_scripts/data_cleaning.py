@@ -0,0 +1,84 @@
+"""Provide the cleaning stage for readings fetched from the database.
+
+The base station and the plotter both get rows of (time, reading, lat, lon,
+alt, id, ...) back from their queries and need to turn them into a list of
+located readings: throw out the ones with no usable value or GPS fix, and
+where several readings share the exact same coordinates keep only the highest
+one. This does all of that with numpy on whole arrays at once, and returns a
+structured array with the fields in READING_DTYPE, so the fields can be used
+by name (readings['value']) or as whole columns.
+"""
+import numpy as np
+
+
+READING_DTYPE = np.dtype([
+    ('lat', np.float64),
+    ('lon', np.float64),
+    ('value', np.float64),
+    ('id', np.int64),
+    ('time', np.float64),
+])
+
+
+def readings_array(rows, time=0, value=1, lat=2, lon=3, id=5):
+    """Return rows from the database as a structured array of readings.
+
+    The keyword arguments are the positions of each field in the rows. The
+    defaults match DroneCoordinator.get_data and RTPlotter.get_air_data. None
+    (a missing value or GPS fix) becomes nan.
+    """
+    readings = np.empty(len(rows), dtype=READING_DTYPE)
+    for field, index in (('time', time), ('value', value), ('lat', lat),
+                         ('lon', lon), ('id', id)):
+        readings[field] = [
+            np.nan if row[index] is None else row[index] for row in rows
+        ]
+    return readings
+
+
+def valid_mask(readings, min_value=None):
+    """Return a boolean mask of the readings that are usable.
+
+    A reading is usable if its value and coordinates are finite numbers and
+    its latitude isn't 0 (which is what we get before the GPS has a fix). If
+    min_value is given, the value also has to be above it.
+    """
+    mask = (np.isfinite(readings['lat']) &
+            np.isfinite(readings['lon']) &
+            np.isfinite(readings['value']) &
+            (readings['lat'] != 0))
+    if min_value is not None:
+        mask &= readings['value'] > min_value
+    return mask
+
+
+def dedup_by_coordinate(readings):
+    """Return the readings with one per coordinate, keeping the max value.
+
+    The result is sorted by latitude and then longitude.
+    """
+    if readings.size == 0:
+        return readings
+    # lexsort sorts by the last key first: latitude, longitude, then the
+    # highest value first within each coordinate
+    order = np.lexsort((-readings['value'], readings['lon'], readings['lat']))
+    readings = readings[order]
+    first = np.ones(readings.size, dtype=bool)
+    first[1:] = ((readings['lat'][1:] != readings['lat'][:-1]) |
+                 (readings['lon'][1:] != readings['lon'][:-1]))
+    return readings[first]
+
+
+def clean_readings(rows, min_value=None, **indexes):
+    """Return the usable, deduplicated readings from database rows.
+
+    rows -- query rows, see readings_array for the layout and indexes.
+    min_value -- if given, drop readings with values at or below it.
+    """
+    readings = readings_array(rows, **indexes)
+    return dedup_by_coordinate(readings[valid_mask(readings, min_value)])
+
+
+def merge_readings(readings, new_readings):
+    """Return two sets of cleaned readings combined and deduplicated."""
+    return dedup_by_coordinate(np.concatenate((readings, new_readings)))
@@ -0,0 +1,157 @@
+"""Provide concurrent dispatch of investigations to a fleet of drones.
+
+DroneWorker:
+    Daemon thread that flies one drone's investigations, one at a time.
+
+DroneScheduler:
+    Hands each area of interest to the nearest idle drone.
+
+DroneCoordinator used to investigate areas of interest from its control loop
+itself, so while the secondary drone was launching (20 seconds of sleep) and
+flying probes, nobody was reading the primary drone's data, and every area
+found in the meantime waited for the ones before it, on the one secondary
+drone there was. Now each drone that investigates gets a DroneWorker, a
+daemon thread with a queue of targets, and the control loop only picks which
+drone gets each target, then goes straight back to polling. A drone that's
+busy doesn't get new targets, so areas of interest stay queued in the
+HotspotIndex until a drone is free, and then the highest one goes to the
+nearest free drone.
+
+Each drone is launched the first time it's given a target, and stays up
+between investigations, so the wait for it to take off is only paid once.
+"""
+import threading
+import Queue
+import sys
+import nav_utils
+
+
+class DroneWorker(threading.Thread):
+    """Fly one drone's investigations from a daemon thread.
+
+    The worker is idle until investigate() gives it a target, and busy until
+    the coordinator's track_source returns (or fails) for it.
+    """
+
+    def __init__(self, coordinator, drone_name, drone_addr):
+        """Construct an instance of DroneWorker and start its thread.
+
+        coordinator -- the DroneCoordinator to fly the drone with.
+        drone_name -- name of the drone, as in mission_setup.json.
+        drone_addr -- address (not IP) of the drone.
+        """
+        super(DroneWorker, self).__init__()
+        self.daemon = True
+        self.coordinator = coordinator
+        self.drone_name = drone_name
+        self.drone_addr = drone_addr
+        # where the drone took off from, once it has
+        self.home = None
+        self.target = None
+        self.investigated = 0
+        self._targets = Queue.Queue()
+        self._idle = threading.Event()
+        self._idle.set()
+        self.start()
+
+    def idle(self):
+        """Return True if the drone isn't investigating anything."""
+        return self._idle.is_set()
+
+    def investigate(self, target):
+        """Queue target (a hotspot_index.Target) for the drone to track."""
+        self._idle.clear()
+        self.target = target
+        self._targets.put(target)
+
+    def location(self):
+        """Return [lat, lon] of the drone's latest GPS reading, or None."""
+        latest_point = self.coordinator.reader.latest_gps_read(
+            self.coordinator.mission_name,
+            self.drone_name,
+        )
+        if latest_point is None:
+            return None
+        return [latest_point.latitude, latest_point.longitude]
+
+    def run(self):
+        """Track each target to its source as it's given to the drone."""
+        while True:
+            target = self._targets.get()
+            try:
+                if self.home is None:
+                    self.home = self.coordinator.launch_and_wait(
+                        self.drone_addr,
+                        self.drone_name,
+                    )
+                self.coordinator.track_source(
+                    self.drone_addr,
+                    self.drone_name,
+                    target,
+                    self.home,
+                )
+            except Exception as e:
+                sys.stderr.write(
+                    "{0} investigating area {1} failed: {2}\n".format(
+                        self.drone_name,
+                        target.hotspot,
+                        e,
+                    )
+                )
+            self.investigated += 1
+            self.target = None
+            self._idle.set()
+
+
+class DroneScheduler(object):
+    """Give each investigation to the nearest idle drone.
+
+    assign() is meant to be called from one thread (the coordinator's control
+    loop); the drones' workers only ever make themselves idle again.
+    """
+
+    def __init__(self, coordinator, drones):
+        """Construct an instance of DroneScheduler and start its workers.
+
+        coordinator -- the DroneCoordinator to fly the drones with.
+        drones -- list of (drone_name, drone_addr) of the drones to send.
+        """
+        self.workers = [
+            DroneWorker(coordinator, drone_name, drone_addr)
+            for drone_name, drone_addr in drones
+        ]
+
+    def idle_workers(self):
+        """Return the workers of the drones that aren't investigating."""
+        return [worker for worker in self.workers if worker.idle()]
+
+    def busy(self):
+        """Return the number of drones that are investigating."""
+        return len(self.workers) - len(self.idle_workers())
+
+    def assign(self, target):
+        """Send the idle drone nearest target to investigate it.
+
+        Drones that haven't reported a GPS location yet are only picked if
+        none of the idle ones have. Returns the DroneWorker it was given to,
+        or None if every drone is busy.
+        """
+        nearest = None
+        nearest_distance = None
+        for worker in self.idle_workers():
+            location = worker.location()
+            if location is None:
+                distance = float('inf')
+            else:
+                distance = nav_utils.equirectangular_distance(
+                    location[0],
+                    location[1],
+                    target.lat,
+                    target.lon,
+                )
+            if nearest is None or distance < nearest_distance:
+                nearest = worker
+                nearest_distance = distance
+        if nearest is not None:
+            nearest.investigate(target)
+        return nearest
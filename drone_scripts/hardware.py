@@ -15,7 +15,7 @@ import drone_control
 import dronekit
 from subprocess import Popen, PIPE, call
 import sys
-from pubsub import pub
+import async_dispatch
     
 
 class AirSensor(threading.Thread):
@@ -60,8 +60,13 @@ class AirSensor(threading.Thread):
             sys.stderr.write(e.__repr__())
 
     def _callback(self, air_data):
-        """Publish air sensor data on the appropriate PyPubSub topic."""
-        pub.sendMessage("sensor-messages.air-data", arg1=air_data)
+        """Publish air sensor data on the appropriate PyPubSub topic.
+
+        The message is delivered on the topic's dispatcher thread (see
+        async_dispatch.py) so that the subscribers can't hold up reading the
+        serial port.
+        """
+        async_dispatch.send_message("sensor-messages.air-data", arg1=air_data)
 
     def run(self):
         """Gather and publish data periodically while the thread is alive."""
@@ -0,0 +1,250 @@
+"""Provide a spatial index of readings that finds hotspots incrementally.
+
+HotspotIndex:
+    Aggregates readings into a metric grid and clusters the cells over a
+    threshold into hotspots, each one investigated once.
+
+DroneCoordinator used to queue every reading over the threshold as its own
+area of interest and re-sort the whole queue each time, so a plume that the
+grid mission crossed a dozen times meant a dozen investigations of more or
+less the same spot. Here readings are binned into square cells of cell_size
+meters, north and east of the first reading, and a cell whose highest reading
+is over the threshold is hot. Hot cells that touch (including diagonally), or
+that only have a gap of an empty cell or so between them (sweeps of a grid
+mission can easily miss a column of cells), are joined into one hotspot with
+a union-find, and each hotspot gives one investigation target: the location
+of its highest reading. Adding readings only touches the cells they land in
+and those cells' neighbors, so the cost of each update depends on the number
+of new readings, not on the size of the mission.
+
+Targets come out of next_target() highest reading first. Once a hotspot's
+target has been handed out the hotspot is never handed out again, even if it
+grows or merges with another one, since whoever's investigating it is
+already on their way there.
+"""
+import heapq
+import itertools
+from collections import namedtuple
+import numpy as np
+from nav_utils import global_to_ned
+
+
+Target = namedtuple('Target', ['lat', 'lon', 'value', 'id', 'hotspot'])
+
+
+class Cell(object):
+    """Running totals of the readings in one grid cell."""
+
+    __slots__ = ('count', 'total', 'peak', 'lat', 'lon', 'id')
+
+    def __init__(self):
+        """Construct an instance of Cell with no readings."""
+        self.count = 0
+        self.total = 0.0
+        self.peak = -np.inf
+        self.lat = self.lon = self.id = None
+
+    def mean(self):
+        """Return the mean of the cell's readings."""
+        return self.total / self.count
+
+
+class Hotspot(object):
+    """A cluster of touching hot cells."""
+
+    __slots__ = ('cells', 'readings', 'peak', 'lat', 'lon', 'id',
+                 'investigated')
+
+    def __init__(self):
+        """Construct an instance of Hotspot with no cells."""
+        self.cells = 0
+        self.readings = 0
+        self.peak = -np.inf
+        self.lat = self.lon = self.id = None
+        self.investigated = False
+
+
+class HotspotIndex(object):
+    """Bin readings into grid cells and cluster the hot ones into hotspots.
+
+    Each hotspot is known by the (row, column) of one of its cells, see
+    hotspot_of(). hotspots is a dictionary of them all.
+    """
+
+    def __init__(self, threshold, cell_size=3.0, gap=1):
+        """Construct an instance of HotspotIndex.
+
+        threshold -- a cell is hot when a reading in it is over this.
+        cell_size -- width and height of each cell in meters.
+        gap -- hot cells with up to this many cells between them are part of
+               the same hotspot.
+        """
+        self.threshold = threshold
+        self.cell_size = float(cell_size)
+        # the cells around a cell that are near enough to join up with it,
+        # as (row, column) offsets
+        reach = range(-gap - 1, gap + 2)
+        self._neighbors = [
+            (row, col)
+            for row in reach
+            for col in reach
+            if (row, col) != (0, 0)
+        ]
+        self.home = None
+        self.cells = {}
+        self.hotspots = {}
+        self._parent = {}
+        self._queue = []
+        self._order = itertools.count()
+
+    def to_ned(self, lat, lon):
+        """Return (north, east) in meters from the index's home."""
+        return global_to_ned(self.home[0], self.home[1], lat, lon)
+
+    def cell_of(self, lat, lon):
+        """Return the (row, column) keys of the cells lat and lon are in."""
+        north, east = self.to_ned(lat, lon)
+        rows = np.floor(np.asarray(north) / self.cell_size).astype(int)
+        cols = np.floor(np.asarray(east) / self.cell_size).astype(int)
+        return rows, cols
+
+    def add(self, readings):
+        """Add readings and return the number of cells that became hot.
+
+        readings -- a structured array with lat, lon, value and id fields,
+                    like the ones clean_readings returns.
+        """
+        if len(readings) == 0:
+            return 0
+        if self.home is None:
+            self.home = (readings['lat'][0], readings['lon'][0])
+        rows, cols = self.cell_of(readings['lat'], readings['lon'])
+        # the highest reading in each touched cell, found with one sort so
+        # only one python step is needed per cell rather than per reading
+        order = np.lexsort((-readings['value'], cols, rows))
+        rows = rows[order]
+        cols = cols[order]
+        readings = readings[order]
+        first = np.ones(len(readings), dtype=bool)
+        first[1:] = (rows[1:] != rows[:-1]) | (cols[1:] != cols[:-1])
+        starts = np.flatnonzero(first)
+        counts = np.diff(np.append(starts, len(readings)))
+        totals = np.add.reduceat(readings['value'], starts)
+        became_hot = 0
+        for start, count, total in zip(starts, counts, totals):
+            key = (int(rows[start]), int(cols[start]))
+            top = readings[start]
+            cell = self.cells.get(key)
+            if cell is None:
+                cell = self.cells[key] = Cell()
+            was_hot = cell.peak > self.threshold
+            cell.count += int(count)
+            cell.total += float(total)
+            if top['value'] > cell.peak:
+                cell.peak = float(top['value'])
+                cell.lat = float(top['lat'])
+                cell.lon = float(top['lon'])
+                cell.id = int(top['id'])
+            if cell.peak > self.threshold:
+                if not was_hot:
+                    self._heat(key)
+                    became_hot += 1
+                else:
+                    self._update_hotspot(key, cell, int(count))
+        return became_hot
+
+    def hotspot_of(self, key):
+        """Return the key of the hotspot the hot cell at key belongs to."""
+        parent = self._parent
+        root = key
+        while parent[root] != root:
+            root = parent[root]
+        # point everything on the way straight at the root
+        while parent[key] != root:
+            parent[key], key = root, parent[key]
+        return root
+
+    def _heat(self, key):
+        """Make a newly hot cell a hotspot and join it to its neighbors."""
+        cell = self.cells[key]
+        self._parent[key] = key
+        hotspot = self.hotspots[key] = Hotspot()
+        hotspot.cells = 1
+        self._update_hotspot(key, cell, cell.count)
+        row, col = key
+        for row_offset, col_offset in self._neighbors:
+            neighbor = (row + row_offset, col + col_offset)
+            if neighbor in self._parent:
+                self._join(key, neighbor)
+
+    def _update_hotspot(self, key, cell, new_readings):
+        """Add a hot cell's new readings and peak to its hotspot."""
+        root = self.hotspot_of(key)
+        hotspot = self.hotspots[root]
+        hotspot.readings += new_readings
+        if cell.peak > hotspot.peak:
+            hotspot.peak = cell.peak
+            hotspot.lat, hotspot.lon, hotspot.id = cell.lat, cell.lon, cell.id
+            self._push(root)
+
+    def _join(self, a, b):
+        """Merge the hotspots that the hot cells a and b belong to."""
+        a = self.hotspot_of(a)
+        b = self.hotspot_of(b)
+        if a == b:
+            return
+        first, second = self.hotspots[a], self.hotspots[b]
+        if first.cells < second.cells:
+            a, b = b, a
+            first, second = second, first
+        self._parent[b] = a
+        del self.hotspots[b]
+        first.cells += second.cells
+        first.readings += second.readings
+        first.investigated = first.investigated or second.investigated
+        if second.peak > first.peak:
+            first.peak = second.peak
+            first.lat, first.lon, first.id = second.lat, second.lon, second.id
+        self._push(a)
+
+    def _push(self, root):
+        """Queue root's target, if it hasn't been handed out already.
+
+        Entries aren't removed when their hotspot changes, next_target skips
+        the ones that are out of date instead.
+        """
+        hotspot = self.hotspots[root]
+        if not hotspot.investigated:
+            heapq.heappush(
+                self._queue,
+                (-hotspot.peak, next(self._order), root),
+            )
+
+    def next_target(self):
+        """Return the Target of the hottest hotspot not handed out yet.
+
+        Returns None if there isn't one. The hotspot is marked as
+        investigated, so it won't be handed out again.
+        """
+        while self._queue:
+            peak, _, root = heapq.heappop(self._queue)
+            hotspot = self.hotspots.get(root)
+            if (hotspot is None or hotspot.investigated or
+                    -peak != hotspot.peak):
+                continue
+            hotspot.investigated = True
+            return Target(
+                hotspot.lat,
+                hotspot.lon,
+                hotspot.peak,
+                hotspot.id,
+                root,
+            )
+        return None
+
+    def pending(self):
+        """Return the number of hotspots that haven't been handed out."""
+        return sum(
+            1 for hotspot in self.hotspots.values()
+            if not hotspot.investigated
+        )
@@ -0,0 +1,160 @@
+"""
+Run a base station HTTP server that drones upload batches of readings to.
+
+IngestServer:
+    Daemon thread running a Flask server that bulk inserts uploaded batches.
+
+Instead of every drone holding its own connection to the base station's
+database and writing its readings over it a transaction at a time, drones
+can POST batches of readings packed with telemetry_format.encode_batch to
+/telemetry (see SpoolUploader's ingest_url). Each batch is decoded and
+written by write_readings (see reading_buffer.py), which does a few
+multi-row INSERTs with SQLAlchemy Core instead of going through the ORM, all
+through this server's single connection pool. Readings that were already
+uploaded, going by their upload keys, are skipped, so a drone can safely send
+a batch again if it never got the response.
+
+The response is a JSON object with the number of readings written and
+skipped, and the readings that were rejected, as [index in the batch,
+reason] pairs, where the index is the reading's position in the batch as
+the drone sent it (decode_batch keeps that order). Those are the ones
+whose mission drone sensor or event type isn't in the database, and the rest
+of the batch is written without them, so one drone that's been set up wrong
+can't hold up its own good readings.
+A batch that can't be decoded gets a 400, and one that the database refuses
+because of its rows (see is_row_error) a 422, and nothing in it is written.
+GET /stats returns the totals so far.
+
+It can run on its own or alongside base_station.py (see its --ingest_port
+argument). The database is the one configured in database.py unless db_url
+says otherwise, so for testing locally something like sqlite:///test.db
+works as well as MySQL.
+
+The script should be run on the command line as:
+
+python ingest_server.py [--port PORT] [--db_url URL]
+"""
+from models import *
+from database import shared_database
+from query_profiler import caller
+from record_cache import RecordCache
+from reading_buffer import write_readings, is_row_error
+from telemetry_format import decode_batch
+from flask import Flask, request
+import threading
+import argparse
+import json
+import time
+
+
+class IngestServer(threading.Thread):
+    """Accept uploaded batches of readings and write them to the database.
+
+    Each batch is written in its own transaction. The database picks the
+    ids, so batches from different drones can be written at the same time.
+    """
+
+    def __init__(self, port=5001, db_url=None, database=None):
+        """Construct an instance of IngestServer and start its thread.
+
+        port -- the port to listen on.
+        db_url -- sqlalchemy URL of the database to write to, or None for
+                  the configured one (see database.py).
+        database -- a Database to write to instead of the shared one for
+                    db_url.
+        """
+        super(IngestServer, self).__init__()
+        self.daemon = True
+        self.port = port
+        self.establish_database_connection(db_url, database)
+        self.record_cache = RecordCache(self.scoped_session)
+        # requests are handled on threads of their own, so the totals are
+        # only changed with this held
+        self._stats_lock = threading.Lock()
+        self.written = 0
+        self.skipped = 0
+        self.rejected = 0
+        self.batches = 0
+        self.write_seconds = 0.0
+        self.app = Flask(__name__)
+        self.app.add_url_rule(
+            '/telemetry',
+            'telemetry',
+            self.telemetry_func,
+            methods=['POST'],
+        )
+        self.app.add_url_rule(
+            '/stats',
+            'stats',
+            self.stats_func,
+            methods=['GET'],
+        )
+        self.start()
+
+    def establish_database_connection(self, db_url, database=None):
+        """Use database, or the process's shared connection pool for db_url."""
+        self.database = database or shared_database(db_url)
+        self.engine = self.database.engine
+        self.scoped_session = self.database.scoped_session
+
+    def ingest(self, batch):
+        """Write a decoded batch and return its WriteResult.
+
+        See write_readings in reading_buffer.py.
+        """
+        self.record_cache.refresh_if_stale()
+        start = time.time()
+        with caller('IngestServer.ingest'), \
+                self.engine.begin() as connection:
+            result = write_readings(connection, self.record_cache, batch)
+        with self._stats_lock:
+            self.write_seconds += time.time() - start
+            self.batches += 1
+            self.written += result.written
+            self.skipped += result.skipped
+            self.rejected += len(result.rejected)
+        return result
+
+    def telemetry_func(self):
+        """Decode a binary batch of readings from a drone and store it."""
+        try:
+            batch = decode_batch(request.get_data())
+        except ValueError as e:
+            return json.dumps({'error': str(e)}), 400
+        try:
+            result = self.ingest(batch)
+        except Exception as e:
+            if not is_row_error(e):
+                raise
+            return json.dumps({'error': str(e)}), 422
+        return json.dumps({
+            'written': result.written,
+            'skipped': result.skipped,
+            'rejected': result.rejected,
+        })
+
+    def stats_func(self):
+        """Return the number of batches and readings handled so far."""
+        return json.dumps({
+            'batches': self.batches,
+            'written': self.written,
+            'skipped': self.skipped,
+            'rejected': self.rejected,
+            'write_seconds': self.write_seconds,
+        })
+
+    def run(self):
+        """Start the flask server on all interfaces."""
+        self.app.run('0.0.0.0', port=self.port, threaded=True)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--port', type=int, default=5001)
+    parser.add_argument('--db_url', default=None)
+    args = parser.parse_args()
+
+    server = IngestServer(args.port, args.db_url)
+    # join() with a timeout so Ctrl-C still works
+    while server.is_alive():
+        server.join(1)
@@ -0,0 +1,221 @@
+"""Provide spatial interpolation of scattered readings onto a regular grid.
+
+interpolate:
+    Interpolate readings at (x, y) onto a grid with the chosen method.
+
+grid_axes:
+    Return evenly spaced grid axes covering some points.
+
+RTPlotter.generate_plot used matplotlib.mlab.griddata, which is deprecated,
+re-triangulates every point on each call and segfaults (taking the whole
+process with it, no exception to catch) when it doesn't like the points it's
+given, usually because there are too few of them or they're all in a line.
+Everything here is numpy and scipy, raises ValueError for bad arguments
+rather than crashing, and copes with any number of points, including none.
+
+The methods are:
+
+    'idw'     -- inverse distance weighting of the k nearest readings, found
+                 with a KD-tree. Fast and never overshoots the readings. The
+                 default.
+    'binned'  -- the mean of the readings in each grid cell. The cheapest, and
+                 shows exactly where readings were taken, but leaves the cells
+                 without readings blank.
+    'gp'      -- Gaussian process regression (simple kriging) with a squared
+                 exponential covariance, fitted to at most max_points
+                 readings. Smooth, and fills in between sweeps sensibly, but
+                 costs O(max_points^3) to fit.
+
+Like griddata, the result is a masked array with one row per y and one column
+per x. Cells further than max_distance from any reading are masked, so the
+plot doesn't pretend to know about places the drone never went. With no
+readings everything is masked, and with too few for a Gaussian process it
+falls back to inverse distance weighting.
+
+x and y should be in the same units (meters, say, rather than latitude and
+longitude) since distances are measured in them.
+"""
+import numpy as np
+from scipy.spatial import cKDTree
+
+
+METHODS = ('idw', 'binned', 'gp')
+
+
+def grid_axes(x, y, resolution=100):
+    """Return (xi, yi), resolution evenly spaced values across x and y."""
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    if x.size == 0:
+        return np.zeros(resolution), np.zeros(resolution)
+    return (
+        np.linspace(x.min(), x.max(), resolution),
+        np.linspace(y.min(), y.max(), resolution),
+    )
+
+def interpolate(x, y, z, xi, yi, method='idw', max_distance=None,
+                **options):
+    """Return readings z at (x, y) interpolated onto the grid xi by yi.
+
+    x, y, z -- arrays with one entry per reading. Readings with a nan
+               anywhere are ignored.
+    xi, yi -- 1d arrays of the grid's x and y values.
+    method -- one of METHODS, see the module docstring.
+    max_distance -- mask grid points further than this from any reading.
+                    None picks a few times the typical spacing of the
+                    readings.
+    options -- passed on to the method: k and power for 'idw', max_points,
+               length_scale and noise for 'gp'.
+
+    Returns a masked array of shape (len(yi), len(xi)).
+    """
+    if method not in METHODS:
+        raise ValueError("unknown interpolation method {0!r}".format(method))
+    x, y, z = _finite(x, y, z)
+    xi = np.asarray(xi, dtype=float)
+    yi = np.asarray(yi, dtype=float)
+    if xi.ndim != 1 or yi.ndim != 1:
+        raise ValueError("xi and yi should be 1d arrays")
+    shape = (yi.size, xi.size)
+    if x.size == 0:
+        return np.ma.masked_all(shape)
+    points = np.column_stack((x, y))
+    tree = cKDTree(points)
+    grid_x, grid_y = np.meshgrid(xi, yi)
+    grid = np.column_stack((grid_x.ravel(), grid_y.ravel()))
+    if max_distance is None:
+        max_distance = _default_max_distance(tree, points, xi, yi)
+    nearest, _ = tree.query(grid, k=1)
+    too_far = (nearest > max_distance).reshape(shape)
+
+    if method == 'binned':
+        zi = _binned(x, y, z, xi, yi)
+    elif method == 'gp' and x.size >= 3:
+        try:
+            zi = _gaussian_process(points, z, grid, **options)
+        except np.linalg.LinAlgError:
+            zi = _idw(tree, z, grid, **_idw_options(options))
+        zi = zi.reshape(shape)
+    else:
+        zi = _idw(tree, z, grid, **_idw_options(options)).reshape(shape)
+    return np.ma.masked_array(zi, mask=too_far | ~np.isfinite(zi))
+
+def _finite(x, y, z):
+    """Return x, y and z as float arrays without the readings with nans."""
+    x = np.asarray(x, dtype=float).ravel()
+    y = np.asarray(y, dtype=float).ravel()
+    z = np.asarray(z, dtype=float).ravel()
+    if not x.size == y.size == z.size:
+        raise ValueError("x, y and z should be the same length")
+    keep = np.isfinite(x) & np.isfinite(y) & np.isfinite(z)
+    return x[keep], y[keep], z[keep]
+
+def _default_max_distance(tree, points, xi, yi):
+    """Return a masking distance from the spacing of points and the grid."""
+    cell = max(
+        np.ptp(xi) / max(xi.size - 1, 1),
+        np.ptp(yi) / max(yi.size - 1, 1),
+    )
+    if len(points) < 2:
+        spacing = 0.0
+    else:
+        distances, _ = tree.query(points, k=2)
+        spacing = np.median(distances[:, 1])
+    # a lone reading (or a pile on one spot) still gets a blob around it
+    return max(4 * spacing, 2 * cell) or 1.0
+
+def _idw_options(options):
+    """Return the options that apply to _idw."""
+    return dict(
+        (name, value) for name, value in options.items()
+        if name in ('k', 'power')
+    )
+
+def _idw(tree, z, grid, k=8, power=2.0):
+    """Return the inverse distance weighted mean of the k nearest readings."""
+    k = min(k, tree.n)
+    distances, indices = tree.query(grid, k=k)
+    if k == 1:
+        distances = distances[:, np.newaxis]
+        indices = indices[:, np.newaxis]
+    exact = distances[:, 0] == 0
+    # exact hits would divide by zero, they get the reading's value below
+    weights = 1.0 / np.where(exact[:, np.newaxis], 1.0, distances) ** power
+    zi = (weights * z[indices]).sum(axis=1) / weights.sum(axis=1)
+    zi[exact] = z[indices[exact, 0]]
+    return zi
+
+def _binned(x, y, z, xi, yi):
+    """Return the mean of the readings in each grid cell, nan if empty.
+
+    Each grid point is the center of a cell, with edges halfway to the
+    neighboring grid points.
+    """
+    column = _bin_index(x, xi)
+    row = _bin_index(y, yi)
+    cell = row * xi.size + column
+    size = yi.size * xi.size
+    counts = np.bincount(cell, minlength=size)
+    sums = np.bincount(cell, weights=z, minlength=size)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        means = sums / counts
+    return means.reshape(yi.size, xi.size)
+
+def _bin_index(values, centers):
+    """Return the index of the grid cell centered nearest each value."""
+    if centers.size == 1:
+        return np.zeros(values.size, dtype=int)
+    edges = (centers[1:] + centers[:-1]) / 2
+    return np.searchsorted(edges, values)
+
+def _gaussian_process(points, z, grid, max_points=400, length_scale=None,
+                      noise=0.1, seed=0):
+    """Return the Gaussian process posterior mean at the grid points.
+
+    points, z -- the readings.
+    max_points -- fit to a random subsample of at most this many readings.
+    length_scale -- distance over which readings are correlated, or None for
+                    a few times the typical spacing of the readings.
+    noise -- measurement noise as a fraction of the readings' spread.
+    seed -- random seed for the subsample, so replotting the same readings
+            gives the same picture.
+    """
+    if len(points) > max_points:
+        keep = np.random.RandomState(seed).choice(
+            len(points),
+            max_points,
+            replace=False,
+        )
+        points = points[keep]
+        z = z[keep]
+    mean = z.mean()
+    spread = z.std() or 1.0
+    if length_scale is None:
+        distances, _ = cKDTree(points).query(points, k=2)
+        length_scale = 3 * np.median(distances[:, 1]) or 1.0
+    covariance = _squared_exponential(points, points, length_scale)
+    covariance[np.diag_indices_from(covariance)] += noise ** 2 + 1e-9
+    factor = np.linalg.cholesky(covariance)
+    alpha = np.linalg.solve(
+        factor.T,
+        np.linalg.solve(factor, (z - mean) / spread),
+    )
+    zi = np.empty(len(grid))
+    # the grid-to-readings covariance is done in chunks so a big grid
+    # doesn't need one enormous matrix
+    for start in xrange(0, len(grid), 4096):
+        chunk = grid[start:start + 4096]
+        zi[start:start + 4096] = _squared_exponential(
+            chunk,
+            points,
+            length_scale,
+        ).dot(alpha)
+    return mean + spread * zi
+
+def _squared_exponential(a, b, length_scale):
+    """Return the squared exponential covariance between points a and b."""
+    squared = (
+        (a[:, np.newaxis, 0] - b[np.newaxis, :, 0]) ** 2 +
+        (a[:, np.newaxis, 1] - b[np.newaxis, :, 1]) ** 2
+    )
+    return np.exp(-squared / (2 * length_scale ** 2))
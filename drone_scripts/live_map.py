@@ -0,0 +1,316 @@
+"""Provide an incrementally updated map of readings for live plotting.
+
+RunningGrid:
+    Running inverse distance weighted average of readings on a metric grid.
+
+LiveMap:
+    Matplotlib figure that draws a RunningGrid and the drone's track, and
+    redraws only what changed.
+
+RTPlotter used to re-grid every reading of the mission with griddata and
+rebuild the whole figure (contours, colorbar and all) every half second, so
+each frame took longer than the last. Here each new reading is added into a
+fixed grid of cells, east and north of the first reading in meters: every
+cell within radius meters of it gets the reading's value added to a weighted
+sum, weighted by inverse distance, and its displayed value is the weighted
+sum over the total weight. Only those cells are recomputed, so the cost of an
+update depends on the number of new readings, not on how many came before.
+Cells no reading has reached yet are left blank.
+
+The figure is drawn with blitting: the axes, ticks and colorbar are drawn
+once and saved, and each update only redraws the grid image and the track on
+top of the saved background. The whole figure is only redrawn when it has to
+change, which is when the grid grows to fit readings outside it, or when a
+reading falls outside the colorbar's range.
+"""
+import numpy as np
+import matplotlib.pyplot as plt
+from nav_utils import global_to_ned
+
+
+class RunningGrid(object):
+    """Keep a running inverse distance weighted average of readings.
+
+    The grid starts out empty and centered on the first reading, and grows
+    (by at least half its current size, so it doesn't have to grow often) to
+    fit readings that land near or past its edges.
+    """
+
+    def __init__(self, cell_size=1.0, radius=3.0, power=2.0, size=64):
+        """Construct an instance of RunningGrid.
+
+        cell_size -- width and height of each cell in meters.
+        radius -- how far from a reading, in meters, it affects cells.
+        power -- inverse distance weighting power, higher is more local.
+        size -- number of cells along each side to start with.
+        """
+        self.cell_size = float(cell_size)
+        self.radius = float(radius)
+        self.power = power
+        self._initial_size = size
+        self.home = None
+        self.origin = None
+        self._sum = None
+        self._weight = None
+        self.values = None
+        # offsets (in cells) of the cells that can be within radius of a
+        # reading somewhere in the cell at (0, 0)
+        reach = int(np.ceil(self.radius / self.cell_size)) + 1
+        rows, cols = np.mgrid[-reach:reach + 1, -reach:reach + 1]
+        self._kernel_rows = rows.ravel()
+        self._kernel_cols = cols.ravel()
+        # where the reading's own cell, offset (0, 0), is in the kernel
+        self._kernel_own = np.flatnonzero(
+            (self._kernel_rows == 0) & (self._kernel_cols == 0)
+        )[0]
+        self._reach = reach
+
+    def to_ned(self, lat, lon):
+        """Return (north, east) in meters from the grid's home."""
+        return global_to_ned(self.home[0], self.home[1], lat, lon)
+
+    def extent(self):
+        """Return the grid's (west, east, south, north) edges in meters."""
+        rows, cols = self.values.shape
+        return (
+            self.origin[1],
+            self.origin[1] + cols * self.cell_size,
+            self.origin[0],
+            self.origin[0] + rows * self.cell_size,
+        )
+
+    def add(self, lat, lon, value):
+        """Add readings to the grid.
+
+        lat, lon, value -- arrays with one entry per reading.
+
+        Returns (touched, grew), where touched is the (row_start, row_stop,
+        col_start, col_stop) of the block of cells that changed (or None if
+        nothing did), and grew is True if the grid had to be made bigger.
+        """
+        lat = np.asarray(lat, dtype=float)
+        lon = np.asarray(lon, dtype=float)
+        value = np.asarray(value, dtype=float)
+        if lat.size == 0:
+            return None, False
+        grew = False
+        if self.home is None:
+            self.start(lat[0], lon[0])
+            grew = True
+        north, east = self.to_ned(lat, lon)
+        grew |= self.fit(north, east)
+
+        # the cell each reading is in, then every cell around it that could
+        # be within radius, as one (readings x kernel) block
+        row = np.floor((north - self.origin[0]) / self.cell_size).astype(int)
+        col = np.floor((east - self.origin[1]) / self.cell_size).astype(int)
+        rows = row[:, np.newaxis] + self._kernel_rows
+        cols = col[:, np.newaxis] + self._kernel_cols
+        centre_north = self.origin[0] + (rows + 0.5) * self.cell_size
+        centre_east = self.origin[1] + (cols + 0.5) * self.cell_size
+        distance = np.hypot(
+            centre_north - north[:, np.newaxis],
+            centre_east - east[:, np.newaxis],
+        )
+        near = distance <= self.radius
+        # a reading always counts in its own cell, even if radius is too
+        # small to reach that cell's centre
+        near[:, self._kernel_own] = True
+        # nothing is nearer than half a cell, so one reading can't swamp
+        # its cell with an enormous weight
+        weight = np.maximum(distance, self.cell_size / 2) ** -self.power
+        weight = weight[near]
+        rows = rows[near]
+        cols = cols[near]
+        np.add.at(
+            self._sum,
+            (rows, cols),
+            weight * np.broadcast_to(value[:, np.newaxis], near.shape)[near],
+        )
+        np.add.at(self._weight, (rows, cols), weight)
+
+        touched = (rows.min(), rows.max() + 1, cols.min(), cols.max() + 1)
+        block = (slice(touched[0], touched[1]), slice(touched[2], touched[3]))
+        weights = self._weight[block]
+        self.values[block] = np.where(
+            weights > 0,
+            self._sum[block] / np.where(weights > 0, weights, 1),
+            np.nan,
+        )
+        return touched, grew
+
+    def start(self, lat, lon):
+        """Center an empty grid on lat, lon, which becomes its home."""
+        self.home = (lat, lon)
+        half = self._initial_size * self.cell_size / 2
+        self.origin = (-half, -half)
+        shape = (self._initial_size, self._initial_size)
+        self._sum = np.zeros(shape)
+        self._weight = np.zeros(shape)
+        self.values = np.full(shape, np.nan)
+
+    def fit(self, north, east):
+        """Grow the grid to fit points at north, east, return if it grew."""
+        margin = (self._reach + 1) * self.cell_size
+        west_edge, east_edge, south_edge, north_edge = self.extent()
+        rows, cols = self.values.shape
+        pad = [0, 0, 0, 0]  # south, north, west, east, in cells
+        for side, needed, current in (
+            (0, south_edge - (north.min() - margin), rows),
+            (1, (north.max() + margin) - north_edge, rows),
+            (2, west_edge - (east.min() - margin), cols),
+            (3, (east.max() + margin) - east_edge, cols),
+        ):
+            if needed > 0:
+                pad[side] = max(
+                    int(np.ceil(needed / self.cell_size)),
+                    current // 2,
+                )
+        if not any(pad):
+            return False
+        widths = ((pad[0], pad[1]), (pad[2], pad[3]))
+        self._sum = np.pad(self._sum, widths, 'constant')
+        self._weight = np.pad(self._weight, widths, 'constant')
+        self.values = np.pad(
+            self.values,
+            widths,
+            'constant',
+            constant_values=np.nan,
+        )
+        self.origin = (
+            self.origin[0] - pad[0] * self.cell_size,
+            self.origin[1] - pad[2] * self.cell_size,
+        )
+        return True
+
+
+class LiveMap(object):
+    """Draw a RunningGrid and a drone's track, redrawing only what changed.
+
+    update() takes only the new readings and positions each time. The image,
+    track and current position are animated artists, drawn with blitting
+    over a saved background of everything else.
+    """
+
+    def __init__(self, title=None, cell_size=1.0, radius=3.0,
+                 cmap=plt.cm.jet):
+        """Construct an instance of LiveMap and open its figure.
+
+        title -- the figure's title.
+        cell_size, radius -- see RunningGrid.
+        cmap -- matplotlib colormap for the readings.
+        """
+        self.grid = RunningGrid(cell_size, radius)
+        self.figure, self.axes = plt.subplots()
+        self.canvas = self.figure.canvas
+        if title:
+            self.axes.set_title(title)
+        self.axes.set_xlabel('east (m)')
+        self.axes.set_ylabel('north (m)')
+        self.axes.set_aspect('equal')
+        cmap = plt.get_cmap(cmap)
+        self.image = self.axes.imshow(
+            np.full((1, 1), np.nan),
+            origin='lower',
+            cmap=cmap,
+            interpolation='nearest',
+            animated=True,
+        )
+        self.image.set_clim(0, 1)
+        self.colorbar = self.figure.colorbar(self.image)
+        self.track, = self.axes.plot([], [], '-m', lw=3, animated=True)
+        self.position, = self.axes.plot([], [], 'ok', ms=8, animated=True)
+        self._track = np.empty((0, 2))
+        self._limits = None
+        self._background = None
+        self._stale = True
+        self.canvas.mpl_connect('draw_event', self._save_background)
+
+    def update(self, lat, lon, value, track_lat=(), track_lon=()):
+        """Add new readings and track positions to the map and redraw it.
+
+        lat, lon, value -- arrays of the new readings.
+        track_lat, track_lon -- arrays of the drone's new positions.
+        """
+        grew = False
+        if self.grid.home is None and len(track_lat):
+            # the track can start before the first reading
+            self.grid.start(track_lat[0], track_lon[0])
+            grew = True
+        if len(track_lat):
+            # grow the grid to fit the track before adding readings, so the
+            # touched cells add() returns stay where they are
+            north, east = self.grid.to_ned(track_lat, track_lon)
+            grew |= self.grid.fit(north, east)
+            self._track = np.concatenate(
+                (self._track, np.column_stack((east, north)))
+            )
+            self.track.set_data(self._track[:, 0], self._track[:, 1])
+            self.position.set_data(self._track[-1:, 0], self._track[-1:, 1])
+        touched, added_grew = self.grid.add(lat, lon, value)
+        grew |= added_grew
+        if self.grid.home is None:
+            return
+        if grew:
+            self.image.set_data(self.grid.values)
+            self.image.set_extent(self.grid.extent())
+            west, east, south, north = self.grid.extent()
+            self.axes.set_xlim(west, east)
+            self.axes.set_ylim(south, north)
+            self._stale = True
+        elif touched is not None:
+            # copy just the touched cells into the image's own array
+            block = (
+                slice(touched[0], touched[1]),
+                slice(touched[2], touched[3]),
+            )
+            self.image.get_array()[block] = np.ma.masked_invalid(
+                self.grid.values[block]
+            )
+            self.image.changed()
+        if touched is not None:
+            self._update_limits(touched)
+        self.draw()
+
+    def _update_limits(self, touched):
+        """Widen the color scale if the touched cells fall outside it."""
+        block = self.grid.values[touched[0]:touched[1], touched[2]:touched[3]]
+        block = block[np.isfinite(block)]
+        if block.size == 0:
+            return
+        low, high = block.min(), block.max()
+        if self._limits is not None:
+            if low >= self._limits[0] and high <= self._limits[1]:
+                return
+            low = min(low, self._limits[0])
+            high = max(high, self._limits[1])
+        # leave some room so the scale (and so the colorbar, which means a
+        # full redraw) doesn't have to change for every new high reading
+        room = 0.1 * (high - low) or 1.0
+        self._limits = (low - room, high + room)
+        self.image.set_clim(*self._limits)
+        self._stale = True
+
+    def _save_background(self, event):
+        """Keep a copy of the figure without the animated artists."""
+        self._background = self.canvas.copy_from_bbox(self.axes.bbox)
+
+    def draw(self):
+        """Draw the animated artists, redrawing everything else if needed."""
+        if self._stale or self._background is None:
+            self.canvas.draw()
+            self._stale = False
+        else:
+            self.canvas.restore_region(self._background)
+        for artist in (self.image, self.track, self.position):
+            self.axes.draw_artist(artist)
+        self.canvas.blit(self.axes.bbox)
+
+    def pause(self, interval):
+        """Handle GUI events for interval seconds without redrawing.
+
+        plt.pause would redraw the whole figure, which is what blitting is
+        there to avoid.
+        """
+        self.canvas.flush_events()
+        self.canvas.start_event_loop(interval)
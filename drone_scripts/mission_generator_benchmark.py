@@ -0,0 +1,88 @@
+"""
+Time how long MissionGenerator takes to build large survey missions.
+
+Filled box missions have about two waypoints per meter of height, so a box a
+few kilometers tall is a survey grid of 10,000+ waypoints. This builds boxes
+and circles of increasing size and prints how long generating the points (and
+the whole mission dictionary) takes. With --compare it also times the old way
+of building the box path, which grew the array with np.vstack once per sweep
+and so copied the whole path every time, to show the difference.
+
+The script should be run on the command line as:
+
+python mission_generator_benchmark.py [--compare] [--repeat N]
+"""
+from MissionGenerator import MissionGenerator
+import numpy as np
+import argparse
+import math
+import time
+
+
+def vstack_box_path(height, width, altitude):
+    """Build a filled box path one sweep at a time, the way it used to be."""
+    W_max = -width
+    path = np.vstack((np.array([0, 0, altitude]),
+                      np.array([0, W_max, altitude])))
+    for N_i in range(2, height, 2):
+        path = np.vstack((path,
+                          np.array([N_i - 1, W_max, altitude]),
+                          np.array([N_i - 1, 0, altitude]),
+                          np.array([N_i, 0, altitude]),
+                          np.array([N_i, W_max, altitude])))
+    return path
+
+def best_time(function, repeat):
+    """Return the fastest of repeat runs of function, in seconds."""
+    times = []
+    for _ in range(repeat):
+        start = time.time()
+        function()
+        times.append(time.time() - start)
+    return min(times)
+
+def benchmark(compare, repeat):
+    """Print generation times for box and circle missions of growing size."""
+    generator = MissionGenerator()
+    print '{0:>8} {1:>8} {2:>10} {3:>12}'.format(
+        'shape', 'points', 'mission s', 'vstack s'
+    )
+    for height in (500, 1000, 2500, 5000, 10000):
+        config = generator.create_config_dict(
+            'box', height, 50, 0, 0, 5, True, np.array([0, 0]),
+        )
+        points = len(generator.createMission(dict(config))['points']) - 1
+        mission_time = best_time(
+            lambda: generator.createMission(dict(config)),
+            repeat,
+        )
+        if compare:
+            vstack_time = '{0:12.4f}'.format(best_time(
+                lambda: vstack_box_path(height, 50, 5),
+                repeat,
+            ))
+        else:
+            vstack_time = '{0:>12}'.format('-')
+        print '{0:>8} {1:8d} {2:10.4f} {3}'.format(
+            'box', points, mission_time, vstack_time
+        )
+    for radius in (500, 2000, 5000):
+        config = generator.create_config_dict(
+            'circle', 0, 0, 0, radius, 5, False, np.array([0, 0]),
+        )
+        points = int(math.floor(2*radius*math.pi / 2)) + 1
+        mission_time = best_time(
+            lambda: generator.createMission(dict(config)),
+            repeat,
+        )
+        print '{0:>8} {1:8d} {2:10.4f} {3:>12}'.format(
+            'circle', points, mission_time, '-'
+        )
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--compare', action='store_true')
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+    benchmark(args.compare, args.repeat)
@@ -0,0 +1,259 @@
+"""Provide per-statement timing of the queries sent to the mission database.
+
+QueryProfiler:
+    Records latency histograms, row counts and call counts per statement.
+
+caller / current_caller:
+    Tag the statements run by a block of code with the name of its caller.
+
+The timings Database.scoped_session keeps cover a whole session, python and
+all. A QueryProfiler listens to the engine's before_cursor_execute and
+after_cursor_execute events instead, so it sees every statement that's sent
+to the database and how long the database took to answer it, whichever
+session or connection it came from.
+
+Each statement is filed under the caller that was current in the thread
+that ran it. Database.scoped_session(name) makes name the caller for the
+statements in the session, so everything run through IncrementalReader is
+filed under its consumer (like 'DroneCoordinator.get_data'), and code that
+uses a connection directly can tag itself with caller(). Statements run
+outside any of those are filed under None.
+
+Profiling is off unless it's turned on with Database.enable_profiling or the
+MISSION_DB_PROFILE environment variable (see database.py), and then the
+report is written to stderr when the program exits and whenever it gets
+SIGUSR1:
+
+    kill -USR1 <pid of base_station.py>
+
+Rows are counted with the DBAPI cursor's rowcount. For MySQL that's the
+number of rows a SELECT returned, but SQLite doesn't know that until the rows
+have been fetched, so with SQLite only inserts, updates and deletes have row
+counts.
+"""
+import threading
+import bisect
+import time
+import sys
+import re
+from contextlib import contextmanager
+from sqlalchemy import event
+
+
+# upper bounds of the latency histogram buckets, in milliseconds
+BUCKETS_MS = [
+    0.1, 0.25, 0.5,
+    1, 2.5, 5,
+    10, 25, 50,
+    100, 250, 500,
+    1000, 2500, 5000,
+    float('inf'),
+]
+
+_local = threading.local()
+
+
+def current_caller():
+    """Return the name of the innermost caller() block in this thread."""
+    stack = getattr(_local, 'callers', None)
+    return stack[-1] if stack else None
+
+@contextmanager
+def caller(name):
+    """File the statements run in this block (in this thread) under name."""
+    stack = getattr(_local, 'callers', None)
+    if stack is None:
+        stack = _local.callers = []
+    stack.append(name)
+    try:
+        yield
+    finally:
+        stack.pop()
+
+def _statement_key(statement):
+    """Return statement with its whitespace collapsed, to group it by."""
+    return re.sub(r'\s+', ' ', statement).strip()
+
+
+class StatementStats(object):
+    """Count, total and histogram of the latencies of one statement."""
+
+    def __init__(self):
+        """Construct an instance of StatementStats with nothing recorded."""
+        self.calls = 0
+        self.rows = 0
+        self.total = 0.0
+        self.longest = 0.0
+        self.histogram = [0] * len(BUCKETS_MS)
+
+    def add(self, seconds, rows):
+        """Record one execution that took seconds and affected rows rows."""
+        self.calls += 1
+        if rows > 0:
+            self.rows += rows
+        self.total += seconds
+        self.longest = max(self.longest, seconds)
+        self.histogram[bisect.bisect_left(BUCKETS_MS, seconds * 1000.0)] += 1
+
+    def percentile(self, fraction):
+        """Return the bucket bound in ms that fraction of calls fall under."""
+        needed = fraction * self.calls
+        seen = 0
+        for bound, count in zip(BUCKETS_MS, self.histogram):
+            seen += count
+            if count and seen >= needed:
+                return min(bound, self.longest * 1000.0)
+        return self.longest * 1000.0
+
+    def as_dict(self):
+        """Return the stats as a dictionary, e.g. for a JSON response."""
+        return {
+            'calls': self.calls,
+            'rows': self.rows,
+            'total_seconds': self.total,
+            'max_ms': self.longest * 1000.0,
+            'p50_ms': self.percentile(0.5),
+            'p95_ms': self.percentile(0.95),
+            'histogram': dict(
+                (str(bound), count)
+                for bound, count in zip(BUCKETS_MS, self.histogram)
+                if count
+            ),
+        }
+
+
+class QueryProfiler(object):
+    """Time every statement an engine runs, filed by caller and statement.
+
+    Adding a profiler to an engine costs two dictionary updates and a lock
+    per statement, which is small next to a round trip to MySQL but not
+    nothing, so it's meant to be turned on when looking for a problem.
+    """
+
+    def __init__(self, engine):
+        """Construct an instance of QueryProfiler and start listening.
+
+        engine -- the sqlalchemy engine to profile.
+        """
+        self.engine = engine
+        self._lock = threading.Lock()
+        self._stats = {}
+        self.started = time.time()
+        event.listen(engine, 'before_cursor_execute', self._before_execute)
+        event.listen(engine, 'after_cursor_execute', self._after_execute)
+
+    def remove(self):
+        """Stop listening to the engine."""
+        event.remove(
+            self.engine,
+            'before_cursor_execute',
+            self._before_execute,
+        )
+        event.remove(
+            self.engine,
+            'after_cursor_execute',
+            self._after_execute,
+        )
+
+    def _before_execute(self, conn, cursor, statement, parameters, context,
+                        executemany):
+        """Note when the statement was sent."""
+        conn.info.setdefault('query_start', []).append(time.time())
+
+    def _after_execute(self, conn, cursor, statement, parameters, context,
+                       executemany):
+        """Add the statement's time and row count to its caller's stats."""
+        seconds = time.time() - conn.info['query_start'].pop()
+        key = (current_caller(), _statement_key(statement))
+        with self._lock:
+            stats = self._stats.get(key)
+            if stats is None:
+                stats = self._stats[key] = StatementStats()
+            stats.add(seconds, cursor.rowcount)
+
+    def reset(self):
+        """Forget everything recorded so far."""
+        with self._lock:
+            self._stats = {}
+            self.started = time.time()
+
+    def stats(self):
+        """Return {(caller, statement): StatementStats} recorded so far."""
+        with self._lock:
+            return dict(self._stats)
+
+    def caller_totals(self):
+        """Return {caller: (calls, rows, total seconds)}."""
+        totals = {}
+        for (name, _), stats in self.stats().items():
+            calls, rows, total = totals.get(name, (0, 0, 0.0))
+            totals[name] = (
+                calls + stats.calls,
+                rows + stats.rows,
+                total + stats.total,
+            )
+        return totals
+
+    def as_dict(self):
+        """Return everything recorded, grouped by caller, as a dictionary."""
+        callers = {}
+        for (name, statement), stats in self.stats().items():
+            callers.setdefault(str(name), {})[statement] = stats.as_dict()
+        return {
+            'seconds': time.time() - self.started,
+            'callers': callers,
+        }
+
+    def report(self, statement_width=60):
+        """Return what's been recorded as text, slowest in total first.
+
+        Callers come first, with the time their statements took between
+        them, then each statement on its own line with its latency
+        percentiles.
+        """
+        elapsed = time.time() - self.started
+        lines = [
+            'Database time by caller over {0:.1f}s:'.format(elapsed),
+            '{0:<40} {1:>8} {2:>8} {3:>10} {4:>7}'.format(
+                'caller', 'calls', 'rows', 'total s', 'busy %'
+            ),
+        ]
+        totals = sorted(
+            self.caller_totals().items(),
+            key=lambda item: item[1][2],
+            reverse=True,
+        )
+        for name, (calls, rows, total) in totals:
+            lines.append('{0:<40} {1:>8} {2:>8} {3:>10.3f} {4:>7.1f}'.format(
+                name, calls, rows, total, 100.0 * total / max(elapsed, 1e-9)
+            ))
+        lines.append('')
+        lines.append('Statements:')
+        row = '{0:<30} {1:>7} {2:>8} {3:>9} {4:>8} {5:>8} {6:>8}  {7}'
+        lines.append(row.format(
+            'caller', 'calls', 'rows', 'total s', 'p50 ms', 'p95 ms',
+            'max ms', 'statement',
+        ))
+        statements = sorted(
+            self.stats().items(),
+            key=lambda item: item[1].total,
+            reverse=True,
+        )
+        for (name, statement), stats in statements:
+            lines.append(row.format(
+                str(name)[:30],
+                stats.calls,
+                stats.rows,
+                '{0:.3f}'.format(stats.total),
+                '{0:.2f}'.format(stats.percentile(0.5)),
+                '{0:.2f}'.format(stats.percentile(0.95)),
+                '{0:.2f}'.format(stats.longest * 1000.0),
+                statement[:statement_width],
+            ))
+        return '\n'.join(lines)
+
+    def dump(self, stream=None):
+        """Write the report to stream (stderr by default)."""
+        stream = stream or sys.stderr
+        stream.write(self.report() + '\n')
+        stream.flush()
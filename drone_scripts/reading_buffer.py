@@ -0,0 +1,200 @@
+"""Provide bulk writes of sensor readings to the database.
+
+is_row_error:
+    Return True if an exception is down to the rows being written.
+
+write_readings:
+    Write a batch of readings with a few multi-row INSERTs (used by the
+    spool and the ingest server).
+
+Committing every reading on its own means one transaction (and a handful of
+round trips over the WiFi link) per reading, per drone. With several drones
+logging into the base station at once that's where most of the write latency
+and lock contention comes from. Instead the readings are collected (in the
+drone's spool, see reading_spool.py) and written out in a single
+transaction, with the rows for each table inserted together.
+
+Inserting rows together means the database can't hand back each row's id as
+it goes, and every reading needs the id of its Event (and the rows of its own
+table the id of its sensor_reads row). So each reading and its event get a
+unique upload_key, the rows of a table are inserted with one INSERT ... VALUES
+(...), (...), ... per chunk, and then the ids the database picked are read
+back by upload_key. The database's autoincrement picks every id, so anything
+else writing to the same tables at the same time (a drone that isn't using
+the ingest server, say) can't collide with a batch.
+
+A reading that can't be written is kept out of the way of the others. One
+whose mission drone sensor or event type isn't in the database (yet) is left
+out of the insert and reported as rejected, see write_readings. A batch that
+fails in a way that's down to its rows (see is_row_error) can be split up to
+find the rows that fail on their own, which is what the SpoolUploader does.
+Any other failure (the database being unreachable, say) means the same rows
+might well be written later.
+"""
+import uuid
+from collections import namedtuple
+from sqlalchemy import select
+from sqlalchemy.exc import (
+    IntegrityError,
+    DataError,
+    StatementError,
+    DBAPIError,
+)
+from models import *
+
+
+# exceptions that mean something is wrong with rows of a batch rather than
+# with the database or the connection to it, so retrying the same rows won't
+# help
+ROW_ERRORS = (IntegrityError, DataError, KeyError, ValueError, TypeError)
+
+# rows per INSERT, small enough to stay well inside SQLite's limit on the
+# number of parameters in a statement
+INSERT_CHUNK = 200
+
+WriteResult = namedtuple('WriteResult', ['written', 'skipped', 'rejected'])
+
+
+def is_row_error(error):
+    """Return True if error is down to the rows being written.
+
+    Those are ROW_ERRORS, and values a column's type can't take, which fail
+    before anything is sent and come back as a bare StatementError. A
+    DBAPIError that isn't one of ROW_ERRORS (like an OperationalError) is
+    down to the database, and the same rows might well be written later.
+    """
+    if isinstance(error, ROW_ERRORS):
+        return True
+    return (
+        isinstance(error, StatementError) and
+        not isinstance(error, DBAPIError)
+    )
+
+def _chunks(rows):
+    """Yield rows INSERT_CHUNK at a time."""
+    for start in xrange(0, len(rows), INSERT_CHUNK):
+        yield rows[start:start + INSERT_CHUNK]
+
+def _ids_by_key(connection, table, keys):
+    """Return {upload_key: id} for the rows of table with the given keys."""
+    ids = {}
+    for chunk in _chunks(keys):
+        ids.update(
+            (key, row_id) for row_id, key in connection.execute(
+                select([table.c.id, table.c.upload_key]).where(
+                    table.c.upload_key.in_(chunk),
+                )
+            )
+        )
+    return ids
+
+def _insert(connection, table, rows):
+    """Insert rows into table with multi-row INSERTs."""
+    for chunk in _chunks(rows):
+        connection.execute(table.insert().values(chunk))
+
+def _resolve(record_cache, reading_class, event_type, columns):
+    """Return the record ids a reading needs, see write_readings.
+
+    Raises KeyError if any of them aren't in the database.
+    """
+    ids = {'event_type_id': record_cache.event_type_id(event_type)}
+    if reading_class is Event:
+        return ids
+    mds_id = columns.get('mission_drone_sensor_id')
+    if mds_id is None:
+        mds_id = record_cache.mission_drone_sensor_id(
+            *columns['mission_drone_sensor']
+        )
+    ids['mission_drone_sensor_id'] = mds_id
+    ids['mission_id'], ids['drone_id'] = record_cache.mission_drone_ids(mds_id)
+    return ids
+
+def write_readings(connection, record_cache, batch):
+    """Add a batch of readings with a few multi-row INSERTs.
+
+    connection -- a sqlalchemy Connection or Session to write with, inside a
+                  transaction.
+    record_cache -- a RecordCache to look up ids in.
+    batch -- a list of (reading_class, event_type, columns) tuples, like the
+             arguments to SpoolUploader.put.
+
+    Every reading gets its own Event, same as when readings were written one
+    at a time. A reading's mission drone sensor is either its columns'
+    mission_drone_sensor_id, or looked up from the (drone, mission, sensor)
+    names in its columns' mission_drone_sensor, and its mission_id and
+    drone_id are filled in from that. reading_class can also be Event, for an
+    event on its own with the event_data in columns.
+
+    Readings (and events) with an upload_key that's already in the database
+    (because the batch is being sent again) are skipped. Readings whose event
+    type or mission drone sensor isn't in the database are rejected and not
+    written, so the rest of the batch can be.
+
+    Returns a WriteResult of the number of readings written and skipped, and
+    a list of (index in batch, reason) for the rejected ones.
+    """
+    events = Event.__table__
+    reads = SensorRead.__table__
+    rejected = []
+    resolved = []
+    for index, (reading_class, event_type, columns) in enumerate(batch):
+        try:
+            ids = _resolve(record_cache, reading_class, event_type, columns)
+        except KeyError as e:
+            rejected.append((index, 'unknown record {0}'.format(e)))
+            continue
+        upload_key = columns.get('upload_key') or uuid.uuid4().hex
+        resolved.append((reading_class, columns, ids, upload_key))
+
+    keys = [upload_key for _, _, _, upload_key in resolved]
+    already_written = set(_ids_by_key(connection, events, keys))
+    already_written.update(_ids_by_key(connection, reads, keys))
+    new = [item for item in resolved if item[3] not in already_written]
+    skipped = len(resolved) - len(new)
+    if not new:
+        return WriteResult(0, skipped, rejected)
+
+    _insert(connection, events, [
+        {
+            'event_type_id': ids['event_type_id'],
+            'event_data': columns.get('event_data', {}),
+            'upload_key': upload_key,
+        }
+        for _, columns, ids, upload_key in new
+    ])
+    event_ids = _ids_by_key(connection, events, [item[3] for item in new])
+
+    readings = [item for item in new if item[0] is not Event]
+    read_rows = []
+    for reading_class, columns, ids, upload_key in readings:
+        # a multi-row INSERT needs every row to have the same keys
+        row = dict((column.name, None) for column in reads.columns)
+        del row['id']
+        row.update(
+            (name, value)
+            for name, value in columns.iteritems()
+            if name in row
+        )
+        row['mission_drone_sensor_id'] = ids['mission_drone_sensor_id']
+        row['mission_id'] = ids['mission_id']
+        row['drone_id'] = ids['drone_id']
+        row['event_id'] = event_ids[upload_key]
+        row['upload_key'] = upload_key
+        row['data_type'] = reading_class.__mapper__.polymorphic_identity
+        read_rows.append(row)
+    _insert(connection, reads, read_rows)
+    read_ids = _ids_by_key(connection, reads, [item[3] for item in readings])
+
+    class_rows = {}
+    for reading_class, columns, _, upload_key in readings:
+        table = reading_class.__table__
+        row = dict(
+            (column.name, columns.get(column.name))
+            for column in table.columns
+        )
+        row['id'] = read_ids[upload_key]
+        class_rows.setdefault(table, []).append(row)
+    for table, rows in class_rows.iteritems():
+        _insert(connection, table, rows)
+    return WriteResult(len(new), skipped, rejected)
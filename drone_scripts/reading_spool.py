@@ -0,0 +1,414 @@
+"""Provide an on-drone spool that keeps readings until they're uploaded.
+
+ReadingSpool:
+    Append-only store of readings in a local SQLite file.
+
+SpoolUploader:
+    Daemon thread that spools readings and uploads them in batches.
+
+Readings kept in memory are gone if the WiFi link to the base station
+drops for longer than the memory can hold them, or the drone is rebooted.
+With the spool every reading is written to a SQLite database on the drone's
+own SD card first, which doesn't depend on the link at all, and the
+SpoolUploader copies them to the base station database in batches, deleting
+them from the spool once the upload has been committed.
+While the link is down the uploads just fail and are retried with a growing
+delay, and when it comes back the backlog drains in large batches.
+
+Each spooled reading gets a random upload_key that's stored with it on the
+base station (see SensorRead). If the drone loses the link (or power) after
+the base station has committed a batch but before the spool has deleted it,
+the batch is uploaded again, and the readings whose keys are already there
+are skipped, so nothing ends up in the database twice.
+
+Instead of writing to the database itself, the SpoolUploader can also send
+its batches to the base station's ingest server (see ingest_server.py) over
+HTTP, packed with telemetry_format, which takes far fewer bytes and round
+trips over the WiFi link. The drone doesn't need to reach the database at
+all then, not even to start: readings name their drone, mission and sensor,
+and the ids are looked up on the base station.
+
+Not every failed upload is down to the link. A reading the base station
+refuses (the ingest server answers 4xx, or the database raises one of the
+errors in is_row_error) would fail every time, and being the oldest it
+would stop everything behind it from being uploaded. So when a batch is
+refused it's split in half and the halves are uploaded separately, until the
+refused readings are found on their own. Each of those gets counted, and one
+that's been refused max_failures times is moved to the spool's quarantine
+table, where it's kept for someone to look at but no longer uploaded.
+Readings whose drone, mission or sensor isn't in the database yet aren't
+refused, they're put back at the end of the spool to try again later.
+
+The spool uses SQLite's write-ahead log, so appending a reading doesn't have
+to wait for an upload that's reading from the spool at the same time.
+"""
+import threading
+import sqlite3
+import json
+import uuid
+import time
+import sys
+import requests
+from models import *
+from reading_buffer import write_readings, WriteResult, is_row_error
+from telemetry_format import encode_batch
+
+
+READING_CLASSES = dict(
+    (reading_class.__name__, reading_class)
+    for reading_class in (AirSensorRead, RFSensorRead, GPSSensorRead, Event)
+)
+
+
+class RefusedBatch(Exception):
+    """Raised when a batch is refused because of the readings in it."""
+
+
+class ReadingSpool(object):
+    """Store readings in a local SQLite file until they've been uploaded.
+
+    Readings come back out in the order they went in. They stay in the spool
+    until they're removed, so a reading that's been peeked at but not removed
+    (because the upload failed, or the program died) is peeked again next
+    time, unless it's been requeued at the end or quarantined. Safe to use
+    from several threads.
+    """
+
+    def __init__(self, path):
+        """Construct an instance of ReadingSpool, creating the file if needed.
+
+        path -- the SQLite file to keep the spool in, or ':memory:'.
+        """
+        self.path = path
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        with self._lock:
+            self._connection.execute('PRAGMA journal_mode=WAL')
+            self._connection.execute('PRAGMA synchronous=NORMAL')
+            self._connection.execute(
+                'CREATE TABLE IF NOT EXISTS readings ('
+                'id INTEGER PRIMARY KEY AUTOINCREMENT, '
+                'upload_key TEXT NOT NULL, '
+                'reading_class TEXT NOT NULL, '
+                'event_type TEXT NOT NULL, '
+                'columns TEXT NOT NULL)'
+            )
+            self._connection.execute(
+                'CREATE TABLE IF NOT EXISTS quarantine ('
+                'id INTEGER PRIMARY KEY, '
+                'upload_key TEXT NOT NULL, '
+                'reading_class TEXT NOT NULL, '
+                'event_type TEXT NOT NULL, '
+                'columns TEXT NOT NULL, '
+                'reason TEXT, '
+                'quarantined REAL NOT NULL)'
+            )
+            self._connection.commit()
+
+    def append(self, reading_class, event_type, columns):
+        """Add a reading to the end of the spool and return its upload key."""
+        upload_key = uuid.uuid4().hex
+        with self._lock:
+            self._connection.execute(
+                'INSERT INTO readings '
+                '(upload_key, reading_class, event_type, columns) '
+                'VALUES (?, ?, ?, ?)',
+                (
+                    upload_key,
+                    reading_class.__name__,
+                    event_type,
+                    json.dumps(columns),
+                ),
+            )
+            self._connection.commit()
+        return upload_key
+
+    def peek(self, limit):
+        """Return up to limit of the oldest readings without removing them.
+
+        Each reading is a tuple of (spool_id, reading_class, event_type,
+        columns), where columns includes the upload_key.
+        """
+        with self._lock:
+            rows = self._connection.execute(
+                'SELECT id, upload_key, reading_class, event_type, columns '
+                'FROM readings ORDER BY id LIMIT ?',
+                (limit,),
+            ).fetchall()
+        readings = []
+        for spool_id, upload_key, class_name, event_type, columns in rows:
+            columns = json.loads(columns)
+            columns['upload_key'] = upload_key
+            readings.append(
+                (spool_id, READING_CLASSES[class_name], event_type, columns)
+            )
+        return readings
+
+    def remove(self, spool_ids):
+        """Remove the readings with the given spool ids."""
+        with self._lock:
+            self._connection.executemany(
+                'DELETE FROM readings WHERE id = ?',
+                [(spool_id,) for spool_id in spool_ids],
+            )
+            self._connection.commit()
+
+    def requeue(self, spool_ids):
+        """Move the readings with the given spool ids to the end."""
+        with self._lock:
+            for spool_id in spool_ids:
+                self._connection.execute(
+                    'UPDATE readings SET id = '
+                    '(SELECT MAX(id) + 1 FROM readings) WHERE id = ?',
+                    (spool_id,),
+                )
+            self._connection.commit()
+
+    def quarantine(self, spool_ids, reason):
+        """Move the readings with the given spool ids to the quarantine."""
+        now = time.time()
+        with self._lock:
+            for spool_id in spool_ids:
+                self._connection.execute(
+                    'INSERT INTO quarantine '
+                    '(upload_key, reading_class, event_type, columns, '
+                    'reason, quarantined) '
+                    'SELECT upload_key, reading_class, event_type, columns, '
+                    '?, ? FROM readings WHERE id = ?',
+                    (reason, now, spool_id),
+                )
+                self._connection.execute(
+                    'DELETE FROM readings WHERE id = ?',
+                    (spool_id,),
+                )
+            self._connection.commit()
+
+    def quarantined(self):
+        """Return the number of readings in the quarantine."""
+        with self._lock:
+            return self._connection.execute(
+                'SELECT COUNT(*) FROM quarantine'
+            ).fetchone()[0]
+
+    def __len__(self):
+        """Return the number of readings in the spool."""
+        with self._lock:
+            return self._connection.execute(
+                'SELECT COUNT(*) FROM readings'
+            ).fetchone()[0]
+
+
+class SpoolUploader(threading.Thread):
+    """Spool readings on the drone and upload them to the database in bulk.
+
+    A daemon thread uploads batch_size readings at a time whenever there are
+    at least that many waiting or every flush_interval seconds, and keeps
+    going without waiting while full batches are left, so a backlog from a
+    dropped link is cleared quickly. After a failed upload it waits
+    retry_interval seconds, doubling each time up to max_retry_interval,
+    before trying again.
+
+    If ingest_url is given, batches are POSTed there (to an IngestServer's
+    /telemetry) instead of being written to the database directly.
+
+    Readings the database refuses are quarantined after max_failures tries
+    (see the module docstring), and counted in self.quarantined.
+    """
+
+    def __init__(self, scoped_session, record_cache, spool, batch_size=500,
+                 flush_interval=2.0, retry_interval=1.0,
+                 max_retry_interval=30.0, ingest_url=None,
+                 request_timeout=10.0, max_failures=5):
+        """Construct an instance of SpoolUploader and start its thread.
+
+        scoped_session -- a Database's scoped_session (see database.py), not
+                          needed with an ingest_url.
+        record_cache -- a RecordCache to look up ids in, not needed with an
+                        ingest_url.
+        spool -- the ReadingSpool to keep readings in.
+        batch_size -- maximum number of readings uploaded per transaction.
+        flush_interval -- maximum number of seconds between uploads.
+        retry_interval -- seconds to wait after the first failed upload.
+        max_retry_interval -- longest wait between failed uploads.
+        ingest_url -- URL of an ingest server's /telemetry endpoint, or None
+                      to write to the database with scoped_session.
+        request_timeout -- seconds to wait for the ingest server to answer.
+        max_failures -- times a reading can be refused before it's
+                        quarantined.
+        """
+        super(SpoolUploader, self).__init__()
+        self.daemon = True
+        self._scoped_session = scoped_session
+        self._record_cache = record_cache
+        self.spool = spool
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.retry_interval = retry_interval
+        self.max_retry_interval = max_retry_interval
+        self.ingest_url = ingest_url
+        self.request_timeout = request_timeout
+        self.max_failures = max_failures
+        self._upload_requested = threading.Event()
+        self._pending = len(spool)
+        # {spool_id: times refused} of readings refused on their own
+        self._failures = {}
+        self.uploaded = 0
+        self.skipped = 0
+        self.quarantined = 0
+        self.start()
+
+    def put(self, reading_class, event_type, **columns):
+        """Spool a reading to be uploaded.
+
+        reading_class -- the SensorRead subclass to write, e.g. AirSensorRead,
+                         or Event for an event on its own.
+        event_type -- the name of the EventType for the reading's Event.
+        columns -- the column values for the reading, by column name, see
+                   write_readings in reading_buffer.py.
+
+        Returns True once the reading is safely in the spool.
+        """
+        self.spool.append(reading_class, event_type, columns)
+        self._pending += 1
+        if self._pending >= self.batch_size:
+            self._upload_requested.set()
+        return True
+
+    def queued(self):
+        """Return the number of readings waiting to be uploaded."""
+        return len(self.spool)
+
+    def run(self):
+        """Upload spooled readings until the spool is empty, then wait."""
+        delay = self.retry_interval
+        while True:
+            try:
+                uploaded = self.upload_batch()
+            except Exception as e:
+                sys.stderr.write(
+                    "Spool upload failed, retrying in {0}s: {1}\n".format(
+                        delay, e
+                    )
+                )
+                time.sleep(delay)
+                delay = min(delay * 2, self.max_retry_interval)
+                continue
+            delay = self.retry_interval
+            if uploaded < self.batch_size:
+                self._upload_requested.wait(self.flush_interval)
+                self._upload_requested.clear()
+
+    def upload_batch(self):
+        """Upload the oldest batch of spooled readings.
+
+        Readings whose upload keys are already in the database are left out
+        of the insert (see write_readings). Readings are removed from the
+        spool only after their upload has been committed, apart from those
+        whose records aren't in the database yet, which are put back at the
+        end of the spool, and those that are refused, which stay where they
+        are until they're quarantined. Returns the number of readings that
+        were uploaded or skipped.
+
+        Raises the exception if the upload failed for some other reason (the
+        link or the database being down), and the batch stays where it is.
+        """
+        batch = self.spool.peek(self.batch_size)
+        if not batch:
+            self._pending = 0
+            return 0
+        done = 0
+        pieces = [batch]
+        while pieces:
+            piece = pieces.pop(0)
+            try:
+                result = self._upload(piece)
+            except RefusedBatch as e:
+                if len(piece) > 1:
+                    half = len(piece) // 2
+                    pieces[:0] = [piece[:half], piece[half:]]
+                else:
+                    self._refused(piece[0][0], str(e))
+                continue
+            # the indexes are positions in piece, in the order it was sent
+            rejected = set(index for index, _ in result.rejected)
+            uploaded = [
+                spool_id
+                for index, (spool_id, _, _, _) in enumerate(piece)
+                if index not in rejected
+            ]
+            self.spool.remove(uploaded)
+            self.spool.requeue(piece[index][0] for index in sorted(rejected))
+            for spool_id in uploaded:
+                self._failures.pop(spool_id, None)
+            done += len(uploaded)
+            self.uploaded += result.written
+            self.skipped += result.skipped
+        self._pending = max(0, self._pending - done)
+        return done
+
+    def _refused(self, spool_id, reason):
+        """Count a refusal of one reading, and quarantine it if it's due."""
+        failures = self._failures.get(spool_id, 0) + 1
+        if failures < self.max_failures:
+            self._failures[spool_id] = failures
+            return
+        self._failures.pop(spool_id, None)
+        self.spool.quarantine([spool_id], reason)
+        self.quarantined += 1
+        self._pending = max(0, self._pending - 1)
+        sys.stderr.write(
+            "Quarantined spooled reading {0} after {1} failures: {2}\n".format(
+                spool_id,
+                failures,
+                reason,
+            )
+        )
+
+    def _upload(self, batch):
+        """Upload peeked readings and return the WriteResult.
+
+        Raises RefusedBatch if the readings were refused.
+        """
+        readings = [
+            (reading_class, event_type, columns)
+            for _, reading_class, event_type, columns in batch
+        ]
+        if self.ingest_url is not None:
+            return self._post_batch(readings)
+        self._record_cache.refresh_if_stale()
+        try:
+            with self._scoped_session('SpoolUploader.upload_batch') as session:
+                return write_readings(session, self._record_cache, readings)
+        except Exception as e:
+            if is_row_error(e):
+                raise RefusedBatch(e)
+            raise
+
+    def _post_batch(self, readings):
+        """Send readings to the ingest server and return its WriteResult.
+
+        Raises RefusedBatch if the readings can't be encoded, or the server
+        answers with a 4xx.
+        """
+        try:
+            data = encode_batch(readings)
+        except Exception as e:
+            raise RefusedBatch("can't encode: {0}".format(e))
+        response = requests.post(
+            self.ingest_url,
+            data=data,
+            headers={'Content-Type': 'application/octet-stream'},
+            timeout=self.request_timeout,
+        )
+        if 400 <= response.status_code < 500:
+            raise RefusedBatch("{0}: {1}".format(
+                response.status_code,
+                response.text,
+            ))
+        response.raise_for_status()
+        result = response.json()
+        return WriteResult(
+            result['written'],
+            result['skipped'],
+            [tuple(rejected) for rejected in result['rejected']],
+        )
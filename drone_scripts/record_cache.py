@@ -0,0 +1,186 @@
+"""Provide an in-process cache of the database records the logger refers to.
+
+RecordCache:
+    Maps event type names and (drone, mission, sensor) names to primary keys,
+    and mission drone sensors to the mission and drone they belong to.
+
+Every reading the drones log needs the id of its EventType and of the
+MissionDroneSensor it came from. Those tables only change when
+setup_hardware_records.py or pre_mission.py are run, so instead of querying
+for them on every reading the ids are loaded once and looked up in a
+dictionary after that. Nothing is loaded until the first lookup, so a
+RecordCache can be made before the database is reachable.
+
+Because those scripts usually run in a different process (often on a
+different machine), the cache can't be told directly when they change
+something. Instead it keeps a fingerprint of every table it reads from (see
+FINGERPRINT_COLUMNS), a hash of the columns it uses from each row, so rows
+being added, removed or renamed all show up, and refresh_if_stale() reloads
+everything if the fingerprint has changed. Those tables are a few dozen rows
+each, so that's a cheap query. The check is rate limited and meant to be
+called from a background thread, like the SpoolUploader's or the ingest
+server's request threads, not from the sensor callbacks.
+
+A lookup that misses also triggers a reload, which covers a mission being set
+up after the drone has already started, and raises KeyError if the record
+still isn't there. Readings for records that don't exist yet are put back
+and looked up again when they're next uploaded (see write_readings in
+reading_buffer.py, and SpoolUploader.upload_batch), so that's no reason to
+stop, and those reloads are rate limited too (see miss_interval) so a
+reading that keeps missing doesn't turn into a query every time.
+"""
+import threading
+import time
+import hashlib
+from models import *
+
+
+# the columns of each table the cache reads, which go into its fingerprint
+FINGERPRINT_COLUMNS = [
+    (EventType.id, EventType.event_type),
+    (Mission.id, Mission.name),
+    (Drone.id, Drone.name),
+    (Sensor.id, Sensor.name),
+    (MissionDrone.id, MissionDrone.mission_id, MissionDrone.drone_id),
+    (
+        MissionDroneSensor.id,
+        MissionDroneSensor.mission_drone_id,
+        MissionDroneSensor.sensor_id,
+    ),
+]
+
+
+class RecordCache(object):
+    """Cache the primary keys of EventType and MissionDroneSensor records.
+
+    Event types are looked up by name, mission drone sensors by the names of
+    their drone, mission and sensor, and the mission and drone ids that go on
+    each reading by mission drone sensor id. Lookups are plain dictionary
+    reads, so they're safe to do on every reading.
+    """
+
+    def __init__(self, scoped_session, check_interval=30.0,
+                 miss_interval=5.0):
+        """Construct an instance of RecordCache.
+
+        The records are loaded the first time they're looked up, so this
+        doesn't need the database to be reachable yet.
+
+        scoped_session -- a Database's scoped_session (see database.py).
+        check_interval -- minimum number of seconds between the database
+                          queries refresh_if_stale() makes.
+        miss_interval -- minimum number of seconds between the reloads that
+                         lookups which miss make.
+        """
+        self._scoped_session = scoped_session
+        self.check_interval = check_interval
+        self.miss_interval = miss_interval
+        self._lock = threading.Lock()
+        self._event_types = {}
+        self._mission_drone_sensors = {}
+        self._mission_drones = {}
+        self._fingerprint = None
+        self._last_check = 0
+        self._last_load = 0
+
+    def load(self):
+        """(Re)load all the cached records from the database."""
+        with self._lock:
+            with self._scoped_session('RecordCache.load') as session:
+                event_types = dict(
+                    session.query(
+                        EventType.event_type,
+                        EventType.id,
+                    ).all()
+                )
+                rows = session.query(
+                    Drone.name,
+                    Mission.name,
+                    Sensor.name,
+                    MissionDroneSensor.id,
+                    MissionDrone.mission_id,
+                    MissionDrone.drone_id,
+                ).join(
+                    MissionDrone,
+                    MissionDroneSensor.mission_drone_id == MissionDrone.id,
+                ).join(
+                    Drone,
+                    MissionDrone.drone_id == Drone.id,
+                ).join(
+                    Mission,
+                    MissionDrone.mission_id == Mission.id,
+                ).join(
+                    Sensor,
+                    MissionDroneSensor.sensor_id == Sensor.id,
+                ).all()
+                fingerprint = self._fetch_fingerprint(session)
+            # swap in whole dictionaries so readers never see half a reload
+            self._event_types = event_types
+            self._mission_drone_sensors = dict(
+                ((drone, mission, sensor), mds_id)
+                for drone, mission, sensor, mds_id, _, _ in rows
+            )
+            self._mission_drones = dict(
+                (mds_id, (mission_id, drone_id))
+                for _, _, _, mds_id, mission_id, drone_id in rows
+            )
+            self._fingerprint = fingerprint
+            self._last_check = self._last_load = time.time()
+
+    def invalidate(self):
+        """Drop everything and reload it from the database."""
+        self.load()
+
+    def refresh_if_stale(self):
+        """Reload if the cached tables have changed since the last load.
+
+        This queries the database at most once per check_interval seconds and
+        returns True if the cache was reloaded.
+        """
+        if time.time() - self._last_check < self.check_interval:
+            return False
+        with self._scoped_session('RecordCache.refresh_if_stale') as session:
+            fingerprint = self._fetch_fingerprint(session)
+        self._last_check = time.time()
+        if fingerprint != self._fingerprint:
+            self.load()
+            return True
+        return False
+
+    def event_type_id(self, event_type):
+        """Return the id of the EventType named event_type."""
+        return self._lookup('_event_types', event_type)
+
+    def mission_drone_sensor_id(self, drone_name, mission_name, sensor_name):
+        """Return the id of the MissionDroneSensor for the given names."""
+        return self._lookup(
+            '_mission_drone_sensors',
+            (drone_name, mission_name, sensor_name),
+        )
+
+    def mission_drone_ids(self, mission_drone_sensor_id):
+        """Return (mission_id, drone_id) for a MissionDroneSensor id."""
+        return self._lookup('_mission_drones', mission_drone_sensor_id)
+
+    def _lookup(self, records, key):
+        """Return key's value in one of the cached dictionaries.
+
+        On a miss the cache is reloaded, unless it was less than
+        miss_interval seconds ago, and KeyError is raised if key still isn't
+        there.
+        """
+        try:
+            return getattr(self, records)[key]
+        except KeyError:
+            if time.time() - self._last_load < self.miss_interval:
+                raise
+            self.load()
+            return getattr(self, records)[key]
+
+    def _fetch_fingerprint(self, session):
+        """Return a hash of the rows in FINGERPRINT_COLUMNS."""
+        fingerprint = hashlib.sha1()
+        for columns in FINGERPRINT_COLUMNS:
+            rows = session.query(*columns).order_by(columns[0]).all()
+            fingerprint.update(repr([tuple(row) for row in rows]))
+        return fingerprint.hexdigest()
@@ -16,7 +16,7 @@ import subprocess
 import threading
 import time
 import random
-from pubsub import pub
+import async_dispatch
 
 ### Use wlan0 if no drone AP is enabled (drone not set up to host its own network)
 #   Use wlan1 if drone can host an AP (then its base station connection is tied to
@@ -233,7 +233,7 @@ class RSSISensor(threading.Thread):
         return wifi_dict
 
     def _callback(self, wifi_data):
-        pub.sendMessage("sensor-messages.wifi-data", arg1=wifi_data)
+        async_dispatch.send_message("sensor-messages.wifi-data", arg1=wifi_data)
 
     def run(self):
         if not self._simulated:
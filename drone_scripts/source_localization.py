@@ -0,0 +1,239 @@
+"""Provide gradient tracking to find the source of a plume.
+
+GradientTracker:
+    Keeps a sliding window of recent readings and fits the local gradient of
+    the readings around a point.
+
+SourceSearch:
+    Walks up the gradient from a hotspot, one probe waypoint at a time,
+    until it stops finding higher readings.
+
+Once the grid search has found a hotspot, flying a triangle around every
+reading over the threshold tells us little about where the plume is coming
+from. Instead, the readings near the hotspot (from the grid sweeps and from
+the probes so far) are fitted with a plane,
+
+    value = a + g_north * north + g_east * east
+
+by weighted least squares, with readings weighted by a Gaussian of their
+distance from the point being fitted around, so nearby readings count for
+more and readings beyond window_radius not at all. (g_north, g_east) is the
+gradient, and the next probe is step meters from the current one in the
+direction it points. When the gradient turns round (the last step went past
+the peak) or stops being distinguishable from the noise in the readings, the
+step is halved, and once it's shorter than min_step the search has converged
+and the current point is the estimate of the source. If the readings in the
+window are too few, or all along one sweep line so they say nothing about
+the gradient across it, the window is widened (up to four times) until
+they're enough.
+
+Everything is done in meters north and east of the first reading, with the
+readings kept in preallocated numpy arrays, so each fit is a handful of
+vectorized operations over the window no matter how long the mission runs.
+"""
+import threading
+import numpy as np
+from nav_utils import global_to_ned, ned_to_global
+
+
+class GradientTracker(object):
+    """Keep recent readings and fit the local gradient around a point.
+
+    Only the latest max_readings readings are kept; older ones are
+    overwritten, so a plume that shifts over time is tracked as it is now.
+    Readings can be added and fitted from several threads (each drone's, see
+    drone_scheduler.py) at once.
+    """
+
+    def __init__(self, window_radius=10.0, max_readings=5000,
+                 min_readings=6):
+        """Construct an instance of GradientTracker.
+
+        window_radius -- readings further than this (in meters) from the
+                         point a fit is around are left out of the fit.
+        max_readings -- number of recent readings to keep.
+        min_readings -- fewest readings in the window to fit a gradient to.
+        """
+        self.window_radius = float(window_radius)
+        self.min_readings = min_readings
+        self.home = None
+        self._north = np.empty(max_readings)
+        self._east = np.empty(max_readings)
+        self._value = np.empty(max_readings)
+        self._next = 0
+        self._count = 0
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        """Return the number of readings being kept."""
+        return self._count
+
+    def to_ned(self, lat, lon):
+        """Return (north, east) in meters from the tracker's home."""
+        return global_to_ned(self.home[0], self.home[1], lat, lon)
+
+    def to_global(self, north, east):
+        """Return (lat, lon) of north/east meters from the tracker's home."""
+        lat, lon = ned_to_global(self.home[0], self.home[1], north, east)
+        return float(lat), float(lon)
+
+    def add(self, readings):
+        """Add readings to the window.
+
+        readings -- a structured array with lat, lon and value fields, like
+                    the ones clean_readings returns.
+        """
+        if len(readings) == 0:
+            return
+        with self._lock:
+            if self.home is None:
+                self.home = (readings['lat'][0], readings['lon'][0])
+            size = len(self._value)
+            readings = readings[-size:]
+            north, east = self.to_ned(readings['lat'], readings['lon'])
+            slots = (self._next + np.arange(len(readings))) % size
+            self._north[slots] = north
+            self._east[slots] = east
+            self._value[slots] = readings['value']
+            self._next = (self._next + len(readings)) % size
+            self._count = min(self._count + len(readings), size)
+
+    def fit(self, north, east, window_radius=None):
+        """Fit the gradient of the readings around north, east.
+
+        window_radius -- overrides the tracker's window_radius.
+
+        Returns (value, gradient, noise, readings), where value is the
+        fitted value at the point, gradient is the (north, east) gradient in
+        units per meter, noise is the weighted standard deviation of the
+        readings around the fitted plane and readings is how many readings
+        the fit used. Returns None if there weren't enough readings nearby,
+        or they were all in a line so the gradient across it is unknown.
+        """
+        window_radius = window_radius or self.window_radius
+        with self._lock:
+            d_north = self._north[:self._count] - north
+            d_east = self._east[:self._count] - east
+            value = self._value[:self._count].copy()
+        distance_squared = d_north ** 2 + d_east ** 2
+        near = distance_squared <= window_radius ** 2
+        if near.sum() < self.min_readings:
+            return None
+        d_north = d_north[near]
+        d_east = d_east[near]
+        value = value[near]
+        # a Gaussian with the window's edge at two standard deviations
+        bandwidth = window_radius / 2
+        weights = np.exp(-distance_squared[near] / (2 * bandwidth ** 2))
+        root_weights = np.sqrt(weights)
+        design = np.column_stack((np.ones(len(value)), d_north, d_east))
+        coefficients, _, rank, _ = np.linalg.lstsq(
+            design * root_weights[:, np.newaxis],
+            value * root_weights,
+            rcond=None,
+        )
+        if rank < 3:
+            return None
+        residuals = value - design.dot(coefficients)
+        noise = np.sqrt((weights * residuals ** 2).sum() / weights.sum())
+        return (
+            coefficients[0],
+            coefficients[1:],
+            noise,
+            len(value),
+        )
+
+    def widening_fit(self, north, east, widenings=2):
+        """Fit around north, east, doubling the window until a fit works.
+
+        Returns (fit, window_radius), with fit as returned by fit() (so None
+        if even the widest window didn't work) and the window it used.
+        """
+        window_radius = self.window_radius
+        for _ in range(widenings + 1):
+            fit = self.fit(north, east, window_radius)
+            if fit is not None:
+                break
+            window_radius *= 2
+        return fit, window_radius
+
+    def search(self, lat, lon, step=3.0, min_step=0.5, max_probes=20):
+        """Return a SourceSearch starting at lat, lon."""
+        with self._lock:
+            if self.home is None:
+                self.home = (lat, lon)
+        return SourceSearch(self, lat, lon, step, min_step, max_probes)
+
+
+class SourceSearch(object):
+    """Step up the fitted gradient from a starting point to a source.
+
+    Call next_waypoint() after each probe (once the readings taken there
+    have been added to the tracker) to get the next place to probe, until it
+    returns None. estimate() is the best guess at the source so far.
+    """
+
+    def __init__(self, tracker, lat, lon, step=3.0, min_step=0.5,
+                 max_probes=20):
+        """Construct an instance of SourceSearch.
+
+        tracker -- the GradientTracker with the readings.
+        lat, lon -- where to start, usually a hotspot's highest reading.
+        step -- distance in meters to move per probe to start with.
+        min_step -- the search has converged when the step gets this small.
+        max_probes -- give up after this many probes.
+        """
+        self.tracker = tracker
+        self.north, self.east = tracker.to_ned(lat, lon)
+        self.step = float(step)
+        self.min_step = float(min_step)
+        self.max_probes = max_probes
+        self.probes = 0
+        self.converged = False
+        self._direction = None
+
+    def estimate(self):
+        """Return the (lat, lon) of the current best guess at the source."""
+        return self.tracker.to_global(self.north, self.east)
+
+    def next_waypoint(self):
+        """Return the (lat, lon) to probe next, or None if the search is over.
+
+        The search is over once it has converged, run out of probes, or
+        there aren't enough readings around the current point to fit a
+        gradient to even with the window widened.
+        """
+        if self.converged or self.probes >= self.max_probes:
+            return None
+        fit, window_radius = self.tracker.widening_fit(self.north, self.east)
+        if fit is None:
+            return None
+        _, gradient, noise, _ = fit
+        magnitude = np.hypot(*gradient)
+        # how much the fitted plane changes across the window, compared to
+        # the scatter of the readings about it
+        significant = magnitude * window_radius > noise and magnitude > 0
+        if significant:
+            direction = gradient / magnitude
+            if (self._direction is not None and
+                    direction.dot(self._direction) < 0):
+                # it points back the way we came, so we went past the peak
+                self.step /= 2
+            self._direction = direction
+        else:
+            self.step /= 2
+        if self.step < self.min_step:
+            self.converged = True
+            return None
+        if significant:
+            self.north += self.step * self._direction[0]
+            self.east += self.step * self._direction[1]
+        elif self._direction is not None:
+            # flat here: come back half way towards where it wasn't
+            self.north -= self.step * self._direction[0]
+            self.east -= self.step * self._direction[1]
+        else:
+            self.converged = True
+            return None
+        self.probes += 1
+        return self.estimate()
@@ -0,0 +1,454 @@
+"""Provide a compact binary format for sending batches of readings.
+
+encode_batch / decode_batch:
+    Turn a batch of readings into bytes and back.
+
+A batch is the same list of (reading_class, event_type, columns) tuples that
+SpoolUploader.put and write_readings work with. Sent as SQL (or JSON), every
+reading carries its column names, its numbers as text and a JSON copy of the
+raw sensor data, which adds up to several hundred bytes a reading. Here each
+kind of reading is packed into fixed-width little-endian rows instead (see
+ROW_DTYPES), with the readings of one kind stored together as a block:
+
+    batch  -- MAGIC (4 bytes), VERSION (uint8), flags (uint8),
+              number of blocks (uint16), then, if the NAMES flag is set, the
+              sensor names, then, if the ORDER flag is set, the order, then
+              the blocks
+    names  -- length (uint32), then that many bytes of the JSON list of
+              [drone, mission, sensor] names the rows refer to
+    order  -- number of readings (uint32), then for each row of the blocks,
+              in block order, its reading's position in the batch (uint32)
+    block  -- kind (uint8), number of rows (uint32), then, if the DELTA flag
+              is set, the block's base time, latitude and longitude (three
+              float64s), then the rows, then for air, RF and event blocks
+              the raw data trailer
+    trailer -- length (uint32), then that many bytes of the JSON list of
+               each row's raw sensor data (or event data), zlib compressed if
+               the COMPRESSED flag is set
+
+Grouping the readings into blocks changes their order, but the batch
+decodes in the order it was encoded: if the readings weren't already grouped
+by kind, the ORDER flag is set and the order section says where each row
+goes. Callers can rely on that, for example the ingest server reports the
+readings it rejects by their position in the batch.
+
+With the DELTA flag, times are stored as milliseconds after the block's base
+time and latitudes/longitudes as 1e-7 degree (about 1 cm) steps away from the
+block's base coordinates, in 32 bit integers rather than 64 bit floats.
+
+The rows hold the typed columns: air readings carry their CO2 value, RF
+readings their signal, quality, noise and bit rate, and GPS readings their
+coordinates and NED offset. Missing numbers are sent as nan and come back as
+None. Each reading's 32 character hex upload_key is sent as 16 raw bytes.
+
+A reading's mission drone sensor is either the id in its columns'
+mission_drone_sensor_id, sent as is, or the (drone, mission, sensor) names in
+its columns' mission_drone_sensor, for a drone that doesn't know the ids (see
+write_readings in reading_buffer.py). Each set of names is only sent once, in
+the names list, and the rows refer to it with a negative number: -1 for the
+first names in the list, -2 for the second and so on.
+
+The raw air_data and RF_data dictionaries go in the trailer after their
+block's rows exactly as the sensor sent them, so nothing the rows don't have
+a field for (like the RF SSID) is lost, and they come back out as they went
+in, or None for a reading that didn't have any. Compressed, the trailer costs
+a lot less than a JSON copy per reading would: the readings of a block have
+the same keys, which zlib only stores once.
+
+The drones' mission events (Events with the 'mission_event' event type and
+no reading) are sent in event blocks, whose rows are only the upload_key,
+with the event_data in the trailer.
+"""
+import struct
+import json
+import uuid
+import zlib
+import numpy as np
+from models import AirSensorRead, RFSensorRead, GPSSensorRead, Event
+
+
+MAGIC = 'DTLM'
+VERSION = 2
+DELTA = 0x01
+COMPRESSED = 0x02
+NAMES = 0x04
+ORDER = 0x08
+FLAGS = DELTA | COMPRESSED | NAMES | ORDER
+
+HEADER = struct.Struct('<4sBBH')
+BLOCK_HEADER = struct.Struct('<BI')
+BLOCK_BASE = struct.Struct('<ddd')
+TRAILER_HEADER = struct.Struct('<I')
+NAMES_HEADER = struct.Struct('<I')
+ORDER_HEADER = struct.Struct('<I')
+ORDER_DTYPE = np.dtype('<u4')
+
+AIR = 1
+RF = 2
+GPS = 3
+EVENT = 4
+
+KINDS = {
+    AirSensorRead: (AIR, 'air_sensor_data'),
+    RFSensorRead: (RF, 'RF_sensor_data'),
+    GPSSensorRead: (GPS, 'auto_nav'),
+    Event: (EVENT, 'mission_event'),
+}
+READING_CLASSES = dict((kind, cls) for cls, (kind, _) in KINDS.items())
+EVENT_TYPES = dict(KINDS.values())
+
+# the column each kind of reading keeps its raw sensor data in, sent in the
+# block's trailer
+RAW_COLUMNS = {AIR: 'air_data', RF: 'RF_data', EVENT: 'event_data'}
+
+_COMMON = [('upload_key', 'S16'), ('mission_drone_sensor_id', '<i4')]
+_RF_FIELDS = [
+    ('signal', '<f4'),
+    ('quality', '<f4'),
+    ('noise', '<f4'),
+    ('bit_rate', '<f4'),
+]
+_GPS_FIELDS = [('altitude', '<f4'), ('north', '<f4'), ('east', '<f4')]
+
+# (plain, delta encoded) row layouts for each kind of reading
+ROW_DTYPES = {
+    AIR: (
+        np.dtype(_COMMON + [('time', '<f8'), ('co2', '<f4')]),
+        np.dtype(_COMMON + [('time', '<u4'), ('co2', '<f4')]),
+    ),
+    RF: (
+        np.dtype(_COMMON + [('time', '<f8')] + _RF_FIELDS),
+        np.dtype(_COMMON + [('time', '<u4')] + _RF_FIELDS),
+    ),
+    GPS: (
+        np.dtype(_COMMON + [
+            ('time', '<f8'),
+            ('latitude', '<f8'),
+            ('longitude', '<f8'),
+        ] + _GPS_FIELDS),
+        np.dtype(_COMMON + [
+            ('time', '<u4'),
+            ('latitude', '<i4'),
+            ('longitude', '<i4'),
+        ] + _GPS_FIELDS),
+    ),
+    EVENT: (
+        np.dtype([('upload_key', 'S16')]),
+        np.dtype([('upload_key', 'S16')]),
+    ),
+}
+
+TIME_SCALE = 1000.0  # delta encoded times are in milliseconds
+COORDINATE_SCALE = 1e7  # delta encoded coordinates are in 1e-7 degrees
+
+
+def _number(value):
+    """Return value as a float, with None as nan."""
+    return np.nan if value is None else float(value)
+
+def _value(number):
+    """Return a decoded number as a python float, with nan as None."""
+    number = float(number)
+    return None if np.isnan(number) else number
+
+def _key_bytes(upload_key):
+    """Return a hex upload key as 16 bytes, or zeros if there isn't one."""
+    if upload_key is None:
+        return '\0' * 16
+    return uuid.UUID(hex=upload_key).bytes
+
+def _key_hex(key_bytes):
+    """Return 16 key bytes as a hex upload key, or None if it's all zeros."""
+    key_bytes = key_bytes.ljust(16, '\0')
+    if key_bytes == '\0' * 16:
+        return None
+    return uuid.UUID(bytes=key_bytes).hex
+
+def _sensor_number(columns, names):
+    """Return the number a row refers to its mission drone sensor by.
+
+    names -- {(drone, mission, sensor): number} of the names list so far,
+             which the reading's names are added to if they're new.
+    """
+    if columns.get('mission_drone_sensor_id') is not None:
+        return columns['mission_drone_sensor_id']
+    key = tuple(columns['mission_drone_sensor'])
+    if key not in names:
+        names[key] = -(len(names) + 1)
+    return names[key]
+
+def _rows(kind, readings, names):
+    """Return the plain rows of one kind of reading as a structured array.
+
+    names -- see _sensor_number.
+    """
+    rows = np.zeros(len(readings), dtype=ROW_DTYPES[kind][0])
+    rows['upload_key'] = [
+        _key_bytes(columns.get('upload_key')) for columns in readings
+    ]
+    if kind == EVENT:
+        return rows
+    rows['mission_drone_sensor_id'] = [
+        _sensor_number(columns, names) for columns in readings
+    ]
+    rows['time'] = [_number(columns['time']) for columns in readings]
+    if kind == AIR:
+        rows['co2'] = [_number(columns.get('co2')) for columns in readings]
+    elif kind == RF:
+        for field, _ in _RF_FIELDS:
+            rows[field] = [
+                _number(columns.get(field)) for columns in readings
+            ]
+    else:
+        for field in ('latitude', 'longitude', 'altitude'):
+            rows[field] = [_number(columns[field]) for columns in readings]
+        relative = [
+            json.loads(columns['relative'])['relative']
+            if columns.get('relative') else (None, None)
+            for columns in readings
+        ]
+        rows['north'] = [_number(north) for north, _ in relative]
+        rows['east'] = [_number(east) for _, east in relative]
+    return rows
+
+def _delta_encode(kind, rows):
+    """Return (base, delta rows) for plain rows of one kind."""
+    if kind == EVENT:
+        return (0.0, 0.0, 0.0), rows
+    base_time = rows['time'].min()
+    if kind == GPS:
+        base_lat = rows['latitude'][0]
+        base_lon = rows['longitude'][0]
+    else:
+        base_lat = base_lon = 0.0
+    delta = np.zeros(len(rows), dtype=ROW_DTYPES[kind][1])
+    for field in delta.dtype.names:
+        if field == 'time':
+            delta['time'] = np.round((rows['time'] - base_time) * TIME_SCALE)
+        elif field == 'latitude':
+            delta['latitude'] = np.round(
+                (rows['latitude'] - base_lat) * COORDINATE_SCALE
+            )
+        elif field == 'longitude':
+            delta['longitude'] = np.round(
+                (rows['longitude'] - base_lon) * COORDINATE_SCALE
+            )
+        else:
+            delta[field] = rows[field]
+    return (base_time, base_lat, base_lon), delta
+
+def _delta_decode(kind, base, delta):
+    """Return the plain rows for delta encoded rows of one kind."""
+    base_time, base_lat, base_lon = base
+    rows = np.zeros(len(delta), dtype=ROW_DTYPES[kind][0])
+    for field in rows.dtype.names:
+        if field == 'time':
+            rows['time'] = base_time + delta['time'] / TIME_SCALE
+        elif field == 'latitude':
+            rows['latitude'] = base_lat + delta['latitude'] / COORDINATE_SCALE
+        elif field == 'longitude':
+            rows['longitude'] = (base_lon +
+                                 delta['longitude'] / COORDINATE_SCALE)
+        else:
+            rows[field] = delta[field]
+    return rows
+
+def _trailer(raw, compress):
+    """Return a block's trailer for the list of its rows' raw data."""
+    data = json.dumps(raw, separators=(',', ':'))
+    if compress:
+        data = zlib.compress(data)
+    return TRAILER_HEADER.pack(len(data)) + data
+
+def _read_trailer(data, offset, count, compressed):
+    """Return (raw data list, offset after it) for the trailer at offset."""
+    if offset + TRAILER_HEADER.size > len(data):
+        raise ValueError("telemetry batch is truncated")
+    length, = TRAILER_HEADER.unpack_from(data, offset)
+    offset += TRAILER_HEADER.size
+    if offset + length > len(data):
+        raise ValueError("telemetry batch is truncated")
+    trailer = data[offset:offset + length]
+    try:
+        if compressed:
+            trailer = zlib.decompress(trailer)
+        raw = json.loads(trailer)
+    except zlib.error as e:
+        raise ValueError("bad telemetry raw data: {0}".format(e))
+    if not isinstance(raw, list) or len(raw) != count:
+        raise ValueError("telemetry raw data doesn't match its block")
+    return raw, offset + length
+
+def _read_names(data, offset):
+    """Return (names list, offset after it) for the names at offset."""
+    if offset + NAMES_HEADER.size > len(data):
+        raise ValueError("telemetry batch is truncated")
+    length, = NAMES_HEADER.unpack_from(data, offset)
+    offset += NAMES_HEADER.size
+    if offset + length > len(data):
+        raise ValueError("telemetry batch is truncated")
+    names = json.loads(data[offset:offset + length])
+    if not isinstance(names, list) or not all(
+            isinstance(name, list) and len(name) == 3 for name in names):
+        raise ValueError("bad telemetry sensor names")
+    return names, offset + length
+
+def _read_order(data, offset):
+    """Return (positions array, offset after it) for the order at offset."""
+    if offset + ORDER_HEADER.size > len(data):
+        raise ValueError("telemetry batch is truncated")
+    count, = ORDER_HEADER.unpack_from(data, offset)
+    offset += ORDER_HEADER.size
+    size = ORDER_DTYPE.itemsize * count
+    if offset + size > len(data):
+        raise ValueError("telemetry batch is truncated")
+    positions = np.frombuffer(data, dtype=ORDER_DTYPE, count=count,
+                              offset=offset)
+    return positions, offset + size
+
+def _readings(kind, rows, raw=None, names=()):
+    """Return decoded rows as (reading_class, event_type, columns) tuples.
+
+    raw -- list of the rows' raw sensor data, from the block's trailer.
+    names -- the batch's list of sensor names.
+    """
+    reading_class = READING_CLASSES[kind]
+    event_type = EVENT_TYPES[kind]
+    readings = []
+    for index, row in enumerate(rows):
+        columns = {'upload_key': _key_hex(row['upload_key'])}
+        if kind != EVENT:
+            columns['time'] = _value(row['time'])
+            sensor = int(row['mission_drone_sensor_id'])
+            if sensor >= 0:
+                columns['mission_drone_sensor_id'] = sensor
+            elif -sensor <= len(names):
+                columns['mission_drone_sensor'] = names[-sensor - 1]
+            else:
+                raise ValueError(
+                    "unknown telemetry sensor {0}".format(sensor)
+                )
+        if kind == AIR:
+            columns['co2'] = _value(row['co2'])
+        elif kind == RF:
+            for field, _ in _RF_FIELDS:
+                columns[field] = _value(row[field])
+        elif kind == GPS:
+            for field in ('latitude', 'longitude', 'altitude'):
+                columns[field] = _value(row[field])
+            columns['relative'] = json.dumps({'relative': [
+                _value(row['north']),
+                _value(row['east']),
+            ]})
+        if kind in RAW_COLUMNS:
+            columns[RAW_COLUMNS[kind]] = raw[index]
+        if columns['upload_key'] is None:
+            del columns['upload_key']
+        readings.append((reading_class, event_type, columns))
+    return readings
+
+def encode_batch(batch, delta=True, compress=True):
+    """Return a batch of readings packed into a byte string.
+
+    batch -- list of (reading_class, event_type, columns) tuples. The event
+             type isn't sent, each kind of reading always decodes with the
+             event type the LoggerDaemon gives it.
+    delta -- whether to delta encode times and coordinates. Plain rows are
+             bigger but keep full float64 precision.
+    compress -- whether to compress the raw sensor data.
+    """
+    by_kind = {}
+    positions = {}
+    for position, (reading_class, _, columns) in enumerate(batch):
+        kind = KINDS[reading_class][0]
+        by_kind.setdefault(kind, []).append(columns)
+        positions.setdefault(kind, []).append(position)
+    flags = (DELTA if delta else 0) | (COMPRESSED if compress else 0)
+    names = {}
+    parts = []
+    order = np.array(
+        [position for kind in sorted(by_kind) for position in positions[kind]],
+        dtype=ORDER_DTYPE,
+    )
+    if np.any(order != np.arange(len(order))):
+        flags |= ORDER
+        parts.extend([ORDER_HEADER.pack(len(order)), order.tobytes()])
+    for kind in sorted(by_kind):
+        rows = _rows(kind, by_kind[kind], names)
+        parts.append(BLOCK_HEADER.pack(kind, len(rows)))
+        if delta:
+            base, rows = _delta_encode(kind, rows)
+            parts.append(BLOCK_BASE.pack(*base))
+        parts.append(rows.tobytes())
+        if kind in RAW_COLUMNS:
+            parts.append(_trailer(
+                [columns.get(RAW_COLUMNS[kind]) for columns in by_kind[kind]],
+                compress,
+            ))
+    if names:
+        flags |= NAMES
+        names_list = [list(key) for key, _ in sorted(
+            names.items(),
+            key=lambda item: -item[1],
+        )]
+        names_data = json.dumps(names_list, separators=(',', ':'))
+        parts[:0] = [NAMES_HEADER.pack(len(names_data)), names_data]
+    parts.insert(0, HEADER.pack(MAGIC, VERSION, flags, len(by_kind)))
+    return ''.join(parts)
+
+def decode_batch(data):
+    """Return the readings in a byte string made by encode_batch.
+
+    The result is a list of (reading_class, event_type, columns) tuples, like
+    the batch that was encoded and in the same order. Raises ValueError if
+    data isn't a batch this version understands.
+    """
+    if len(data) < HEADER.size:
+        raise ValueError("telemetry batch is too short")
+    magic, version, flags, blocks = HEADER.unpack_from(data, 0)
+    if magic != MAGIC or version != VERSION:
+        raise ValueError("not a version {0} telemetry batch".format(VERSION))
+    if flags & ~FLAGS:
+        raise ValueError("unknown telemetry flags {0:#x}".format(flags))
+    delta = bool(flags & DELTA)
+    compressed = bool(flags & COMPRESSED)
+    offset = HEADER.size
+    names = ()
+    if flags & NAMES:
+        names, offset = _read_names(data, offset)
+    positions = None
+    if flags & ORDER:
+        positions, offset = _read_order(data, offset)
+    readings = []
+    for _ in range(blocks):
+        if offset + BLOCK_HEADER.size > len(data):
+            raise ValueError("telemetry batch is truncated")
+        kind, count = BLOCK_HEADER.unpack_from(data, offset)
+        offset += BLOCK_HEADER.size
+        if kind not in ROW_DTYPES:
+            raise ValueError("unknown telemetry block kind {0}".format(kind))
+        if delta:
+            if offset + BLOCK_BASE.size > len(data):
+                raise ValueError("telemetry batch is truncated")
+            base = BLOCK_BASE.unpack_from(data, offset)
+            offset += BLOCK_BASE.size
+        dtype = ROW_DTYPES[kind][1 if delta else 0]
+        size = dtype.itemsize * count
+        if offset + size > len(data):
+            raise ValueError("telemetry batch is truncated")
+        rows = np.frombuffer(data, dtype=dtype, count=count, offset=offset)
+        offset += size
+        if delta:
+            rows = _delta_decode(kind, base, rows)
+        raw = None
+        if kind in RAW_COLUMNS:
+            raw, offset = _read_trailer(data, offset, count, compressed)
+        readings.extend(_readings(kind, rows, raw, names))
+    if positions is not None:
+        if not np.array_equal(np.sort(positions), np.arange(len(readings))):
+            raise ValueError("telemetry order doesn't match its readings")
+        ordered = [None] * len(readings)
+        for position, reading in zip(positions, readings):
+            ordered[position] = reading
+        readings = ordered
+    return readings
@@ -0,0 +1,14 @@
+"""Tests for the drone_scripts modules.
+
+Run them with nose from the drone_scripts directory:
+
+    nosetests tests
+
+The modules in drone_scripts import each other by their plain names, since
+they're run as scripts from that directory, so it's put on the path here
+before any of the tests import them.
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,139 @@
+"""Provide the records and readings the database tests start from.
+
+mission_database:
+    Return a fresh in-memory Database with a mission set up on it.
+
+air_reading / gps_reading:
+    Return a reading to write, as SpoolUploader.put takes it.
+
+write:
+    Write a batch of readings to a Database.
+
+ingest_server:
+    Return an IngestServer for a Database, without its HTTP thread.
+
+Each call gets its own SQLite database in memory, so tests don't see each
+other's rows and nothing needs cleaning up afterwards.
+"""
+from datetime import datetime
+from models import *
+from database import Database
+from record_cache import RecordCache
+from reading_buffer import write_readings
+from ingest_server import IngestServer
+
+
+MISSION = 'test_mission'
+DRONES = {
+    'Alpha': ['air1', 'GPS1', 'RF1'],
+    'Beta': ['air2', 'GPS2', 'RF2'],
+}
+EVENT_TYPES = ['auto_nav', 'air_sensor_data', 'RF_sensor_data',
+               'mission_event']
+
+
+def mission_database(mission=MISSION):
+    """Return a new in-memory Database with mission set up on it.
+
+    The mission has the drones in DRONES with their sensors, and all the
+    EVENT_TYPES exist, like after setup_hardware_records.py and
+    pre_mission.py have been run.
+    """
+    database = Database('sqlite://')
+    with database.scoped_session() as session:
+        session.add_all(
+            EventType(event_type=event_type) for event_type in EVENT_TYPES
+        )
+        sensor_type = SensorType(sensor_type='test')
+        new_mission = Mission(
+            name=mission,
+            date=datetime.now(),
+            location='test',
+        )
+        session.add(new_mission)
+        for drone_name, sensor_names in sorted(DRONES.items()):
+            drone = Drone(name=drone_name, FAA_ID='test')
+            mission_drone = MissionDrone(drone=drone, mission=new_mission)
+            for sensor_name in sensor_names:
+                sensor = Sensor(name=sensor_name, sensor_type=sensor_type)
+                MissionDroneSensor(sensor=sensor, mission_drone=mission_drone)
+            session.add(mission_drone)
+    return database
+
+def mds_id(database, drone_name, sensor_name, mission=MISSION):
+    """Return the id of a drone's sensor's MissionDroneSensor."""
+    with database.scoped_session() as session:
+        return session.query(
+            MissionDroneSensor.id,
+        ).join(
+            MissionDrone,
+            MissionDroneSensor.mission_drone_id == MissionDrone.id,
+        ).join(
+            Drone,
+            MissionDrone.drone_id == Drone.id,
+        ).join(
+            Mission,
+            MissionDrone.mission_id == Mission.id,
+        ).join(
+            Sensor,
+            MissionDroneSensor.sensor_id == Sensor.id,
+        ).filter(
+            Drone.name == drone_name,
+            Mission.name == mission,
+            Sensor.name == sensor_name,
+        ).scalar()
+
+def air_reading(co2, time, mds=None, names=('Alpha', MISSION, 'air1'),
+                **columns):
+    """Return a (reading_class, event_type, columns) tuple for an air reading.
+
+    time is in seconds since the epoch, like the drones log it.
+    The reading's sensor is the MissionDroneSensor id mds if it's given,
+    otherwise the (drone, mission, sensor) names.
+    """
+    air_data = {'co2': {'CO2': co2}}
+    columns.update(AirSensorRead.typed_columns(air_data))
+    columns.update({'air_data': air_data, 'time': time})
+    if mds is not None:
+        columns['mission_drone_sensor_id'] = mds
+    else:
+        columns['mission_drone_sensor'] = list(names)
+    return (AirSensorRead, 'air_sensor_data', columns)
+
+def gps_reading(lat, lon, time, names=('Alpha', MISSION, 'GPS1')):
+    """Return a (reading_class, event_type, columns) tuple for a GPS reading.
+
+    See air_reading.
+    """
+    return (GPSSensorRead, 'auto_nav', {
+        'mission_drone_sensor': list(names),
+        'time': time,
+        'latitude': lat,
+        'longitude': lon,
+        'altitude': 10.0,
+        'relative': '{"relative": [0.0, 0.0]}',
+    })
+
+def write(database, batch):
+    """Write a batch of readings to database, see write_readings."""
+    with database.scoped_session() as session:
+        return write_readings(
+            session,
+            RecordCache(database.scoped_session),
+            batch,
+        )
+
+
+class _UnstartedIngestServer(IngestServer):
+    """An IngestServer whose thread never starts, see ingest_server()."""
+
+    def start(self):
+        pass
+
+def ingest_server(database):
+    """Return an IngestServer writing to database, for its test_client.
+
+    The tests only talk to it through its Flask app's test client, so the
+    server thread isn't started (and isn't left listening when they end).
+    """
+    return _UnstartedIngestServer(database=database)
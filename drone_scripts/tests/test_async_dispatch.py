@@ -0,0 +1,141 @@
+"""Tests for TopicDispatcher and stop_all in async_dispatch.py."""
+import itertools
+import threading
+from nose.tools import assert_equal, assert_true, assert_false, assert_raises
+from pubsub import pub
+import async_dispatch
+from async_dispatch import TopicDispatcher
+
+
+_topics = itertools.count()
+
+
+class GatedListener(object):
+    """Record the messages on a new topic, holding each one until let go.
+
+    The first message sent is stuck in the listener until release() is
+    called, so everything sent after it stays queued.
+    """
+
+    def __init__(self):
+        self.topic = 'test-dispatch.topic{0}'.format(next(_topics))
+        self.received = []
+        self.entered = threading.Event()
+        self._released = threading.Event()
+        # pubsub only keeps a weak reference, so this object has to live as
+        # long as the test does
+        pub.subscribe(self, self.topic)
+
+    def __call__(self, arg1=None):
+        self.received.append(arg1)
+        self.entered.set()
+        self._released.wait(5)
+
+    def release(self):
+        self._released.set()
+
+    def block_dispatcher(self, dispatcher):
+        """Send a first message and wait until the listener is holding it."""
+        dispatcher.send(arg1='first')
+        assert_true(self.entered.wait(5))
+
+
+def fill(policy, sent, max_queued=3):
+    """Send messages 0 to sent - 1 while the listener is stuck.
+
+    Returns the listener, the dispatcher and what each send returned.
+    """
+    listener = GatedListener()
+    dispatcher = TopicDispatcher(listener.topic, max_queued, policy)
+    listener.block_dispatcher(dispatcher)
+    queued = [dispatcher.send(arg1=i) for i in range(sent)]
+    listener.release()
+    assert_true(dispatcher.stop(timeout=5))
+    return listener, dispatcher, queued
+
+
+def test_drop_oldest_keeps_the_newest_messages():
+    listener, dispatcher, queued = fill('drop_oldest', 5)
+    assert_equal(queued, [True] * 5)
+    assert_equal(listener.received, ['first', 2, 3, 4])
+    assert_equal(dispatcher.dropped, 2)
+    assert_equal(dispatcher.max_depth, 3)
+    assert_equal(dispatcher.delivered, 4)
+
+
+def test_drop_newest_keeps_the_oldest_messages():
+    listener, dispatcher, queued = fill('drop_newest', 5)
+    assert_equal(queued, [True, True, True, False, False])
+    assert_equal(listener.received, ['first', 0, 1, 2])
+    assert_equal(dispatcher.dropped, 2)
+
+
+def test_coalesce_keeps_only_the_latest_message():
+    listener, dispatcher, queued = fill('coalesce', 5, max_queued=100)
+    assert_equal(queued, [True] * 5)
+    assert_equal(listener.received, ['first', 4])
+    assert_equal(dispatcher.coalesced, 4)
+    assert_equal(dispatcher.dropped, 0)
+
+
+def test_unknown_policy():
+    assert_raises(ValueError, TopicDispatcher, 'test-dispatch.bad', 10,
+                  'drop_everything')
+
+
+def test_stop_delivers_whats_queued():
+    listener = GatedListener()
+    dispatcher = TopicDispatcher(listener.topic)
+    listener.block_dispatcher(dispatcher)
+    for i in range(3):
+        dispatcher.send(arg1=i)
+    # still stuck delivering the first one
+    assert_false(dispatcher.stop(timeout=0))
+    assert_false(dispatcher.send(arg1='too late'))
+    listener.release()
+    dispatcher.join(5)
+    assert_false(dispatcher.is_alive())
+    assert_equal(listener.received, ['first', 0, 1, 2])
+    assert_equal(dispatcher.dropped, 1)
+
+
+def test_stop_without_draining_drops_whats_queued():
+    listener = GatedListener()
+    dispatcher = TopicDispatcher(listener.topic)
+    listener.block_dispatcher(dispatcher)
+    for i in range(3):
+        dispatcher.send(arg1=i)
+    assert_false(dispatcher.stop(drain=False, timeout=0))
+    assert_equal(dispatcher.depth(), 0)
+    listener.release()
+    dispatcher.join(5)
+    assert_false(dispatcher.is_alive())
+    assert_equal(listener.received, ['first'])
+    assert_equal(dispatcher.dropped, 3)
+
+
+def test_an_idle_dispatcher_stops():
+    dispatcher = TopicDispatcher('test-dispatch.idle')
+    assert_true(dispatcher.stop(timeout=5))
+
+
+class TestStopAll(object):
+
+    def setup(self):
+        self.saved = dict(async_dispatch._dispatchers)
+        async_dispatch._dispatchers.clear()
+
+    def teardown(self):
+        async_dispatch._dispatchers.clear()
+        async_dispatch._dispatchers.update(self.saved)
+
+    def test_stop_all_drains_every_topic(self):
+        listeners = [GatedListener() for _ in range(2)]
+        for listener in listeners:
+            listener.release()
+            for i in range(3):
+                async_dispatch.send_message(listener.topic, arg1=i)
+        assert_true(async_dispatch.stop_all(timeout=5))
+        for listener in listeners:
+            assert_equal(listener.received, [0, 1, 2])
+        assert_false(async_dispatch.send_message(listeners[0].topic, arg1=3))
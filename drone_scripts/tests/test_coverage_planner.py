@@ -0,0 +1,83 @@
+"""Tests for the boustrophedon coverage planner in coverage_planner.py."""
+import math
+import numpy as np
+from nose.tools import assert_equal, assert_true, assert_raises
+from numpy.testing import assert_allclose
+from coverage_planner import (
+    sweep_spacing,
+    as_polygon,
+    sweep_lines,
+    boustrophedon,
+    path_length,
+    plan_coverage,
+    split_path,
+)
+
+
+# 40 m north by 10 m east
+RECTANGLE = [[0, 0], [40, 0], [40, 10], [0, 10]]
+# a U shape, open to the north, with a notch 4 m wide and 6 m deep
+U_SHAPE = [[0, 0], [10, 0], [10, 3], [4, 3], [4, 7], [10, 7], [10, 10],
+           [0, 10]]
+
+
+def test_sweep_spacing():
+    assert_allclose(sweep_spacing(4.0, 0.25), 3.0)
+    assert_raises(ValueError, sweep_spacing, 0, 0.25)
+    assert_raises(ValueError, sweep_spacing, 4.0, 1.0)
+
+
+def test_as_polygon_drops_the_closing_vertex():
+    assert_equal(as_polygon(RECTANGLE + [[0, 0]]).shape, (4, 2))
+    assert_raises(ValueError, as_polygon, [[0, 0], [1, 1], [0, 0]])
+
+
+def test_sweeps_are_centered_and_spaced():
+    # sweeping north, 10 m wide with 3 m spacing needs four sweeps
+    lines = sweep_lines(RECTANGLE, 3.0, 0.0)
+    assert_equal(len(lines), 4)
+    easts = [pieces[0][0][1] for pieces in lines]
+    assert_allclose(easts, [0.5, 3.5, 6.5, 9.5])
+    for pieces in lines:
+        assert_equal(len(pieces), 1)
+        assert_allclose([pieces[0][0][0], pieces[0][1][0]], [0, 40])
+
+
+def test_a_notch_splits_sweeps_into_pieces():
+    lines = sweep_lines(U_SHAPE, 1.0, 0.0)
+    counts = [len(pieces) for pieces in lines]
+    assert_equal(max(counts), 1)
+    # sweeping east instead, the ones crossing the notch have two pieces
+    lines = sweep_lines(U_SHAPE, 1.0, math.pi / 2)
+    counts = [len(pieces) for pieces in lines]
+    assert_equal(max(counts), 2)
+
+
+def test_boustrophedon_alternates_direction():
+    path = boustrophedon(sweep_lines(RECTANGLE, 5.0, 0.0))
+    assert_allclose(path, [[0, 2.5], [40, 2.5], [40, 7.5], [0, 7.5]])
+    assert_allclose(path_length(path), 85.0)
+
+
+def test_plan_coverage_sweeps_across_the_narrowest_width():
+    path = plan_coverage(RECTANGLE, footprint=5.0, overlap=0.0)
+    # two 40 m sweeps instead of eight 10 m ones
+    assert_equal(len(path), 4)
+    east_path = plan_coverage(RECTANGLE, footprint=5.0, overlap=0.0,
+                              angle=90)
+    assert_equal(len(east_path), 16)
+
+
+def test_split_path_gives_equal_lengths():
+    path = plan_coverage(RECTANGLE, footprint=2.0, overlap=0.0)
+    parts = split_path(path, 3)
+    assert_equal(len(parts), 3)
+    lengths = [path_length(part) for part in parts]
+    assert_allclose(lengths, [path_length(path) / 3] * 3)
+    # consecutive parts meet, and together they cover the whole path
+    for first, second in zip(parts, parts[1:]):
+        assert_allclose(first[-1], second[0])
+    assert_allclose(parts[0][0], path[0])
+    assert_allclose(parts[-1][-1], path[-1])
+    assert_true(all(len(part) >= 2 for part in parts))
+    assert_raises(ValueError, split_path, path, 0)
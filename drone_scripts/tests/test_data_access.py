@@ -0,0 +1,136 @@
+"""Tests for IncrementalReader in data_access.py."""
+import threading
+from nose.tools import assert_equal
+from sqlalchemy.orm import aliased
+from models import *
+from data_access import IncrementalReader
+from fixtures import (
+    mission_database,
+    air_reading,
+    gps_reading,
+    write,
+    MISSION,
+)
+
+
+def build_query(session, mission_id, drone_id):
+    a = aliased(AirSensorRead)
+    query = session.query(
+        a.time,
+        a.co2,
+        a.id,
+    ).filter(
+        a.mission_id == mission_id,
+        a.drone_id == drone_id,
+    )
+    return query, a.id, a.time
+
+def build_id_query(session, mission_id, drone_id):
+    return build_query(session, mission_id, drone_id)[:2]
+
+
+class TestIncrementalReader(object):
+
+    def setup(self):
+        self.database = mission_database()
+        self.reader = IncrementalReader(self.database.scoped_session)
+
+    def located(self, **settings):
+        return [
+            (air.co2, gps.latitude)
+            for air, gps in self.reader.fetch_new_located(
+                'test',
+                build_query,
+                MISSION,
+                'Alpha',
+                **settings
+            )
+        ]
+
+    def test_fetch_new_only_returns_new_rows(self):
+        write(self.database, [air_reading(400, 100.0)])
+        fetch = lambda: self.reader.fetch_new(
+            'test',
+            build_id_query,
+            MISSION,
+            'Alpha',
+        )
+        assert_equal([row.co2 for row in fetch()], [400])
+        write(self.database, [air_reading(401, 101.0)])
+        assert_equal([row.co2 for row in fetch()], [401])
+
+    def test_unknown_drones_get_nothing(self):
+        assert_equal(self.reader.mission_drone_ids(MISSION, 'Gamma'), None)
+
+    def test_pairs_readings_with_the_nearest_gps_reading(self):
+        write(self.database, [
+            gps_reading(1.0, 1.0, 100.0),
+            gps_reading(2.0, 2.0, 101.0),
+            gps_reading(3.0, 3.0, 110.0),
+            air_reading(400, 100.2),
+            air_reading(401, 100.9),
+            air_reading(402, 105.0),
+        ])
+        # 402 has no GPS reading within a second, so it's left out
+        assert_equal(self.located(), [(400, 1.0), (401, 2.0)])
+        assert_equal(self.located(), [])
+
+    def test_holds_readings_until_the_gps_catches_up(self):
+        write(self.database, [
+            gps_reading(1.0, 1.0, 100.0),
+            air_reading(400, 100.0),
+            air_reading(401, 100.8),
+        ])
+        assert_equal(self.located(), [(400, 1.0)])
+        write(self.database, [gps_reading(2.0, 2.0, 101.0)])
+        assert_equal(self.located(), [(401, 2.0)])
+
+    def test_stops_holding_readings_after_max_hold(self):
+        write(self.database, [
+            gps_reading(1.0, 1.0, 100.0),
+            air_reading(400, 100.5),
+        ])
+        assert_equal(self.located(max_hold=5.0), [])
+        # the GPS has stopped, but the air sensor keeps going
+        write(self.database, [
+            air_reading(401 + i, 101.0 + i) for i in range(10)
+        ])
+        # readings from more than 5s before the newest are let go, with
+        # a GPS reading if there's one close enough
+        assert_equal(self.located(max_hold=5.0), [(400, 1.0), (401, 1.0)])
+        assert_equal(self.located(max_hold=5.0), [])
+        write(self.database, [air_reading(420, 120.0)])
+        assert_equal(self.located(max_hold=5.0), [])
+        with self.database.scoped_session() as session:
+            last_let_go = session.query(AirSensorRead.id).filter(
+                AirSensorRead.co2 == 410,
+            ).scalar()
+        assert_equal(self.reader.watermark('test'), last_let_go)
+
+    def test_consumers_can_poll_from_different_threads(self):
+        write(self.database, [
+            air_reading(400 + i, 100.0 + i) for i in range(20)
+        ])
+        results = {}
+
+        def poll(consumer):
+            results[consumer] = [
+                row.co2
+                for row in self.reader.fetch_new(
+                    consumer,
+                    build_id_query,
+                    MISSION,
+                    'Alpha',
+                )
+            ]
+        threads = [
+            threading.Thread(target=poll, args=('consumer{0}'.format(i),))
+            for i in range(8)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        expected = [400 + i for i in range(20)]
+        for i in range(8):
+            assert_equal(results['consumer{0}'.format(i)], expected)
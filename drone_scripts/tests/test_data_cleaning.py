@@ -0,0 +1,76 @@
+"""Tests for the reading cleaning functions in data_cleaning.py."""
+import numpy as np
+from nose.tools import assert_equal, assert_true
+from data_cleaning import (
+    READING_DTYPE,
+    readings_array,
+    valid_mask,
+    dedup_by_coordinate,
+    clean_readings,
+    merge_readings,
+)
+
+
+def row(time, value, lat, lon, id):
+    """Return a row laid out like DroneCoordinator.get_data's."""
+    return (time, value, lat, lon, 5.0, id)
+
+
+def test_readings_array_turns_none_into_nan():
+    readings = readings_array([row(1.0, None, 32.0, None, 7)])
+    assert_equal(readings.dtype, READING_DTYPE)
+    assert_true(np.isnan(readings['value'][0]))
+    assert_true(np.isnan(readings['lon'][0]))
+    assert_equal(readings['id'][0], 7)
+
+
+def test_readings_array_uses_the_given_positions():
+    readings = readings_array([(32.0, -117.0, 410.0)], lat=0, lon=1,
+                              value=2, time=2, id=2)
+    assert_equal(readings['lat'][0], 32.0)
+    assert_equal(readings['lon'][0], -117.0)
+    assert_equal(readings['value'][0], 410.0)
+
+
+def test_valid_mask_drops_missing_values_and_fixes():
+    readings = readings_array([
+        row(1.0, 410.0, 32.0, -117.0, 1),
+        row(2.0, None, 32.0, -117.0, 2),
+        row(3.0, 410.0, 0.0, 0.0, 3),
+        row(4.0, 410.0, float('nan'), -117.0, 4),
+        row(5.0, 300.0, 32.0, -117.0, 5),
+    ])
+    assert_equal(list(valid_mask(readings)),
+                 [True, False, False, False, True])
+    assert_equal(list(valid_mask(readings, min_value=300.0)),
+                 [True, False, False, False, False])
+
+
+def test_dedup_keeps_the_highest_value_per_coordinate():
+    readings = readings_array([
+        row(1.0, 400.0, 32.1, -117.0, 1),
+        row(2.0, 450.0, 32.0, -117.0, 2),
+        row(3.0, 420.0, 32.0, -117.0, 3),
+        row(4.0, 430.0, 32.0, -117.1, 4),
+    ])
+    deduped = dedup_by_coordinate(readings)
+    # sorted by latitude, then longitude
+    assert_equal(list(deduped['id']), [4, 2, 1])
+
+
+def test_dedup_handles_no_readings():
+    assert_equal(dedup_by_coordinate(readings_array([])).size, 0)
+
+
+def test_clean_and_merge():
+    readings = clean_readings([
+        row(1.0, 400.0, 32.0, -117.0, 1),
+        row(2.0, None, 32.0, -117.0, 2),
+    ])
+    assert_equal(list(readings['id']), [1])
+    new_readings = clean_readings([
+        row(3.0, 420.0, 32.0, -117.0, 3),
+        row(4.0, 410.0, 32.1, -117.0, 4),
+    ])
+    merged = merge_readings(readings, new_readings)
+    assert_equal(list(merged['id']), [3, 4])
@@ -0,0 +1,175 @@
+"""Tests for preempting missions in drone_control.py.
+
+The Pilot and Navigator are made without their constructors, which connect
+to a vehicle, and given a fake vehicle or pilot instead.
+"""
+import threading
+import time
+from nose.tools import assert_equal, assert_false, assert_true
+from dronekit import VehicleMode, LocationGlobalRelative
+from drone_control import Pilot, Navigator, MissionQueue
+
+
+class FakeVehicle(object):
+    """A vehicle in GUIDED mode that never gets where it's going."""
+
+    def __init__(self):
+        self.mode = VehicleMode('GUIDED')
+        self.parameters = {}
+        self.listeners = []
+
+    def add_attribute_listener(self, name, callback):
+        self.listeners.append(callback)
+
+    def remove_attribute_listener(self, name, callback):
+        self.listeners.remove(callback)
+
+    def simple_goto(self, location, groundspeed=None):
+        pass
+
+
+class ArrivingVehicle(FakeVehicle):
+    """A vehicle that's at the waypoint as soon as it's sent there.
+
+    It hasn't reported a velocity yet, as happens right after connecting.
+    """
+
+    velocity = None
+
+    def simple_goto(self, location, groundspeed=None):
+        for callback in list(self.listeners):
+            callback(self, 'location.global_relative_frame', location)
+
+
+class FakePilot(object):
+    """Record where the pilot is sent and wait like goto_waypoint would."""
+
+    def __init__(self, fail_on=()):
+        self.waypoints = []
+        self.ground_tols = []
+        self.calls = []
+        self.fail_on = fail_on
+
+    def goto_waypoint(self, global_relative, interrupt=None, ground_tol=0.8,
+                      **kwargs):
+        self.waypoints.append(global_relative)
+        self.ground_tols.append(ground_tol)
+        # arrive after a tenth of a second unless interrupted first
+        return not interrupt.wait(0.1)
+
+    def _call(self, name):
+        self.calls.append(name)
+        if name in self.fail_on:
+            raise RuntimeError(name)
+
+    def return_to_launch(self):
+        self._call('return_to_launch')
+
+    def land_drone(self):
+        self._call('land_drone')
+
+    def RTL_and_land(self):
+        self._call('RTL_and_land')
+
+
+def make_pilot(vehicle=None):
+    pilot = Pilot.__new__(Pilot)
+    pilot.instance = 0
+    pilot.vehicle = vehicle or FakeVehicle()
+    pilot.groundspeed = 5
+    pilot.settle_speed = 0.3
+    pilot._wpnav_speed = None
+    return pilot
+
+def make_navigator(pilot):
+    navigator = Navigator.__new__(Navigator)
+    navigator.pilot = pilot
+    navigator.mission_queue = MissionQueue()
+    navigator.patrol_lookahead = 0
+    navigator.patrol_lookahead_fraction = 0.25
+    navigator._abortable = False
+    return navigator
+
+def preempt_after(mission_queue, seconds):
+    timer = threading.Timer(
+        seconds,
+        mission_queue.preempt,
+        [MissionQueue.RTL],
+    )
+    timer.start()
+    return timer
+
+
+def test_goto_waypoint_returns_when_interrupted():
+    pilot = make_pilot()
+    interrupt = threading.Event()
+    timer = threading.Timer(0.1, interrupt.set)
+    timer.start()
+    start = time.time()
+    assert_false(pilot.goto_waypoint(None, interrupt=interrupt))
+    assert_true(time.time() - start < 1.0)
+    assert_equal(pilot.vehicle.listeners, [])
+
+
+def test_an_infinite_settle_speed_skips_the_velocity():
+    pilot = make_pilot(ArrivingVehicle())
+    waypoint = LocationGlobalRelative(32.99, -117.13, 5)
+    # the interrupts are only there so a failure doesn't hang
+    interrupt = threading.Event()
+    timer = threading.Timer(1.0, interrupt.set)
+    timer.start()
+    assert_true(pilot.goto_waypoint(waypoint, interrupt=interrupt,
+                                    settle_speed=float('inf')))
+    timer.cancel()
+    # with a speed to check, it waits for the velocity
+    interrupt = threading.Event()
+    threading.Timer(0.3, interrupt.set).start()
+    assert_false(pilot.goto_waypoint(waypoint, interrupt=interrupt))
+
+
+def test_patrol_stops_at_the_next_waypoint_when_preempted():
+    pilot = FakePilot()
+    navigator = make_navigator(pilot)
+    navigator.current_mission = {
+        'points': dict((name, {'GPS': name}) for name in 'abcd'),
+    }
+    event = {'action': 'patrol', 'points': list('abcd'), 'repeat': 100}
+    preempt_after(navigator.mission_queue, 0.25)
+    start = time.time()
+    navigator.patrol(event)
+    assert_true(time.time() - start < 1.0)
+    assert_true(len(pilot.waypoints) < 10)
+
+
+def test_patrol_lookahead_is_opt_in_and_clamped_to_the_spacing():
+    pilot = FakePilot()
+    navigator = make_navigator(pilot)
+    # about 1 m and then 11 m apart
+    navigator.current_mission = {'points': {
+        'a': {'GPS': LocationGlobalRelative(0.0, 0.0, 5)},
+        'b': {'GPS': LocationGlobalRelative(0.000009, 0.0, 5)},
+        'c': {'GPS': LocationGlobalRelative(0.000108, 0.0, 5)},
+    }}
+    event = {'action': 'patrol', 'points': ['a', 'b', 'c'], 'repeat': 1}
+    navigator.patrol(event)
+    assert_equal(pilot.ground_tols, [0.8, 0.8, 0.8])
+    del pilot.ground_tols[:]
+    event['lookahead'] = 1.5
+    navigator.patrol(event)
+    assert_true(0.2 < pilot.ground_tols[0] < 0.3)
+    assert_equal(pilot.ground_tols[1:], [1.5, 0.8])
+
+
+def test_run_missions_keeps_going_after_a_failed_event():
+    pilot = FakePilot(fail_on=('return_to_launch',))
+    navigator = make_navigator(pilot)
+    navigator.mission_queue.preempt(MissionQueue.RTL)
+    navigator.mission_queue.preempt(MissionQueue.LAND)
+    navigator.mission_queue.preempt(MissionQueue.SHUTDOWN)
+    thread = threading.Thread(target=navigator.run_missions)
+    thread.daemon = True
+    thread.start()
+    thread.join(5)
+    assert_false(thread.is_alive())
+    assert_equal(pilot.calls, ['return_to_launch', 'land_drone',
+                               'RTL_and_land'])
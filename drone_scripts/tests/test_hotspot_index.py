@@ -0,0 +1,89 @@
+"""Tests for HotspotIndex in hotspot_index.py."""
+import numpy as np
+from nose.tools import assert_equal, assert_true
+from numpy.testing import assert_allclose
+from data_cleaning import READING_DTYPE
+from nav_utils import ned_to_global
+from hotspot_index import HotspotIndex
+
+
+HOME = (32.990, -117.128)
+
+
+class Readings(object):
+    """Make readings at points given in meters north and east of HOME."""
+
+    def __init__(self):
+        self.next_id = 1
+
+    def __call__(self, *points):
+        readings = np.zeros(len(points), dtype=READING_DTYPE)
+        for i, (north, east, value) in enumerate(points):
+            lat, lon = ned_to_global(HOME[0], HOME[1], north, east)
+            readings[i] = (lat, lon, value, self.next_id, self.next_id)
+            self.next_id += 1
+        return readings
+
+
+class TestHotspotIndex(object):
+
+    def setup(self):
+        self.index = HotspotIndex(threshold=500, cell_size=3.0, gap=1)
+        self.readings = Readings()
+        # the first reading sets the index's home
+        self.index.add(self.readings((0.5, 0.5, 400)))
+
+    def test_cool_readings_make_no_hotspots(self):
+        assert_equal(self.index.add(self.readings((10, 10, 450))), 0)
+        assert_equal(self.index.next_target(), None)
+        assert_equal(self.index.pending(), 0)
+
+    def test_readings_are_binned_into_cells(self):
+        self.index.add(self.readings((1.0, 1.0, 420), (2.5, 2.5, 410),
+                                     (4.0, 1.0, 300)))
+        assert_equal(len(self.index.cells), 2)
+        cell = self.index.cells[(0, 0)]
+        assert_equal(cell.count, 3)
+        assert_allclose(cell.mean(), (400 + 420 + 410) / 3.0)
+        assert_equal(cell.peak, 420)
+
+    def test_nearby_hot_cells_make_one_hotspot_at_the_peak(self):
+        # a plume crossed by three sweeps, with a missed column of cells
+        became_hot = self.index.add(self.readings(
+            (10, 1, 600), (10, 4, 700), (10, 10, 650),
+        ))
+        assert_equal(became_hot, 3)
+        assert_equal(len(self.index.hotspots), 1)
+        target = self.index.next_target()
+        assert_equal(target.value, 700)
+        lat, lon = ned_to_global(HOME[0], HOME[1], 10, 4)
+        assert_allclose((target.lat, target.lon), (lat, lon))
+        assert_equal(self.index.next_target(), None)
+
+    def test_targets_come_out_hottest_first_and_only_once(self):
+        self.index.add(self.readings((30, 0, 600), (-30, 0, 800),
+                                     (0, 30, 700)))
+        assert_equal(self.index.pending(), 3)
+        values = [self.index.next_target().value for _ in range(3)]
+        assert_equal(values, [800, 700, 600])
+        assert_equal(self.index.next_target(), None)
+        # a hotter reading in a hotspot that's been handed out already
+        self.index.add(self.readings((30, 0, 900)))
+        assert_equal(self.index.next_target(), None)
+
+    def test_merging_with_an_investigated_hotspot_isnt_handed_out_again(self):
+        self.index.add(self.readings((30, 0, 600)))
+        assert_equal(self.index.next_target().value, 600)
+        self.index.add(self.readings((36, 0, 800)))
+        assert_equal(len(self.index.hotspots), 1)
+        assert_equal(self.index.next_target(), None)
+
+    def test_far_apart_hot_cells_stay_separate(self):
+        self.index.add(self.readings((30, 0, 600), (45, 0, 600)))
+        assert_equal(len(self.index.hotspots), 2)
+        roots = set(
+            self.index.hotspot_of(key)
+            for key, cell in self.index.cells.items()
+            if cell.peak > self.index.threshold
+        )
+        assert_true(roots == set(self.index.hotspots))
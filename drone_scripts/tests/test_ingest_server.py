@@ -0,0 +1,91 @@
+"""Tests for IngestServer in ingest_server.py, on SQLite."""
+import json
+from nose.tools import assert_equal
+from models import *
+from telemetry_format import encode_batch
+from fixtures import mission_database, mds_id, air_reading, ingest_server
+
+
+class TestIngestServer(object):
+
+    def setup(self):
+        self.database = mission_database()
+        self.server = ingest_server(self.database)
+        self.client = self.server.app.test_client()
+        self.mds = mds_id(self.database, 'Alpha', 'air1')
+
+    def post(self, batch):
+        response = self.client.post(
+            '/telemetry',
+            data=encode_batch(batch),
+            content_type='application/octet-stream',
+        )
+        return response.status_code, json.loads(response.get_data())
+
+    def reading(self, co2, upload_key, mds=None):
+        return air_reading(
+            co2,
+            1500000000.0 + co2,
+            mds=mds or self.mds,
+            upload_key=upload_key,
+        )
+
+    def stored_co2(self):
+        with self.database.scoped_session() as session:
+            return sorted(co2 for co2, in session.query(AirSensorRead.co2))
+
+    def test_writes_a_batch(self):
+        status, body = self.post([
+            self.reading(400, '1' * 32),
+            self.reading(401, '2' * 32),
+        ])
+        assert_equal(status, 200)
+        assert_equal(body, {'written': 2, 'skipped': 0, 'rejected': []})
+        assert_equal(self.stored_co2(), [400, 401])
+        with self.database.scoped_session() as session:
+            reading = session.query(AirSensorRead).filter(
+                AirSensorRead.upload_key == '1' * 32,
+            ).one()
+            assert_equal(reading.air_data, {'co2': {'CO2': 400}})
+            assert_equal(reading.event.upload_key, '1' * 32)
+
+    def test_skips_a_batch_sent_again(self):
+        batch = [self.reading(400, '1' * 32)]
+        self.post(batch)
+        status, body = self.post(batch + [self.reading(401, '2' * 32)])
+        assert_equal(status, 200)
+        assert_equal((body['written'], body['skipped']), (1, 1))
+        assert_equal(self.stored_co2(), [400, 401])
+
+    def test_rejects_unknown_sensors_and_writes_the_rest(self):
+        status, body = self.post([
+            self.reading(400, '1' * 32),
+            self.reading(401, '2' * 32, mds=12345),
+        ])
+        assert_equal(status, 200)
+        assert_equal(body['written'], 1)
+        assert_equal([index for index, _ in body['rejected']], [1])
+        assert_equal(self.stored_co2(), [400])
+
+    def test_bad_rows_are_a_client_error(self):
+        status, body = self.post([
+            self.reading(400, '1' * 32),
+            self.reading(401, '1' * 32),
+        ])
+        assert_equal(status, 422)
+        assert 'error' in body
+        assert_equal(self.stored_co2(), [])
+
+    def test_undecodable_batches_are_a_client_error(self):
+        response = self.client.post('/telemetry', data='not telemetry')
+        assert_equal(response.status_code, 400)
+
+    def test_stats(self):
+        self.post([
+            self.reading(400, '1' * 32),
+            self.reading(401, '2' * 32, mds=12345),
+        ])
+        stats = json.loads(self.client.get('/stats').get_data())
+        assert_equal(stats['batches'], 1)
+        assert_equal(stats['written'], 1)
+        assert_equal(stats['rejected'], 1)
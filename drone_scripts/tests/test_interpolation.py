@@ -0,0 +1,74 @@
+"""Tests for the gridding methods in interpolation.py."""
+import numpy as np
+from nose.tools import assert_equal, assert_true, assert_raises
+from numpy.testing import assert_allclose
+from interpolation import METHODS, grid_axes, interpolate
+
+
+def plane_readings():
+    """Return readings of z = x + 2y on a 1 m grid 10 m across."""
+    x, y = np.meshgrid(np.arange(11.0), np.arange(11.0))
+    x, y = x.ravel(), y.ravel()
+    return x, y, x + 2 * y
+
+
+def test_grid_axes_cover_the_points():
+    xi, yi = grid_axes([1.0, 5.0, 3.0], [-2.0, 0.0, 2.0], resolution=5)
+    assert_allclose(xi, [1, 2, 3, 4, 5])
+    assert_allclose(yi, [-2, -1, 0, 1, 2])
+    xi, yi = grid_axes([], [], resolution=3)
+    assert_equal(xi.shape, (3,))
+
+
+def test_every_method_reproduces_the_readings_at_their_points():
+    x, y, z = plane_readings()
+    xi = yi = np.arange(11.0)
+    for method in METHODS:
+        zi = interpolate(x, y, z, xi, yi, method=method, noise=1e-3)
+        assert_equal(zi.shape, (11, 11))
+        assert_equal(np.ma.count_masked(zi), 0)
+        assert_allclose(zi.filled(), z.reshape(11, 11), atol=0.05)
+
+
+def test_idw_stays_within_the_readings():
+    x, y, z = plane_readings()
+    xi = yi = np.linspace(0, 10, 37)
+    zi = interpolate(x, y, z, xi, yi, method='idw')
+    assert_true(zi.min() >= z.min() and zi.max() <= z.max())
+
+
+def test_cells_far_from_readings_are_masked():
+    x, y, z = [0.0, 1.0, 0.0, 1.0], [0.0, 0.0, 1.0, 1.0], [1.0] * 4
+    xi = yi = np.linspace(0, 20, 21)
+    zi = interpolate(x, y, z, xi, yi, max_distance=2.0)
+    assert_true(not zi.mask[0, 0])
+    assert_true(zi.mask[20, 20])
+
+
+def test_binned_leaves_empty_cells_blank():
+    zi = interpolate([0.0, 0.1, 2.0], [0.0, 0.0, 0.0], [1.0, 3.0, 5.0],
+                     [0.0, 1.0, 2.0], [0.0], method='binned',
+                     max_distance=10.0)
+    assert_allclose(zi[0, 0], 2.0)
+    assert_true(zi.mask[0, 1])
+    assert_allclose(zi[0, 2], 5.0)
+
+
+def test_copes_with_no_few_and_bad_readings():
+    xi = yi = np.linspace(0, 1, 5)
+    assert_true(interpolate([], [], [], xi, yi).mask.all())
+    # nans are ignored, and two points are too few for 'gp'
+    zi = interpolate([0.0, 1.0, np.nan], [0.0, 1.0, 0.5],
+                     [1.0, 1.0, 9.0], xi, yi, method='gp')
+    assert_allclose(zi.compressed(), 1.0)
+    # readings all in a line, which griddata used to crash on
+    zi = interpolate([0.0, 0.5, 1.0], [0.0, 0.5, 1.0], [1.0, 2.0, 3.0],
+                     xi, yi, method='gp')
+    assert_equal(zi.shape, (5, 5))
+
+
+def test_bad_arguments_raise_value_error():
+    assert_raises(ValueError, interpolate, [0], [0], [0], [0], [0],
+                  method='griddata')
+    assert_raises(ValueError, interpolate, [0, 1], [0], [0], [0], [0])
+    assert_raises(ValueError, interpolate, [0], [0], [0], [[0]], [0])
@@ -0,0 +1,118 @@
+"""Tests for RunningGrid and LiveMap in live_map.py."""
+import matplotlib
+matplotlib.use('Agg')
+import numpy as np
+from nose.tools import assert_equal, assert_true
+from numpy.testing import assert_allclose
+from nav_utils import ned_to_global
+from live_map import RunningGrid, LiveMap
+
+
+HOME = (32.990, -117.128)
+
+
+def readings_at(north, east):
+    """Return (lat, lon, value) of readings at the given points."""
+    north = np.asarray(north, dtype=float)
+    east = np.asarray(east, dtype=float)
+    lat, lon = ned_to_global(HOME[0], HOME[1], north, east)
+    return lat, lon, 400 + 3.0 * north - 2.0 * east
+
+def scattered(count, spread, seed):
+    """Return count random (north, east) points within spread of HOME."""
+    random = np.random.RandomState(seed)
+    return (
+        random.uniform(-spread, spread, count),
+        random.uniform(-spread, spread, count),
+    )
+
+def recompute(grid, lat, lon, value):
+    """Return grid's values worked out from scratch from all the readings.
+
+    Every cell is the inverse distance weighted average of the readings
+    within radius of its centre, or in the cell itself, with distances no
+    shorter than half a cell, like RunningGrid.add.
+    """
+    north, east = grid.to_ned(np.asarray(lat), np.asarray(lon))
+    rows, cols = grid.values.shape
+    values = np.full((rows, cols), np.nan)
+    for row in range(rows):
+        for col in range(cols):
+            south = grid.origin[0] + row * grid.cell_size
+            west = grid.origin[1] + col * grid.cell_size
+            distance = np.hypot(
+                south + grid.cell_size / 2 - north,
+                west + grid.cell_size / 2 - east,
+            )
+            inside = (
+                (np.floor((north - south) / grid.cell_size) == 0) &
+                (np.floor((east - west) / grid.cell_size) == 0)
+            )
+            near = (distance <= grid.radius) | inside
+            if near.any():
+                weight = np.maximum(
+                    distance[near],
+                    grid.cell_size / 2,
+                ) ** -grid.power
+                values[row, col] = np.sum(weight * value[near]) / weight.sum()
+    return values
+
+
+def test_incremental_adds_match_a_full_recompute():
+    grid = RunningGrid(cell_size=1.0, radius=2.5, size=8)
+    lat, lon, value = readings_at(*scattered(60, 15.0, seed=1))
+    # the first reading sets the home, put it exactly on HOME
+    lat[0], lon[0] = HOME
+    grew = []
+    for start in range(0, 60, 7):
+        stop = start + 7
+        grew.append(grid.add(lat[start:stop], lon[start:stop],
+                             value[start:stop])[1])
+    # the readings reach well past the first 8 x 8 cells
+    assert_true(sum(grew) > 1)
+    assert_allclose(grid.values, recompute(grid, lat, lon, value))
+
+
+def test_touched_covers_every_changed_cell():
+    grid = RunningGrid(cell_size=1.0, radius=3.0, size=32)
+    grid.add(*readings_at([0.0], [0.0]))
+    before = grid.values.copy()
+    touched, grew = grid.add(*readings_at([2.3, -1.7], [4.1, 0.4]))
+    assert_equal(grew, False)
+    changed = ~np.isclose(before, grid.values, equal_nan=True)
+    outside = changed.copy()
+    outside[touched[0]:touched[1], touched[2]:touched[3]] = False
+    assert_true(changed.any())
+    assert_true(not outside.any())
+
+
+def test_a_radius_smaller_than_a_cell_still_fills_the_readings_cell():
+    grid = RunningGrid(cell_size=1.0, radius=0.2, size=8)
+    # near a corner, so no cell centre is within radius of either reading
+    lat, lon, value = readings_at([0.0, 2.95], [0.0, -3.05])
+    touched, grew = grid.add(lat, lon, value)
+    filled = np.argwhere(np.isfinite(grid.values))
+    assert_equal(len(filled), 2)
+    row, col = filled.min(axis=0)
+    assert_true(touched[0] <= row and touched[2] <= col)
+    assert_allclose(grid.values, recompute(grid, lat, lon, value))
+
+
+def test_nothing_to_add_touches_nothing():
+    grid = RunningGrid()
+    assert_equal(grid.add([], [], []), (None, False))
+    assert_equal(grid.home, None)
+
+
+def test_live_map_image_shows_the_grid():
+    live_map = LiveMap(cell_size=1.0, radius=2.0)
+    track_north, track_east = [0.0, 1.0, 2.0], [0.0, 0.5, 1.0]
+    track_lat, track_lon, _ = readings_at(track_north, track_east)
+    live_map.update(*readings_at([0.5], [0.5]),
+                    track_lat=track_lat, track_lon=track_lon)
+    # no growing this time, so only the touched cells are copied over
+    live_map.update(*readings_at([1.5, 2.5], [1.0, -0.5]))
+    image = np.ma.filled(live_map.image.get_array(), np.nan)
+    assert_allclose(image, live_map.grid.values)
+    assert_allclose(live_map.track.get_data(), (track_east, track_north),
+                    atol=1e-6)
@@ -0,0 +1,84 @@
+"""Tests for the vectorized geodesy helpers in nav_utils.py.
+
+They're checked against vincenty, which is exact on the WGS84 ellipsoid, to
+the accuracy the nav_utils module docstring promises.
+"""
+import numpy as np
+from nose.tools import assert_equal, assert_true
+from numpy.testing import assert_allclose
+from nav_utils import (
+    lat_lon_distance,
+    haversine_distance,
+    equirectangular_distance,
+    global_to_ned,
+    ned_to_global,
+    bearing,
+)
+
+
+HOME = (32.990, -117.128)
+
+
+def test_global_to_ned_matches_vincenty_along_each_leg():
+    lat = HOME[0] + np.array([0.01, -0.005, 0.0, 0.02])
+    lon = HOME[1] + np.array([0.0, 0.01, -0.02, 0.02])
+    north, east = global_to_ned(HOME[0], HOME[1], lat, lon)
+    for i in range(len(lat)):
+        assert_allclose(
+            abs(north[i]),
+            lat_lon_distance(HOME[0], HOME[1], lat[i], HOME[1]),
+            atol=1e-3,
+        )
+        assert_allclose(
+            abs(east[i]),
+            lat_lon_distance(HOME[0], HOME[1], HOME[0], lon[i]),
+            atol=1e-3,
+        )
+    # south and west are negative
+    assert_true(north[1] < 0 and east[2] < 0)
+
+
+def test_ned_to_global_inverts_global_to_ned():
+    north = np.array([0.0, 150.0, -2000.0, 3000.0])
+    east = np.array([0.0, -75.0, 1200.0, 3000.0])
+    lat, lon = ned_to_global(HOME[0], HOME[1], north, east)
+    back_north, back_east = global_to_ned(HOME[0], HOME[1], lat, lon)
+    assert_allclose(back_north, north, atol=1e-6)
+    assert_allclose(back_east, east, atol=1e-6)
+
+
+def test_equirectangular_distance_is_close_to_vincenty_nearby():
+    for meters, tolerance in ((300.0, 0.01), (1000.0, 0.1)):
+        lat, lon = ned_to_global(HOME[0], HOME[1], meters / 2**0.5,
+                                 meters / 2**0.5)
+        assert_allclose(
+            equirectangular_distance(HOME[0], HOME[1], lat, lon),
+            lat_lon_distance(HOME[0], HOME[1], float(lat), float(lon)),
+            atol=tolerance,
+        )
+
+
+def test_haversine_distance_is_within_half_a_percent():
+    lat2 = np.array([33.5, 40.0, 10.0])
+    lon2 = np.array([-117.0, -100.0, -60.0])
+    distances = haversine_distance(HOME[0], HOME[1], lat2, lon2)
+    for i in range(len(lat2)):
+        assert_allclose(
+            distances[i],
+            lat_lon_distance(HOME[0], HOME[1], lat2[i], lon2[i]),
+            rtol=0.005,
+        )
+
+
+def test_haversine_distance_takes_single_numbers():
+    assert_equal(haversine_distance(HOME[0], HOME[1], HOME[0], HOME[1]), 0)
+
+
+def test_bearing_points_the_right_way():
+    assert_allclose(
+        bearing(HOME[0], HOME[1],
+                [HOME[0] + 0.01, HOME[0], HOME[0] - 0.01, HOME[0]],
+                [HOME[1], HOME[1] + 0.01, HOME[1], HOME[1] - 0.01]),
+        [0, 90, 180, 270],
+        atol=0.01,
+    )
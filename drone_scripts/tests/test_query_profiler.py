@@ -0,0 +1,115 @@
+"""Tests for QueryProfiler, caller and StatementStats in query_profiler.py."""
+from nose.tools import assert_equal, assert_true, assert_false, assert_in
+from sqlalchemy import event
+from database import Database
+from query_profiler import QueryProfiler, StatementStats, caller, \
+    current_caller
+
+
+class TestQueryProfiler(object):
+
+    def setup(self):
+        self.database = Database('sqlite://')
+        self.engine = self.database.engine
+        self.engine.execute('CREATE TABLE reading (value INTEGER)')
+        self.profiler = QueryProfiler(self.engine)
+
+    def teardown(self):
+        self.profiler.remove()
+
+    def calls_by_caller(self):
+        return dict(
+            (name, calls)
+            for name, (calls, _, _) in self.profiler.caller_totals().items()
+        )
+
+    def test_statements_are_filed_under_their_caller(self):
+        with caller('x'):
+            self.engine.execute('SELECT 1')
+            with caller('y'):
+                self.engine.execute('SELECT 2')
+            assert_equal(current_caller(), 'x')
+            self.engine.execute('SELECT 3')
+        self.engine.execute('SELECT 4')
+        assert_equal(current_caller(), None)
+        stats = self.profiler.stats()
+        assert_equal(set(stats), set([
+            (None, 'SELECT 4'),
+            ('x', 'SELECT 1'),
+            ('x', 'SELECT 3'),
+            ('y', 'SELECT 2'),
+        ]))
+        assert_equal(self.calls_by_caller(), {None: 1, 'x': 2, 'y': 1})
+
+    def test_scoped_sessions_are_callers(self):
+        with self.database.scoped_session('Logger.write') as session:
+            session.execute('INSERT INTO reading VALUES (1), (2), (3)')
+        with caller('outer'), self.database.scoped_session() as session:
+            session.execute('SELECT value FROM reading')
+        calls, rows, _ = self.profiler.caller_totals()['Logger.write']
+        assert_equal((calls, rows), (1, 3))
+        assert_in('outer', self.profiler.caller_totals())
+
+    def test_same_statement_is_grouped(self):
+        with caller('x'):
+            for value in range(3):
+                self.engine.execute(
+                    'INSERT INTO reading\n    VALUES (?)',
+                    value,
+                )
+        stats = self.profiler.stats()
+        assert_equal(list(stats), [('x', 'INSERT INTO reading VALUES (?)')])
+        assert_equal(stats.values()[0].calls, 3)
+        assert_equal(stats.values()[0].rows, 3)
+
+    def test_remove_detaches_the_listeners(self):
+        self.profiler.remove()
+        assert_false(event.contains(
+            self.engine,
+            'before_cursor_execute',
+            self.profiler._before_execute,
+        ))
+        assert_false(event.contains(
+            self.engine,
+            'after_cursor_execute',
+            self.profiler._after_execute,
+        ))
+        with caller('x'):
+            self.engine.execute('SELECT 1')
+        assert_equal(self.profiler.stats(), {})
+        # listening again, so teardown has something to remove
+        self.profiler = QueryProfiler(self.engine)
+
+    def test_report_lists_callers_and_statements(self):
+        with caller('DroneCoordinator.get_data'):
+            self.engine.execute('SELECT 1')
+        report = self.profiler.report()
+        assert_in('DroneCoordinator.get_data', report)
+        assert_in('SELECT 1', report)
+        self.profiler.reset()
+        assert_equal(self.profiler.stats(), {})
+
+
+def test_percentile_is_the_bucket_bound():
+    stats = StatementStats()
+    for _ in range(8):
+        stats.add(0.0003, 1)  # 0.3 ms, in the 0.5 ms bucket
+    stats.add(0.001, 1)  # on a bound, in the 1 ms bucket
+    stats.add(0.2, 1)  # 200 ms, in the 250 ms bucket
+    assert_equal(stats.calls, 10)
+    assert_equal(stats.rows, 10)
+    assert_equal(stats.percentile(0.5), 0.5)
+    assert_equal(stats.percentile(0.8), 0.5)
+    assert_equal(stats.percentile(0.9), 1)
+    # the bucket's bound is more than the longest call, which is the cap
+    assert_equal(stats.percentile(0.95), 200.0)
+    assert_equal(stats.percentile(1.0), 200.0)
+
+
+def test_percentile_of_one_fast_call_is_its_time():
+    stats = StatementStats()
+    stats.add(0.0002, -1)
+    assert_true(abs(stats.percentile(0.5) - 0.2) < 1e-9)
+    # SQLite's -1 for "don't know" isn't counted as rows
+    assert_equal(stats.rows, 0)
+    assert_equal(stats.as_dict()['histogram'], {'0.25': 1})
@@ -0,0 +1,96 @@
+"""Tests for write_readings and is_row_error in reading_buffer.py."""
+from nose.tools import assert_equal
+from sqlalchemy.exc import (
+    IntegrityError,
+    OperationalError,
+    StatementError,
+)
+from models import *
+from record_cache import RecordCache
+from reading_buffer import write_readings, is_row_error
+from fixtures import mission_database, mds_id, air_reading
+
+
+class TestWriteReadings(object):
+
+    def setup(self):
+        self.database = mission_database()
+        self.record_cache = RecordCache(self.database.scoped_session)
+
+    def write(self, batch):
+        with self.database.scoped_session() as session:
+            return write_readings(session, self.record_cache, batch)
+
+    def test_links_readings_to_their_events_and_records(self):
+        batch = [air_reading(400 + i, 100.0 + i) for i in range(450)]
+        result = self.write(batch)
+        assert_equal(result, (450, 0, []))
+        mds = mds_id(self.database, 'Alpha', 'air1')
+        with self.database.scoped_session() as session:
+            readings = session.query(AirSensorRead).order_by(
+                AirSensorRead.time,
+            ).all()
+            assert_equal(len(readings), 450)
+            for i, reading in enumerate(readings):
+                assert_equal(reading.co2, 400 + i)
+                assert_equal(reading.air_data, {'co2': {'CO2': 400 + i}})
+                assert_equal(reading.mission_drone_sensor_id, mds)
+                assert_equal(reading.mission.name, 'test_mission')
+                assert_equal(reading.drone.name, 'Alpha')
+                assert_equal(reading.event.upload_key, reading.upload_key)
+                assert_equal(
+                    reading.event.event_type.event_type,
+                    'air_sensor_data',
+                )
+
+    def test_takes_mission_drone_sensor_ids(self):
+        mds = mds_id(self.database, 'Beta', 'air2')
+        self.write([air_reading(400, 100.0, mds=mds)])
+        with self.database.scoped_session() as session:
+            reading = session.query(AirSensorRead).one()
+            assert_equal(reading.drone.name, 'Beta')
+
+    def test_skips_upload_keys_already_written(self):
+        first = air_reading(400, 100.0, upload_key='a' * 32)
+        again = air_reading(400, 100.0, upload_key='a' * 32)
+        new = air_reading(401, 101.0, upload_key='b' * 32)
+        self.write([first])
+        result = self.write([again, new])
+        assert_equal(result, (1, 1, []))
+        with self.database.scoped_session() as session:
+            assert_equal(session.query(SensorRead).count(), 2)
+            assert_equal(session.query(Event).count(), 2)
+
+    def test_rejects_unknown_records_and_writes_the_rest(self):
+        batch = [
+            air_reading(400, 100.0),
+            air_reading(401, 101.0, names=('Gamma', 'test_mission', 'air1')),
+            air_reading(402, 102.0, mds=12345),
+            air_reading(403, 103.0),
+        ]
+        result = self.write(batch)
+        assert_equal(result.written, 2)
+        assert_equal([index for index, _ in result.rejected], [1, 2])
+        with self.database.scoped_session() as session:
+            assert_equal(
+                sorted(co2 for co2, in session.query(AirSensorRead.co2)),
+                [400, 403],
+            )
+
+    def test_writes_events_on_their_own(self):
+        event = (Event, 'mission_event', {'event_data': {'note': 'hi'}})
+        self.write([event])
+        with self.database.scoped_session() as session:
+            written = session.query(Event).one()
+            assert_equal(written.event_data, {'note': 'hi'})
+            assert_equal(written.sensor_reading, None)
+
+
+def test_is_row_error():
+    assert is_row_error(IntegrityError('INSERT', {}, Exception('dup')))
+    assert is_row_error(KeyError('unknown sensor'))
+    assert is_row_error(StatementError('bad value', 'INSERT', {}, None))
+    assert not is_row_error(
+        OperationalError('INSERT', {}, Exception('unreachable'))
+    )
+    assert not is_row_error(RuntimeError('something else'))
@@ -0,0 +1,251 @@
+"""Tests for ReadingSpool and SpoolUploader in reading_spool.py."""
+import threading
+import json
+import requests
+from nose.tools import assert_equal, assert_raises
+from sqlalchemy.exc import OperationalError
+from models import *
+from record_cache import RecordCache
+from reading_spool import ReadingSpool, SpoolUploader
+from fixtures import (
+    mission_database,
+    air_reading,
+    gps_reading,
+    ingest_server,
+    MISSION,
+)
+
+
+class IdleSpool(ReadingSpool):
+    """A ReadingSpool that lets the tests know when it's first been peeked.
+
+    A SpoolUploader's thread peeks as soon as it starts, and finding the
+    spool empty it waits for flush_interval, which is None in these tests,
+    so after that the tests can upload batches themselves without it
+    getting in the way.
+    """
+
+    def __init__(self, path):
+        super(IdleSpool, self).__init__(path)
+        self.peeked = threading.Event()
+
+    def peek(self, limit):
+        readings = super(IdleSpool, self).peek(limit)
+        self.peeked.set()
+        return readings
+
+
+class FakeIngest(object):
+    """Stand in for the ingest server in SpoolUploader._post_batch."""
+
+    def __init__(self, answer):
+        self.answer = answer
+        self.posts = []
+
+    def __call__(self, url, data=None, headers=None, timeout=None):
+        self.posts.append(data)
+        return self.answer(data)
+
+
+class TestClientIngest(object):
+    """Send SpoolUploader._post_batch's requests to a real IngestServer."""
+
+    def __init__(self, server):
+        self.client = server.app.test_client()
+
+    def __call__(self, url, data=None, headers=None, timeout=None):
+        response = self.client.post(
+            '/telemetry',
+            data=data,
+            content_type='application/octet-stream',
+        )
+        return Response(response.status_code,
+                        json.loads(response.get_data()))
+
+
+class Response(object):
+
+    def __init__(self, status_code, body):
+        self.status_code = status_code
+        self.body = body
+        self.text = str(body)
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise requests.HTTPError(self.text)
+
+    def json(self):
+        return self.body
+
+
+class TestReadingSpool(object):
+
+    def setup(self):
+        self.spool = ReadingSpool(':memory:')
+        for co2 in range(5):
+            self.spool.append(*air_reading(co2, 100.0 + co2))
+
+    def co2s(self):
+        return [columns['co2'] for _, _, _, columns in self.spool.peek(10)]
+
+    def test_peek_in_order_and_remove(self):
+        batch = self.spool.peek(2)
+        assert_equal([columns['co2'] for _, _, _, columns in batch], [0, 1])
+        assert all(len(columns['upload_key']) == 32
+                   for _, _, _, columns in batch)
+        self.spool.remove([spool_id for spool_id, _, _, _ in batch])
+        assert_equal(self.co2s(), [2, 3, 4])
+        assert_equal(len(self.spool), 3)
+
+    def test_requeue_moves_to_the_end(self):
+        batch = self.spool.peek(2)
+        self.spool.requeue([spool_id for spool_id, _, _, _ in batch])
+        assert_equal(self.co2s(), [2, 3, 4, 0, 1])
+
+    def test_quarantine(self):
+        spool_id = self.spool.peek(1)[0][0]
+        self.spool.quarantine([spool_id], 'bad')
+        assert_equal(self.co2s(), [1, 2, 3, 4])
+        assert_equal(self.spool.quarantined(), 1)
+
+
+class TestSpoolUploader(object):
+
+    def setup(self):
+        self.database = mission_database()
+        self.record_cache = RecordCache(self.database.scoped_session)
+        self.spool = IdleSpool(':memory:')
+        self._post = requests.post
+
+    def teardown(self):
+        requests.post = self._post
+
+    def uploader(self, scoped_session=None, **settings):
+        uploader = SpoolUploader(
+            scoped_session or self.database.scoped_session,
+            self.record_cache,
+            self.spool,
+            flush_interval=None,
+            **settings
+        )
+        assert self.spool.peeked.wait(5)
+        return uploader
+
+    def put(self, uploader, reading):
+        reading_class, event_type, columns = reading
+        uploader.put(reading_class, event_type, **columns)
+
+    def stored_co2(self):
+        with self.database.scoped_session() as session:
+            return sorted(co2 for co2, in session.query(AirSensorRead.co2))
+
+    def test_uploads_and_empties_the_spool(self):
+        uploader = self.uploader()
+        for co2 in range(3):
+            self.put(uploader, air_reading(co2, 100.0 + co2))
+        assert_equal(uploader.upload_batch(), 3)
+        assert_equal(len(self.spool), 0)
+        assert_equal(self.stored_co2(), [0, 1, 2])
+
+    def test_mission_events_go_through_the_spool(self):
+        uploader = self.uploader()
+        uploader.put(Event, 'mission_event', event_data={'note': 'hi'})
+        uploader.upload_batch()
+        with self.database.scoped_session() as session:
+            event = session.query(Event).one()
+            assert_equal(event.event_data, {'note': 'hi'})
+
+    def test_unknown_records_go_to_the_back(self):
+        uploader = self.uploader()
+        later = ('Alpha', 'later_mission', 'air1')
+        self.put(uploader, air_reading(0, 100.0, names=later))
+        self.put(uploader, air_reading(1, 101.0))
+        assert_equal(uploader.upload_batch(), 1)
+        assert_equal(len(self.spool), 1)
+        assert_equal(self.stored_co2(), [1])
+        self.put(uploader, air_reading(2, 102.0))
+        assert_equal(
+            [columns['co2'] for _, _, _, columns in self.spool.peek(10)],
+            [0, 2],
+        )
+
+    def test_refused_readings_are_quarantined(self):
+        uploader = self.uploader(max_failures=3)
+        for co2 in range(6):
+            reading = air_reading(co2, 100.0 + co2)
+            if co2 == 2:
+                reading[2]['time'] = 'not a time'
+            self.put(uploader, reading)
+        assert_equal(uploader.upload_batch(), 5)
+        assert_equal(self.stored_co2(), [0, 1, 3, 4, 5])
+        assert_equal(len(self.spool), 1)
+        uploader.upload_batch()
+        assert_equal((len(self.spool), uploader.quarantined), (1, 0))
+        uploader.upload_batch()
+        assert_equal((len(self.spool), uploader.quarantined), (0, 1))
+        assert_equal(self.spool.quarantined(), 1)
+
+    def test_database_errors_keep_the_batch(self):
+        def unreachable(name=None):
+            raise OperationalError('INSERT', {}, Exception('unreachable'))
+        uploader = self.uploader(unreachable, max_failures=1)
+        self.put(uploader, air_reading(0, 100.0))
+        assert_raises(OperationalError, uploader.upload_batch)
+        assert_equal((len(self.spool), self.spool.quarantined()), (1, 0))
+
+    def test_ingest_4xx_is_refused_and_5xx_kept(self):
+        uploader = self.uploader(max_failures=1)
+        uploader.ingest_url = 'http://base:5001/telemetry'
+        self.put(uploader, air_reading(0, 100.0))
+        requests.post = FakeIngest(lambda data: Response(500, {}))
+        assert_raises(requests.HTTPError, uploader.upload_batch)
+        assert_equal(len(self.spool), 1)
+        requests.post = FakeIngest(lambda data: Response(422, {'error': 'x'}))
+        uploader.upload_batch()
+        assert_equal((len(self.spool), self.spool.quarantined()), (0, 1))
+
+    def test_ingest_rejections_go_to_the_back(self):
+        uploader = self.uploader()
+        uploader.ingest_url = 'http://base:5001/telemetry'
+        for co2 in range(3):
+            self.put(uploader, air_reading(co2, 100.0 + co2))
+        requests.post = FakeIngest(lambda data: Response(200, {
+            'written': 2,
+            'skipped': 0,
+            'rejected': [[0, 'unknown record']],
+        }))
+        assert_equal(uploader.upload_batch(), 2)
+        assert_equal(
+            [columns['co2'] for _, _, _, columns in self.spool.peek(10)],
+            [0],
+        )
+        assert_equal(uploader.uploaded, 2)
+
+    def test_the_ingest_servers_rejections_are_the_readings_requeued(self):
+        uploader = self.uploader()
+        uploader.ingest_url = 'http://base:5001/telemetry'
+        requests.post = TestClientIngest(ingest_server(self.database))
+        # the kinds are mixed, so the batch is regrouped when it's encoded
+        unknown = ('Alpha', MISSION, 'no_such_sensor')
+        self.put(uploader, gps_reading(1.0, 2.0, 100.0))
+        self.put(uploader, air_reading(400, 100.5, names=unknown))
+        self.put(uploader, gps_reading(1.5, 2.5, 101.0))
+        self.put(uploader, air_reading(401, 101.5))
+        assert_equal(uploader.upload_batch(), 3)
+        assert_equal(
+            [columns.get('co2') for _, _, _, columns in self.spool.peek(10)],
+            [400],
+        )
+        assert_equal(self.stored_co2(), [401])
+        with self.database.scoped_session() as session:
+            assert_equal(session.query(GPSSensorRead).count(), 2)
+
+    def test_connection_errors_keep_the_batch(self):
+        def down(url, **kwargs):
+            raise requests.ConnectionError('no route to host')
+        uploader = self.uploader(max_failures=1)
+        uploader.ingest_url = 'http://base:5001/telemetry'
+        self.put(uploader, air_reading(0, 100.0))
+        requests.post = down
+        assert_raises(requests.ConnectionError, uploader.upload_batch)
+        assert_equal((len(self.spool), self.spool.quarantined()), (1, 0))
@@ -0,0 +1,128 @@
+"""Tests for RecordCache in record_cache.py."""
+from nose.tools import assert_equal, assert_raises
+from models import *
+from record_cache import RecordCache
+from fixtures import mission_database, mds_id, MISSION
+
+
+class CountingCache(RecordCache):
+    """A RecordCache that counts its loads."""
+
+    loads = 0
+
+    def load(self):
+        self.loads += 1
+        super(CountingCache, self).load()
+
+
+class TestRecordCache(object):
+
+    def setup(self):
+        self.database = mission_database()
+        self.cache = CountingCache(
+            self.database.scoped_session,
+            check_interval=0,
+            miss_interval=0,
+        )
+
+    def rename(self, model, old_name, new_name):
+        with self.database.scoped_session() as session:
+            session.query(model).filter(
+                model.name == old_name,
+            ).one().name = new_name
+
+    def test_lookups(self):
+        mds = mds_id(self.database, 'Beta', 'RF2')
+        assert_equal(
+            self.cache.mission_drone_sensor_id('Beta', MISSION, 'RF2'),
+            mds,
+        )
+        with self.database.scoped_session() as session:
+            mission_id = session.query(Mission.id).scalar()
+            drone_id = session.query(Drone.id).filter(
+                Drone.name == 'Beta',
+            ).scalar()
+            event_type_id = session.query(EventType.id).filter(
+                EventType.event_type == 'auto_nav',
+            ).scalar()
+        assert_equal(self.cache.mission_drone_ids(mds), (mission_id, drone_id))
+        assert_equal(self.cache.event_type_id('auto_nav'), event_type_id)
+
+    def test_unknown_records_raise_key_error(self):
+        assert_raises(
+            KeyError,
+            self.cache.mission_drone_sensor_id,
+            'Gamma',
+            MISSION,
+            'air1',
+        )
+        assert_raises(KeyError, self.cache.event_type_id, 'nope')
+        assert_raises(KeyError, self.cache.mission_drone_ids, 12345)
+
+    def test_nothing_is_loaded_until_its_needed(self):
+        assert_equal(self.cache.loads, 0)
+        self.cache.event_type_id('auto_nav')
+        assert_equal(self.cache.loads, 1)
+
+    def test_misses_reload_at_most_once_per_miss_interval(self):
+        self.cache.load()
+        self.cache.miss_interval = 3600
+        loads = self.cache.loads
+        for _ in range(3):
+            assert_raises(KeyError, self.cache.event_type_id, 'nope')
+        assert_equal(self.cache.loads, loads)
+        self.cache.miss_interval = 0
+        assert_raises(KeyError, self.cache.event_type_id, 'nope')
+        assert_equal(self.cache.loads, loads + 1)
+
+    def test_a_miss_finds_records_added_later(self):
+        with self.database.scoped_session() as session:
+            session.add(EventType(event_type='late'))
+        assert self.cache.event_type_id('late')
+
+    def test_unchanged_tables_are_not_reloaded(self):
+        self.cache.load()
+        loads = self.cache.loads
+        assert not self.cache.refresh_if_stale()
+        assert_equal(self.cache.loads, loads)
+
+    def check_rename_is_noticed(self, model, old_name, new_name, names):
+        self.cache.load()
+        self.rename(model, old_name, new_name)
+        assert self.cache.refresh_if_stale()
+        self.cache.miss_interval = 3600
+        assert self.cache.mission_drone_sensor_id(*names)
+
+    def test_renames_are_noticed(self):
+        yield (
+            self.check_rename_is_noticed,
+            Drone, 'Alpha', 'Gamma', ('Gamma', MISSION, 'air1'),
+        )
+        yield (
+            self.check_rename_is_noticed,
+            Mission, MISSION, 'renamed', ('Alpha', 'renamed', 'air1'),
+        )
+        yield (
+            self.check_rename_is_noticed,
+            Sensor, 'air1', 'air9', ('Alpha', MISSION, 'air9'),
+        )
+
+    def test_moved_sensors_are_noticed(self):
+        with self.database.scoped_session() as session:
+            mds = session.query(MissionDroneSensor).get(
+                mds_id(self.database, 'Alpha', 'air1')
+            )
+            beta = session.query(MissionDrone).join(Drone).filter(
+                Drone.name == 'Beta',
+            ).one()
+            self.cache.load()
+            mds.mission_drone = beta
+        assert self.cache.refresh_if_stale()
+        self.cache.miss_interval = 3600
+        assert self.cache.mission_drone_sensor_id('Beta', MISSION, 'air1')
+
+    def test_checks_are_rate_limited(self):
+        self.cache.check_interval = 3600
+        self.cache.load()
+        self.rename(Drone, 'Alpha', 'Gamma')
+        assert not self.cache.refresh_if_stale()
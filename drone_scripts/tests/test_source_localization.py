@@ -0,0 +1,95 @@
+"""Tests for GradientTracker and SourceSearch in source_localization.py."""
+import numpy as np
+from nose.tools import assert_equal, assert_true
+from numpy.testing import assert_allclose
+from data_cleaning import READING_DTYPE
+from nav_utils import ned_to_global
+from source_localization import GradientTracker
+
+
+HOME = (32.990, -117.128)
+
+
+def readings_at(north, east, field):
+    """Return readings of field(north, east) at the given points."""
+    north = np.atleast_1d(np.asarray(north, dtype=float))
+    east = np.atleast_1d(np.asarray(east, dtype=float))
+    readings = np.zeros(len(north), dtype=READING_DTYPE)
+    readings['lat'], readings['lon'] = ned_to_global(
+        HOME[0],
+        HOME[1],
+        north,
+        east,
+    )
+    readings['value'] = field(north, east)
+    return readings
+
+def grid(center_north, center_east, half_width, count):
+    """Return the (north, east) points of a square grid around a center."""
+    offsets = np.linspace(-half_width, half_width, count)
+    north, east = np.meshgrid(center_north + offsets, center_east + offsets)
+    return north.ravel(), east.ravel()
+
+def plane(north, east):
+    return 400 + 3.0 * north - 2.0 * east
+
+def cone(north, east, source=(20.0, -12.0)):
+    """A plume peaking at source and falling off linearly."""
+    return 1000 - 10 * np.hypot(north - source[0], east - source[1])
+
+
+def make_tracker(field=plane, **settings):
+    tracker = GradientTracker(**settings)
+    # the first reading sets the home, put it exactly on HOME
+    tracker.add(readings_at(0, 0, field))
+    return tracker
+
+
+def test_fit_recovers_a_plane():
+    tracker = make_tracker()
+    tracker.add(readings_at(*grid(0, 0, 5, 5), field=plane))
+    value, gradient, noise, count = tracker.fit(0, 0)
+    assert_allclose(value, 400, atol=1e-3)
+    assert_allclose(gradient, [3.0, -2.0], atol=1e-4)
+    assert_true(noise < 1e-3)
+    assert_equal(count, 26)
+
+
+def test_fit_needs_enough_readings_off_one_line():
+    tracker = make_tracker(min_readings=6)
+    tracker.add(readings_at([1, 2, 3], [0, 0, 0], plane))
+    assert_equal(tracker.fit(0, 0), None)
+    # all on one sweep line: nothing to say about the gradient across it
+    tracker.add(readings_at([4, 5, 6, 7], [0, 0, 0, 0], plane))
+    assert_equal(tracker.fit(0, 0), None)
+
+
+def test_widening_fit_reaches_readings_further_out():
+    tracker = make_tracker(window_radius=4.0)
+    tracker.add(readings_at(*grid(12, 0, 3, 3), field=plane))
+    assert_equal(tracker.fit(0, 0), None)
+    fit, window_radius = tracker.widening_fit(0, 0)
+    assert_equal(window_radius, 16.0)
+    assert_allclose(fit[1], [3.0, -2.0], atol=1e-4)
+
+
+def test_only_the_latest_readings_are_kept():
+    tracker = make_tracker(max_readings=10)
+    tracker.add(readings_at(np.arange(25.0), np.zeros(25), plane))
+    assert_equal(len(tracker), 10)
+
+
+def test_search_climbs_to_the_source():
+    tracker = make_tracker(cone, window_radius=6.0)
+    tracker.add(readings_at(*grid(0, 0, 6, 7), field=cone))
+    search = tracker.search(HOME[0], HOME[1], step=4.0, min_step=0.5,
+                            max_probes=40)
+    waypoint = search.next_waypoint()
+    while waypoint is not None:
+        # fly a probe: readings taken around the waypoint
+        north, east = tracker.to_ned(*waypoint)
+        tracker.add(readings_at(*grid(north, east, 2, 3), field=cone))
+        waypoint = search.next_waypoint()
+    assert_true(search.converged)
+    north, east = tracker.to_ned(*search.estimate())
+    assert_true(np.hypot(north - 20.0, east + 12.0) < 3.0)
@@ -0,0 +1,165 @@
+"""Tests for encoding and decoding batches in telemetry_format.py."""
+import json
+from nose.tools import assert_equal, assert_almost_equal, assert_raises
+from models import AirSensorRead, RFSensorRead, GPSSensorRead, Event
+from telemetry_format import (
+    encode_batch,
+    decode_batch,
+    HEADER,
+    ORDER,
+    ORDER_HEADER,
+)
+
+
+def air(co2, time, upload_key=None):
+    air_data = {'co2': {'CO2': co2, 'temperature': 21.5}}
+    columns = dict(
+        AirSensorRead.typed_columns(air_data),
+        air_data=air_data,
+        mission_drone_sensor_id=3,
+        time=time,
+    )
+    if upload_key:
+        columns['upload_key'] = upload_key
+    return (AirSensorRead, 'air_sensor_data', columns)
+
+def rf(signal, time):
+    RF_data = {
+        'SSID': 'drone_net',
+        'Signal': signal,
+        'Quality': '70/70',
+        'Noise': None,
+        'BitRate': 54.0,
+    }
+    columns = dict(
+        RFSensorRead.typed_columns(RF_data),
+        RF_data=RF_data,
+        mission_drone_sensor_id=4,
+        time=time,
+    )
+    return (RFSensorRead, 'RF_sensor_data', columns)
+
+def gps(lat, lon, time):
+    return (GPSSensorRead, 'auto_nav', {
+        'mission_drone_sensor_id': 5,
+        'time': time,
+        'latitude': lat,
+        'longitude': lon,
+        'altitude': 30.0,
+        'relative': json.dumps({'relative': [1.5, -2.25]}),
+    })
+
+def batch():
+    return [
+        air(412.0, 1500000000.25, upload_key='0123456789abcdef' * 2),
+        rf(-41.0, 1500000000.5),
+        gps(37.8712345, -122.2612345, 1500000001.0),
+        air(None, 1500000002.0),
+        gps(37.8712999, -122.2612001, 1500000002.0),
+    ]
+
+def flags(data):
+    return HEADER.unpack_from(data, 0)[2]
+
+
+def check_round_trip(delta, compress):
+    # the kinds are mixed up, and come back in the order they were sent
+    encoded = batch()
+    decoded = decode_batch(
+        encode_batch(encoded, delta=delta, compress=compress)
+    )
+    assert_equal(len(decoded), len(encoded))
+    for (cls, event_type, columns), (want_cls, want_type, want) in zip(
+            decoded, encoded):
+        assert cls is want_cls
+        assert_equal(event_type, want_type)
+        assert_equal(set(columns), set(want))
+        for name, value in want.iteritems():
+            if isinstance(value, float):
+                assert_almost_equal(columns[name], value, places=3)
+            elif name == 'relative':
+                assert_equal(json.loads(columns[name]), json.loads(value))
+            else:
+                assert_equal(columns[name], value)
+
+def test_round_trips():
+    for delta in (True, False):
+        for compress in (True, False):
+            yield check_round_trip, delta, compress
+
+def test_order_is_only_sent_when_the_kinds_are_mixed_up():
+    assert flags(encode_batch(batch())) & ORDER
+    grouped = [air(400.0, 1.0), air(401.0, 2.0), rf(-40.0, 3.0)]
+    data = encode_batch(grouped)
+    assert not flags(data) & ORDER
+    assert_equal(
+        [columns['time'] for _, _, columns in decode_batch(data)],
+        [1.0, 2.0, 3.0],
+    )
+
+def test_rejects_a_bad_order():
+    data = encode_batch([rf(-40.0, 1.0), air(400.0, 2.0)])
+    # the order section follows the header, make both rows go first
+    start = HEADER.size + ORDER_HEADER.size
+    bad = data[:start] + '\0\0\0\0' * 2 + data[start + 8:]
+    assert_raises(ValueError, decode_batch, bad)
+
+def test_raw_data_comes_back_as_sent():
+    decoded = decode_batch(encode_batch(batch()))
+    assert_equal(decoded[1][2]['RF_data']['SSID'], 'drone_net')
+    assert_equal(decoded[0][2]['air_data']['co2']['temperature'], 21.5)
+
+def test_missing_raw_data_is_none():
+    reading = air(400.0, 1500000000.0)
+    del reading[2]['air_data']
+    decoded = decode_batch(encode_batch([reading]))
+    assert_equal(decoded[0][2]['air_data'], None)
+
+def test_compression_shrinks_repeated_raw_data():
+    readings = [rf(-40.0 - i, 1500000000.0 + i) for i in range(200)]
+    compressed = encode_batch(readings)
+    assert len(compressed) < len(encode_batch(readings, compress=False)) / 2
+
+def test_rejects_bad_batches():
+    data = encode_batch(batch())
+    assert_raises(ValueError, decode_batch, '')
+    assert_raises(ValueError, decode_batch, 'XXXX' + data[4:])
+    assert_raises(ValueError, decode_batch, data[:4] + '\x01' + data[5:])
+    assert_raises(ValueError, decode_batch, data[:5] + '\x80' + data[6:])
+    for cut in (10, len(data) // 2, len(data) - 1):
+        assert_raises(ValueError, decode_batch, data[:cut])
+
+def test_sensor_names_round_trip():
+    names = ['Alpha', 'test_mission', 'air1']
+    named = air(400.0, 1500000000.0)
+    del named[2]['mission_drone_sensor_id']
+    named[2]['mission_drone_sensor'] = names
+    other = rf(-40.0, 1500000001.0)
+    del other[2]['mission_drone_sensor_id']
+    other[2]['mission_drone_sensor'] = ('Alpha', 'test_mission', 'RF1')
+    again = (named[0], named[1], dict(named[2], time=1500000003.0))
+    decoded = decode_batch(encode_batch(
+        [named, other, air(401.0, 1500000002.0), again]
+    ))
+    assert_equal(decoded[0][2]['mission_drone_sensor'], names)
+    assert 'mission_drone_sensor_id' not in decoded[0][2]
+    assert_equal(
+        decoded[1][2]['mission_drone_sensor'],
+        ['Alpha', 'test_mission', 'RF1'],
+    )
+    assert_equal(decoded[2][2]['mission_drone_sensor_id'], 3)
+    assert_equal(decoded[3][2]['mission_drone_sensor'], names)
+
+def test_mission_events_round_trip():
+    event_data = {'event': 'waypoint', 'lat': 37.87}
+    event = (Event, 'mission_event', {
+        'event_data': event_data,
+        'upload_key': 'f' * 32,
+    })
+    for delta in (True, False):
+        decoded = decode_batch(encode_batch([event, air(400.0, 1.0)], delta))
+        events = [reading for reading in decoded if reading[0] is Event]
+        assert_equal(events, [(Event, 'mission_event', {
+            'event_data': event_data,
+            'upload_key': 'f' * 32,
+        })])
@@ -0,0 +1,61 @@
+"""Tests for nearest_time_indices in time_join.py."""
+import numpy as np
+from nose.tools import assert_equal
+from time_join import nearest_time_indices
+
+
+def brute_force(times, reference_times, tolerance):
+    """Compare every pair, the slow way nearest_time_indices replaces."""
+    nearest = []
+    for time in times:
+        best = -1
+        for index, reference in enumerate(reference_times):
+            distance = abs(reference - time)
+            if distance <= tolerance and (
+                    best < 0 or distance < abs(reference_times[best] - time)):
+                best = index
+        nearest.append(best)
+    return nearest
+
+def test_picks_the_closer_neighbour():
+    reference = [0.0, 1.0, 2.0, 10.0]
+    times = [0.4, 0.6, 1.5, 9.0, -0.5, 12.0]
+    assert_equal(
+        list(nearest_time_indices(times, reference, 1.5)),
+        [0, 1, 1, 3, 0, -1],
+    )
+
+def test_ties_go_to_the_earlier_reference():
+    assert_equal(list(nearest_time_indices([1.5], [1.0, 2.0], 1.0)), [0])
+
+def test_no_references():
+    assert_equal(list(nearest_time_indices([1.0, 2.0], [], 1.0)), [-1, -1])
+
+def test_matches_brute_force():
+    random = np.random.RandomState(7)
+    reference = np.sort(random.uniform(0, 100, 200))
+    times = random.uniform(-5, 105, 500)
+    assert_equal(
+        list(nearest_time_indices(times, reference, 0.3)),
+        brute_force(times, reference, 0.3),
+    )
+
+def test_matches_across_a_second_boundary():
+    # the old cast(time, Integer) join only matched within the same second
+    assert_equal(
+        list(nearest_time_indices([9.95, 10.05], [9.9, 10.1], 0.2)),
+        [0, 1],
+    )
+
+def test_tolerance_is_inclusive():
+    assert_equal(
+        list(nearest_time_indices([1.5, 1.75, 2.0], [1.0], 0.75)),
+        [0, 0, -1],
+    )
+
+def test_exact_and_single_references():
+    assert_equal(list(nearest_time_indices([2.0], [1.0, 2.0, 3.0], 0)), [1])
+    assert_equal(
+        list(nearest_time_indices([-10.0, 5.0, 20.0], [5.0], 100)),
+        [0, 0, 0],
+    )
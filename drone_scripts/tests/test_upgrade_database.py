@@ -0,0 +1,114 @@
+"""Tests for upgrade_database.py, on a SQLite copy of an old schema."""
+from datetime import datetime
+from nose.tools import assert_equal, assert_raises
+from sqlalchemy import create_engine, inspect, MetaData, Table
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.pool import StaticPool
+from models import *
+from upgrade_database import upgrade
+
+# columns added since the first version of the schema
+NEW_COLUMNS = {
+    'sensor_reads': ['mission_id', 'drone_id', 'upload_key'],
+    'events': ['upload_key'],
+    'air_sensor_reads': ['co2'],
+    'RF_sensor_reads': ['signal', 'quality', 'noise', 'bit_rate'],
+}
+
+
+def old_schema():
+    """Return the models' tables without NEW_COLUMNS or any indexes."""
+    metadata = MetaData()
+    for table in Base.metadata.sorted_tables:
+        new = NEW_COLUMNS.get(table.name, [])
+        Table(table.name, metadata, *[
+            column.copy(index=None, unique=None)
+            for column in table.columns
+            if column.name not in new
+        ])
+    return metadata
+
+
+class TestUpgrade(object):
+
+    def setup(self):
+        self.engine = create_engine(
+            'sqlite://',
+            connect_args={'check_same_thread': False},
+            poolclass=StaticPool,
+        )
+        old_schema().create_all(self.engine)
+        insert = lambda table, **row: self.engine.execute(
+            Base.metadata.tables[table].insert(), row
+        )
+        insert('missions', id=1, name='m', date=datetime.now(), location='x')
+        insert('drones', id=2, name='Alpha', FAA_ID='x')
+        insert('sensors', id=3, name='air1')
+        insert('mission_drones', id=4, mission_id=1, drone_id=2)
+        insert('mission_drone_sensors', id=5, mission_drone_id=4,
+               sensor_id=3)
+        insert('event_types', id=6, event_type='air_sensor_data')
+        insert('events', id=7, event_type_id=6, event_data={})
+        insert('sensor_reads', id=8, mission_drone_sensor_id=5, event_id=7,
+               time=100.0, data_type='air_sensor')
+        insert('air_sensor_reads', id=8, air_data={'co2': {'CO2': 412}})
+
+    def columns(self, table):
+        return set(
+            column['name']
+            for column in inspect(self.engine).get_columns(table)
+        )
+
+    def test_adds_the_new_columns_and_indexes(self):
+        added = upgrade(self.engine)
+        for table, columns in NEW_COLUMNS.items():
+            assert set(columns) <= self.columns(table), table
+            for column in columns:
+                assert '{0}.{1}'.format(table, column) in added
+        indexes = set(
+            index['name']
+            for index in inspect(self.engine).get_indexes('sensor_reads')
+        )
+        assert 'ix_sensor_reads_mission_drone_time' in indexes
+        assert 'uq_sensor_reads_upload_key' in indexes
+
+    def test_backfills_old_rows(self):
+        upgrade(self.engine)
+        row = self.engine.execute(
+            'SELECT mission_id, drone_id, co2 FROM sensor_reads '
+            'JOIN air_sensor_reads USING (id)'
+        ).fetchone()
+        assert_equal(tuple(row), (1, 2, 412.0))
+
+    def test_backfills_event_upload_keys(self):
+        upgrade(self.engine)
+        self.engine.execute(
+            "UPDATE sensor_reads SET upload_key = 'k' WHERE id = 8"
+        )
+        upgrade(self.engine)
+        assert_equal(
+            self.engine.execute(
+                'SELECT upload_key FROM events WHERE id = 7'
+            ).scalar(),
+            'k',
+        )
+
+    def test_running_it_again_does_nothing(self):
+        upgrade(self.engine)
+        assert_equal(upgrade(self.engine), [])
+
+    def test_upload_keys_are_unique_after(self):
+        upgrade(self.engine)
+        self.engine.execute(
+            "UPDATE sensor_reads SET upload_key = 'k' WHERE id = 8"
+        )
+        assert_raises(
+            IntegrityError,
+            self.engine.execute,
+            "INSERT INTO sensor_reads (id, upload_key) VALUES (9, 'k')",
+        )
+
+    def test_a_new_database_needs_nothing(self):
+        engine = create_engine('sqlite://')
+        Base.metadata.create_all(engine)
+        assert_equal(upgrade(engine), [])
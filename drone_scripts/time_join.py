@@ -0,0 +1,35 @@
+"""Provide functions for matching up readings that were taken at similar times.
+
+Air and RF readings don't have a location of their own, they get one by being
+matched with the GPS reading the same drone took closest in time. The
+readings come from different threads on the drone, so their timestamps never
+line up exactly; this does the matching on sorted arrays of timestamps with
+numpy instead of comparing every pair.
+"""
+import numpy as np
+
+
+def nearest_time_indices(times, reference_times, tolerance):
+    """Return the index of the nearest reference time for each of times.
+
+    times -- timestamps to find matches for, in any order.
+    reference_times -- timestamps to match against, sorted ascending.
+    tolerance -- largest allowed difference in seconds between a timestamp
+                 and its match. Timestamps with nothing this close get -1.
+
+    This is a binary search per timestamp (numpy's searchsorted) followed by
+    picking the closer of the two neighbours, so it's O(n log m) rather than
+    the O(n * m) of comparing every pair. Ties go to the earlier reference.
+    """
+    times = np.asarray(times, dtype=float)
+    reference_times = np.asarray(reference_times, dtype=float)
+    if reference_times.size == 0:
+        return np.full(times.shape, -1, dtype=int)
+    last = reference_times.size - 1
+    right = np.clip(np.searchsorted(reference_times, times), 0, last)
+    left = np.clip(right - 1, 0, last)
+    left_closer = (np.abs(times - reference_times[left]) <=
+                   np.abs(reference_times[right] - times))
+    nearest = np.where(left_closer, left, right)
+    nearest[np.abs(reference_times[nearest] - times) > tolerance] = -1
+    return nearest
@@ -0,0 +1,173 @@
+"""Bring an existing mission database up to date with the schema in models.py.
+
+This script should be run once on a database that was set up before a change
+to the schema, after that it won't do anything, so it's safe to run again (or
+just to run every time, along with pre_mission.py). It:
+   *Creates any tables that don't exist yet
+   *Adds the columns the models have and the tables don't, like mission_id,
+    drone_id and upload_key on sensor_reads, upload_key on events, and the
+    typed columns (co2, signal, quality, noise, bit_rate) of the readings
+   *Creates the indexes the models have and the tables don't
+   *Fills in the new columns on what was logged before they existed (see the
+    backfill functions in models.py)
+
+Running models.py only creates missing tables, it can't change tables that
+are already there, so without this the new code can't write to an old
+database.
+Columns are added as nullable whatever the model says, since the rows that
+are already there don't have a value for them until the backfill. Their
+foreign keys are only added on databases that can add them to a table that
+exists (so MySQL, but not SQLite).
+
+The script should be run on the command line as:
+
+python upgrade_database.py [--db_url URL]
+"""
+import argparse
+from sqlalchemy import inspect
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.schema import CreateColumn
+from models import *
+from database import create_db_engine
+
+
+def missing_columns(engine):
+    """Return [(table, column)] of model columns the database doesn't have."""
+    inspector = inspect(engine)
+    tables = set(inspector.get_table_names())
+    missing = []
+    for table in Base.metadata.sorted_tables:
+        if table.name not in tables:
+            continue
+        existing = set(
+            column['name'] for column in inspector.get_columns(table.name)
+        )
+        missing.extend(
+            (table, column)
+            for column in table.columns
+            if column.name not in existing
+        )
+    return missing
+
+def add_column(connection, table, column):
+    """Add a model's column to its table, see the module docstring."""
+    preparer = connection.dialect.identifier_preparer
+    definition = CreateColumn(column).compile(dialect=connection.dialect)
+    sql = 'ALTER TABLE {0} ADD COLUMN {1}'.format(
+        preparer.format_table(table),
+        str(definition).replace(' NOT NULL', ''),
+    )
+    if connection.dialect.name == 'mysql':
+        for foreign_key in column.foreign_keys:
+            sql += ', ADD FOREIGN KEY ({0}) REFERENCES {1} ({2})'.format(
+                preparer.format_column(column),
+                preparer.format_table(foreign_key.column.table),
+                preparer.format_column(foreign_key.column),
+            )
+    connection.execute(sql)
+
+def model_indexes(table):
+    """Return [(name, column names, unique)] of the indexes table should have.
+
+    A unique column gets a unique index, which is how a unique constraint
+    can be added to a table that already exists.
+    """
+    indexes = [
+        (
+            index.name,
+            tuple(column.name for column in index.columns),
+            bool(index.unique),
+        )
+        for index in table.indexes
+    ]
+    indexes.extend(
+        ('uq_{0}_{1}'.format(table.name, column.name), (column.name,), True)
+        for column in table.columns
+        if column.unique
+    )
+    return sorted(indexes)
+
+def missing_indexes(engine):
+    """Return [(table, name, column names, unique)] the database lacks."""
+    inspector = inspect(engine)
+    missing = []
+    for table in Base.metadata.sorted_tables:
+        existing = inspector.get_indexes(table.name)
+        names = set(index['name'] for index in existing)
+        # the columns of every unique index, so a unique column that got its
+        # index from create_all (under some other name) isn't indexed again
+        unique = set(
+            tuple(index['column_names'])
+            for index in existing
+            if index['unique']
+        )
+        unique.update(
+            tuple(constraint['column_names'])
+            for constraint in inspector.get_unique_constraints(table.name)
+        )
+        for name, columns, is_unique in model_indexes(table):
+            if name in names or (is_unique and columns in unique):
+                continue
+            missing.append((table, name, columns, is_unique))
+    return missing
+
+def add_index(connection, table, name, columns, unique):
+    """Create an index on table."""
+    preparer = connection.dialect.identifier_preparer
+    connection.execute('CREATE {0}INDEX {1} ON {2} ({3})'.format(
+        'UNIQUE ' if unique else '',
+        preparer.quote(name),
+        preparer.format_table(table),
+        ', '.join(preparer.quote(column) for column in columns),
+    ))
+
+def backfill(engine):
+    """Fill in the new columns on rows from before they existed."""
+    session = sessionmaker(bind=engine)()
+    try:
+        backfill_mission_drone_ids(session)
+        backfill_typed_columns(session)
+        backfill_event_upload_keys(session)
+        session.commit()
+    except:
+        session.rollback()
+        raise
+    finally:
+        session.close()
+
+def upgrade(engine):
+    """Upgrade the database engine connects to, see the module docstring.
+
+    Returns the names of the columns and indexes that were added.
+    """
+    Base.metadata.create_all(engine)
+    added = []
+    columns = missing_columns(engine)
+    with engine.begin() as connection:
+        for table, column in columns:
+            add_column(connection, table, column)
+            added.append('{0}.{1}'.format(table.name, column.name))
+    indexes = missing_indexes(engine)
+    with engine.begin() as connection:
+        for table, name, index_columns, unique in indexes:
+            add_index(connection, table, name, index_columns, unique)
+            added.append(name)
+    backfill(engine)
+    return added
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+                '-d',
+                '--db_url',
+                help=('sqlalchemy URL of the database to upgrade, by default '
+                      'the configured one (see database.py)'),
+                )
+    args = parser.parse_args()
+    added = upgrade(create_db_engine(args.db_url))
+    if added:
+        print "Added {0}".format(', '.join(added))
+    else:
+        print "Nothing to add, the database was already up to date"
+    print "Backfilled readings and events from before the upgrade"